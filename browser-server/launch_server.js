@@ -0,0 +1,21 @@
+// Launches one headless Chromium and serves it over a websocket for the whole life of the container.
+// Every scraper run connects to the same browser with chromium.connect, its contexts are closed when it
+// disconnects while the browser keeps running, unlike `playwright run-server` which launches a browser per client.
+const { chromium } = require('playwright-core');
+
+(async () => {
+  const server = await chromium.launchServer({
+    headless: true,
+    host: '0.0.0.0',
+    port: Number(process.env.BROWSER_SERVER_PORT || 3000),
+    wsPath: '/',
+  });
+  console.log(`Browser server listening on ${server.wsEndpoint()}`);
+
+  const shutdown = async () => {
+    await server.close();
+    process.exit(0);
+  };
+  process.on('SIGINT', shutdown);
+  process.on('SIGTERM', shutdown);
+})();
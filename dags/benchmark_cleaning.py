@@ -0,0 +1,106 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator
+
+from transform import clean_product_records, clean_product_table, iter_table_records, read_products_table
+from utils import NdjsonWriter, iter_ndjson
+
+
+SPEEDS = ['100mbps', '500mbps', '1gbps', '1Gbps', '2gbps', 'up to 1gbps', None]
+DATA = [5.0, 10.0, 50.0, 100.0, -1.0]
+
+
+def generate_raw_products(n_products: int, seed: int = 0) -> Iterator[Dict[str, Any]]:
+    """Generates a synthetic raw products history, one product per scraping day and offer.
+
+    Args:
+        n_products: The number of product records to generate.
+        seed: The seed of the random generator, so every run cleans the same history.
+
+    Yields:
+        dict: The raw product records, with speeds and quantities in every format found in the raw dumps.
+    """
+    rng = random.Random(seed)
+    for i in range(n_products):
+        yield {
+            'product_name': f'internet_subscription_{i % 500}',
+            'competitor_name': 'benchmark',
+            'product_category': 'internet_subscription',
+            'product_url': f'https://example.com/{i % 500}',
+            'price': float(20 + i % 50),
+            'scraped_at': f'2023-{1 + (i // 500) % 12:02d}-{1 + (i // 6000) % 28:02d}',
+            'data': rng.choice(DATA),
+            'minutes': 'unlimited' if i % 3 else '100',
+            'sms': 'unlimited' if i % 4 else '500',
+            'upload_speed': rng.choice(SPEEDS),
+            'download_speed': rng.choice(SPEEDS),
+        }
+
+
+def clean_rows(raw_path: Path, cleaned_path: Path) -> int:
+    """Cleans a raw file with the 'rows' engine and returns the number of records written."""
+    with NdjsonWriter(cleaned_path) as writer:
+        return writer.write_all(clean_product_records(iter_ndjson(raw_path)))
+
+
+def clean_columnar(raw_path: Path, cleaned_path: Path) -> int:
+    """Cleans a raw file with the 'columnar' engine and returns the number of records written."""
+    with NdjsonWriter(cleaned_path) as writer:
+        return writer.write_all(iter_table_records(clean_product_table(read_products_table(raw_path))))
+
+
+def time_columnar_stages(raw_path: Path) -> Dict[str, float]:
+    """Times the read and clean stages of the 'columnar' engine, without converting the table back to records."""
+    start_time_seconds = time.perf_counter()
+    table = read_products_table(raw_path)
+    read_time = time.perf_counter() - start_time_seconds
+
+    start_time_seconds = time.perf_counter()
+    clean_product_table(table)
+    clean_time = time.perf_counter() - start_time_seconds
+
+    return {'read': read_time, 'clean': clean_time}
+
+
+def run_benchmark(n_products: int) -> None:
+    """Times both cleaning engines on a synthetic raw products file and checks they write the same records.
+
+    The benchmark runs in a temporary directory, so the files in data/ are left untouched.
+
+    Args:
+        n_products: The number of product records of the raw file.
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        raw_path = Path(work_dir, 'raw_products.ndjson')
+        with NdjsonWriter(raw_path) as writer:
+            writer.write_all(generate_raw_products(n_products))
+        print(f"Raw file: {n_products} records | {os.path.getsize(raw_path) / 2 ** 20:.1f} MiB")
+
+        cleaned_paths = {}
+        for engine, clean in [('rows', clean_rows), ('columnar', clean_columnar)]:
+            cleaned_paths[engine] = Path(work_dir, f'cleaned_{engine}.ndjson')
+            start_time_seconds = time.perf_counter()
+            count = clean(raw_path, cleaned_paths[engine])
+            elapsed = time.perf_counter() - start_time_seconds
+            print(f"{engine:<9} end to end: {elapsed:.3f}s | {count / elapsed:,.0f} records/s")
+
+        stages = time_columnar_stages(raw_path)
+        print(f"columnar  read: {stages['read']:.3f}s | clean: {stages['clean']:.3f}s | {n_products / stages['clean']:,.0f} records/s")
+
+        mismatches = sum(
+            rows_record != columnar_record
+            for rows_record, columnar_record in zip(iter_ndjson(cleaned_paths['rows']), iter_ndjson(cleaned_paths['columnar']))
+        )
+        print(f"Records differing between the engines: {mismatches}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the row and columnar cleaning engines on a synthetic raw products history.')
+    parser.add_argument('--products', type=int, default=2000000, help='Number of product records of the raw file.')
+    args = parser.parse_args()
+
+    run_benchmark(args.products)
@@ -0,0 +1,177 @@
+import argparse
+import json
+import logging
+import statistics
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import scarlet_scraper
+from viking_class_scraper import Scraper
+from content_state import refresh_scraped_at
+from fixtures import FIXTURES_DIR, load_fixtures
+from page_snapshot import PARSERS, parse_html
+from utils import read_config_from_json
+
+
+# Scraping date the results are compared with, the extractors stamp their records with the day of the run
+BASELINE_SCRAPED_AT = '1970-01-01'
+
+
+def get_extractors(config: Dict[str, Any]) -> Dict[Tuple[str, str], Callable[[Any, str], Any]]:
+    """Returns the extractors taking a parse tree and url, keyed by competitor and extractor name."""
+    # The extractors log to the root logger, the scraper log file of the DAG runs is left untouched
+    scraper_object = Scraper(None, config['mobileviking'], logger=logging.getLogger())
+    return {
+        ('scarlet', 'mobile_subscription'): scarlet_scraper.extract_mobile_subscription_data,
+        ('scarlet', 'options'): scarlet_scraper.extract_options_data,
+        ('scarlet', 'internet_subscription'): scarlet_scraper.extract_internet_subscription_data,
+        ('scarlet', 'options_streaming'): scarlet_scraper.extract_options_streaming,
+        ('scarlet', 'options_tv'): scarlet_scraper.extract_options_tv,
+        ('scarlet', 'trio_pack'): scarlet_scraper.extract_trio_pack,
+        ('mobileviking', 'mobile_prepaid'): scraper_object._extract_prepaid_selector_data,
+        ('mobileviking', 'mobile_subscription'): scraper_object._extract_subscription_data,
+        ('mobileviking', 'internet_subscription'): scraper_object._extract_internet_table_data,
+    }
+
+
+def replay(fixture: Dict[str, Any], extract: Callable[[Any, str], Any], parser: str) -> Any:
+    """Feeds a saved page to its extractor, as the scrapers do with a fresh snapshot."""
+    return extract(parse_html(fixture['html'], parser), fixture['url'])
+
+
+def measure(fixture: Dict[str, Any], extract: Callable[[Any, str], Any], parser: str, runs: int) -> Dict[str, Any]:
+    """Measures the latency and the allocations of the parse and extraction of a saved page.
+
+    The allocations are traced in an extra run, since tracing slows down the timed runs.
+
+    Args:
+        fixture: The saved page.
+        extract: The extractor, taking the parse tree and url of the page.
+        parser: The parser backend.
+        runs: The number of timed runs.
+
+    Returns:
+        dict: The parse and extraction times in ms of every run, the peak allocated KiB and the extraction result.
+    """
+    parse_times, extract_times = [], []
+    for _ in range(runs):
+        start_time_seconds = time.perf_counter()
+        soup = parse_html(fixture['html'], parser)
+        parsed_time_seconds = time.perf_counter()
+        extract(soup, fixture['url'])
+        parse_times.append((parsed_time_seconds - start_time_seconds) * 1000)
+        extract_times.append((time.perf_counter() - parsed_time_seconds) * 1000)
+
+    tracemalloc.start()
+    try:
+        result = replay(fixture, extract, parser)
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'parse_ms': parse_times,
+        'extract_ms': extract_times,
+        'peak_kib': peak_bytes / 1024,
+        'result': result,
+    }
+
+
+def get_baseline_path(fixture: Dict[str, Any]) -> Path:
+    """Returns the path of the expected extraction result of a saved page."""
+    return Path(fixture['path']).with_suffix('.expected.json')
+
+
+def check_baseline(fixture: Dict[str, Any], result: Any, save_baseline: bool) -> Optional[bool]:
+    """Compares an extraction result to the expected result of the page, or saves it as the expected result.
+
+    Returns:
+        bool: Whether the result matches the expected result, None if the page has no expected result yet.
+    """
+    baseline_path = get_baseline_path(fixture)
+    # Round trip through JSON so tuples and lists compare equal, with a fixed scraping date so baselines hold across days
+    result = refresh_scraped_at(json.loads(json.dumps(result, default=str)), BASELINE_SCRAPED_AT)
+
+    if save_baseline:
+        with open(baseline_path, 'w') as f:
+            json.dump(result, f, indent=4)
+        return True
+    if not baseline_path.exists():
+        return None
+    with open(baseline_path, 'r') as f:
+        return json.load(f) == result
+
+
+def run_benchmark(fixtures_dir: str, config_path: str, parsers: List[str], runs: int, save_baseline: bool) -> int:
+    """Replays the saved HTML fixtures through the extractors, reporting their latency, allocations and correctness.
+
+    Record the fixtures by running the scrapers with RECORD_FIXTURES_DIR set, then save the expected
+    results once with --save-baseline. Later runs fail if an extractor result differs from the expected
+    result of a page, so parser or selector regressions show up before deployment.
+
+    Args:
+        fixtures_dir: The directory of the fixtures.
+        config_path: The path of the scraper config file.
+        parsers: The parser backends to compare.
+        runs: The number of timed runs per page and backend.
+        save_baseline: Save the results of the first parser as the expected results.
+
+    Returns:
+        int: The number of pages whose result differs from the expected result.
+    """
+    extractors = get_extractors(read_config_from_json(config_path))
+    stats = defaultdict(lambda: {'parse_ms': [], 'extract_ms': [], 'peak_kib': 0.0, 'pages': 0})
+    failures = 0
+
+    for fixture in load_fixtures(fixtures_dir):
+        extractor_key = (fixture['competitor'], fixture['extractor'])
+        extract = extractors.get(extractor_key)
+        if extract is None:
+            print(f"No extractor for {'.'.join(extractor_key)}, skipping {fixture['path']}")
+            continue
+
+        for parser in parsers:
+            try:
+                measurement = measure(fixture, extract, parser, runs)
+            except Exception as e:
+                print(f"FAIL {'.'.join(extractor_key)} [{parser}] {fixture['path']}: {str(e)}")
+                failures += 1
+                continue
+
+            unit = stats[(*extractor_key, parser)]
+            unit['parse_ms'].extend(measurement['parse_ms'])
+            unit['extract_ms'].extend(measurement['extract_ms'])
+            unit['peak_kib'] = max(unit['peak_kib'], measurement['peak_kib'])
+            unit['pages'] += 1
+
+            matches = check_baseline(fixture, measurement['result'], save_baseline and parser == parsers[0])
+            if matches is False:
+                print(f"FAIL {'.'.join(extractor_key)} [{parser}] {fixture['path']}: result differs from {get_baseline_path(fixture)}")
+                failures += 1
+
+    print(f"{'extractor':<36} {'parser':<12} {'pages':>5} {'min ms':>8} {'median ms':>10} {'mean ms':>8} {'stddev':>8} {'extract ms':>10} {'peak KiB':>9}")
+    for (competitor, extractor, parser), unit in sorted(stats.items()):
+        total_times = [parse + extract for parse, extract in zip(unit['parse_ms'], unit['extract_ms'])]
+        print(
+            f"{competitor + '.' + extractor:<36} {parser:<12} {unit['pages']:>5} {min(total_times):>8.2f} "
+            f"{statistics.median(total_times):>10.2f} {statistics.mean(total_times):>8.2f} "
+            f"{statistics.pstdev(total_times):>8.2f} {statistics.median(unit['extract_ms']):>10.2f} {unit['peak_kib']:>9.0f}"
+        )
+
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay the saved HTML fixtures through the extractors and benchmark them.')
+    parser.add_argument('--fixtures', default=FIXTURES_DIR, help='Directory of the saved HTML fixtures.')
+    parser.add_argument('--config', default='dags/scraper_config.json', help='Path of the scraper config file.')
+    parser.add_argument('--parsers', nargs='+', default=list(PARSERS), choices=PARSERS, help='Parser backends to compare.')
+    parser.add_argument('--runs', type=int, default=5, help='Number of timed runs per page and backend.')
+    parser.add_argument('--save-baseline', action='store_true', help='Save the results of the first parser as the expected results of the pages.')
+    args = parser.parse_args()
+
+    sys.exit(1 if run_benchmark(args.fixtures, args.config, args.parsers, args.runs, args.save_baseline) else 0)
@@ -0,0 +1,103 @@
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from bigquery import create_dataset_if_not_exist, create_table_if_not_exist, load_products_to_bq
+from local_warehouse import LocalClient
+from table_schemas import BQ_TABLE_SCHEMAS
+from utils import get_ndjson_path
+import ndjson
+
+
+PROJECT_ID = 'local'
+DATASET_ID = 'competitors_dataset'
+COMPETITOR = 'benchmark'
+
+
+def generate_products(n_products: int, run: int, changed_ratio: float) -> List[Dict[str, Any]]:
+    """Generates a synthetic cleaned products file content, with the price of a share of the products changed every run.
+
+    Args:
+        n_products: The number of products to generate.
+        run: The index of the run, used as scraping day and to change prices.
+        changed_ratio: The share of the products whose price changes between runs.
+
+    Returns:
+        list: A list of dictionaries containing the products data.
+    """
+    changed_every = max(1, round(1 / changed_ratio)) if changed_ratio else n_products + 1
+    return [
+        {
+            'product_name': f'mobile_subscription_{i}_gb',
+            'competitor_name': COMPETITOR,
+            'product_category': 'mobile_subscription',
+            'product_url': f'https://example.com/{i}',
+            'price': float(10 + i % 50 + (run if i % changed_every == 0 else 0)),
+            'scraped_at': f'2023-10-{run + 1:02d}',
+            'data': float(i % 100),
+            'minutes': -1.0,
+            'sms': -1,
+            'upload_speed': None,
+            'download_speed': None,
+        }
+        for i in range(n_products)
+    ]
+
+
+def write_cleaned_files(products: List[Dict[str, Any]]) -> None:
+    """Writes the cleaned files read by the loader for the benchmark competitor."""
+    files = {
+        'products': products,
+        'packs': [],
+        'logs': [{'competitor_name': COMPETITOR, 'scraped_at': products[0]['scraped_at'], 'error_details': 'no error', 'status': 'success'}],
+    }
+    for table_name, records in files.items():
+        with open(get_ndjson_path(COMPETITOR, table_name), 'w') as f:
+            ndjson.dump(records, f)
+
+
+def run_benchmark(n_products: int, runs: int, changed_ratio: float) -> None:
+    """Times `load_products_to_bq` against a local warehouse over consecutive daily runs.
+
+    The benchmark runs in a temporary directory, so the files in data/ are left untouched.
+
+    Args:
+        n_products: The number of products of the competitor.
+        runs: The number of consecutive loads.
+        changed_ratio: The share of the products whose price changes between runs.
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        previous_dir = os.getcwd()
+        os.chdir(work_dir)
+        try:
+            Path('data/cleaned_data').mkdir(parents=True)
+
+            client = LocalClient(os.path.join(work_dir, 'warehouse.db'))
+            create_dataset_if_not_exist(client, PROJECT_ID, DATASET_ID)
+            create_table_if_not_exist(client, PROJECT_ID, DATASET_ID, list(BQ_TABLE_SCHEMAS), BQ_TABLE_SCHEMAS)
+
+            for run in range(runs):
+                write_cleaned_files(generate_products(n_products, run, changed_ratio))
+
+                start_time_seconds = time.perf_counter()
+                load_products_to_bq(client, PROJECT_ID, DATASET_ID, COMPETITOR)
+                elapsed = time.perf_counter() - start_time_seconds
+
+                row_counts = {table_id: client.query(f'SELECT COUNT(*) AS n FROM `{DATASET_ID}.{table_id}`').result()[0]['n'] for table_id in ['products', 'features', 'product_prices']}
+                print(f"Run {run + 1}/{runs}: load_products_to_bq took {elapsed:.3f}s | {row_counts}")
+        finally:
+            # Leave the temporary directory before it is deleted
+            os.chdir(previous_dir)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the product loader against a local SQLite warehouse.')
+    parser.add_argument('--products', type=int, default=10000, help='Number of products of the competitor.')
+    parser.add_argument('--runs', type=int, default=5, help='Number of consecutive daily loads.')
+    parser.add_argument('--changed-ratio', type=float, default=0.1, help='Share of the products whose price changes every run.')
+    args = parser.parse_args()
+
+    run_benchmark(args.products, args.runs, args.changed_ratio)
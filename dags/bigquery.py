@@ -1,9 +1,92 @@
 import google.cloud.bigquery as bq
+from google.auth.transport.requests import AuthorizedSession
 from google.cloud.exceptions import NotFound
+from google.oauth2 import service_account
+from requests.adapters import HTTPAdapter
+from datetime import datetime
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from functools import lru_cache, wraps
+import io
+import itertools
+import json
+import os
 import time
 import uuid
-from utils import load_ndjson
-from typing import Any, Dict, List, Tuple, Optional
+from utils import load_ndjson, get_ndjson_path, get_parquet_path
+from transform import write_cleaned_files
+from table_schemas import STAGING_SCHEMAS
+from content_state import ContentState
+from load_state import LoadState, fingerprint_log
+from local_warehouse import LocalClient
+from typing import Any, Callable, Dict, Iterable, List, Tuple, Optional, Union
+
+
+FEATURE_COLUMNS = ['feature_uuid', 'product_uuid', 'product_name', 'product_url', 'scraped_at', 'data', 'minutes', 'sms', 'upload_speed', 'download_speed']
+PRICE_COLUMNS = ['price_uuid', 'feature_uuid', 'price', 'scraped_at']
+# Columns defining the content of a feature, a new feature is loaded when one of them changes
+FEATURE_CONTENT_COLUMNS = ['product_name', 'product_url', 'data', 'minutes', 'sms', 'upload_speed', 'download_speed']
+
+# Namespace of the UUIDv5 derived from natural keys and content, the same key or content always gets the same uuid
+UUID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, 'https://github.com/feldeh/telecom-competitor-analysis')
+
+# Default settings of the batch load jobs, a chunk size of None loads all rows of a table in one job
+LOAD_WRITE_DISPOSITION = bq.WriteDisposition.WRITE_APPEND
+LOAD_CHUNK_SIZE = None
+
+# Source format and path of the cleaned files submitted as they are to load jobs, Parquet files are typed by the clean stage
+CLEANED_FILE_FORMATS = {
+    'ndjson': (bq.SourceFormat.NEWLINE_DELIMITED_JSON, get_ndjson_path),
+    'parquet': (bq.SourceFormat.PARQUET, get_parquet_path),
+}
+
+
+# Size of the HTTP connection pool shared by the loader functions, at least the number of concurrent loads
+BQ_HTTP_POOL_SIZE = 16
+# Default number of load tasks run at the same time by the LoadScheduler
+LOAD_WORKERS = 8
+
+
+@lru_cache(maxsize=None)
+def get_client() -> Union[bq.Client, LocalClient]:
+    """Return the warehouse client of the process, built on first use.
+
+    The backend is read from WAREHOUSE_BACKEND: 'bigquery' (default) authenticates with the service account
+    key of GOOGLE_APPLICATION_CREDENTIALS, 'sqlite' opens the local warehouse at LOCAL_WAREHOUSE_PATH.
+    The BigQuery client sends its requests through an authorized session whose connection pool is shared
+    by every loader function of the process, so connections are reused across queries and load jobs.
+
+    Returns:
+        bq.Client, LocalClient: The client.
+    """
+    # 'bigquery' loads into Google BigQuery, 'sqlite' into a local file, e.g. to benchmark the loader offline
+    if os.environ.get("WAREHOUSE_BACKEND", "bigquery") == "sqlite":
+        return LocalClient(os.environ.get("LOCAL_WAREHOUSE_PATH", "data/warehouse.db"))
+
+    credentials = service_account.Credentials.from_service_account_file(
+        os.environ.get("GOOGLE_APPLICATION_CREDENTIALS"),
+        scopes=["https://www.googleapis.com/auth/cloud-platform"],
+    )
+    session = AuthorizedSession(credentials)
+    adapter = HTTPAdapter(pool_connections=BQ_HTTP_POOL_SIZE, pool_maxsize=BQ_HTTP_POOL_SIZE)
+    session.mount('https://', adapter)
+
+    return bq.Client(project=credentials.project_id, credentials=credentials, _http=session)
+
+
+def with_client(function: Callable[..., Any]) -> Callable[..., Any]:
+    """Wrap a loader function taking the client as first argument, so the client is only built when a task runs.
+
+    Args:
+        function: The loader function.
+
+    Returns:
+        Callable: The function taking the other arguments only, called with the client of `get_client`.
+    """
+    @wraps(function)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        return function(get_client(), *args, **kwargs)
+
+    return wrapper
 
 
 def create_dataset_if_not_exist(client: bq.Client, project_id: str, dataset_id: str) -> None:
@@ -26,18 +109,68 @@ def create_dataset_if_not_exist(client: bq.Client, project_id: str, dataset_id:
         time.sleep(3)
 
 
-def create_table_if_not_exist(client: bq.Client, project_id: str, dataset_id: str, tables: List[str], schemas: Dict[str, List[bq.SchemaField]]) -> None:
+def apply_table_layout(table: bq.Table, layout: Dict[str, Any]) -> bq.Table:
+    """Set the time partitioning and the clustering fields of a table definition from its layout.
+
+    Args:
+        table: The table definition, before it is created.
+        layout: The layout of the table, see `table_schemas.BQ_TABLE_LAYOUTS`.
+
+    Returns:
+        bq.Table: The table definition.
+
+    """
+    if layout["partition_field"]:
+        table.time_partitioning = bq.TimePartitioning(type_=layout["partition_type"], field=layout["partition_field"])
+    table.clustering_fields = layout["clustering_fields"]
+    return table
+
+
+def table_layout_matches(table: bq.Table, layout: Dict[str, Any]) -> bool:
+    """Check if an existing table is partitioned and clustered as described by its layout.
+
+    Args:
+        table: The existing table, as returned by `client.get_table`.
+        layout: The layout of the table, see `table_schemas.BQ_TABLE_LAYOUTS`.
+
+    Returns:
+        bool: True if the partitioning column, its granularity and the clustering fields match.
+
+    """
+    partitioning = table.time_partitioning
+    partition_field = partitioning.field if partitioning else None
+    partition_type = partitioning.type_ if partitioning else None
+    return (
+        partition_field == layout["partition_field"]
+        and partition_type == layout["partition_type"]
+        and list(table.clustering_fields or []) == layout["clustering_fields"]
+    )
+
+
+def create_table_if_not_exist(
+    client: bq.Client,
+    project_id: str,
+    dataset_id: str,
+    tables: List[str],
+    schemas: Dict[str, List[bq.SchemaField]],
+    layouts: Optional[Dict[str, Dict[str, Any]]] = None,
+) -> None:
     """Create BigQuery tables if they do not exist based on provided schemas.
 
+    Existing tables are left as they are, tables created before their layout was declared are
+    partitioned and clustered by migrate_table_layouts.py.
+
     Args:
         client: A BigQuery client.
         project_id: The ID of the Google Cloud project.
         dataset_id: The ID of the dataset where tables will be created.
         tables: A list of table IDs to create.
         schemas: A dictionary mapping table IDs to their corresponding schemas.
+        layouts: A dictionary mapping table IDs to their partitioning and clustering, see `table_schemas.BQ_TABLE_LAYOUTS`.
 
     """
     dataset_ref = bq.DatasetReference(project_id, dataset_id)
+    layouts = layouts or {}
 
     for table_id in tables:
         table_ref = dataset_ref.table(table_id)
@@ -46,28 +179,12 @@ def create_table_if_not_exist(client: bq.Client, project_id: str, dataset_id: st
             print(f"Table {table_id} already exists.")
         except NotFound:
             table = bq.Table(table_ref, schema=schemas[table_id])
+            if table_id in layouts:
+                table = apply_table_layout(table, layouts[table_id])
             table = client.create_table(table)
             print(f'Table {table.table_id} created.')
 
 
-def is_different_record(existing_record: Dict[str, Any], new_record: Dict[str, Any], ignored_keys: List[str]) -> bool:
-    """Check if two records are different, ignoring specified keys.
-
-    Args:
-        existing_record: The existing record.
-        new_record: The new record to compare.
-        ignored_keys: Keys to ignore during the comparison.
-
-    Returns:
-        bool: True if records differ in keys not ignored, False otherwise.
-
-    """
-    for key in existing_record.keys():
-        if key not in ignored_keys and existing_record[key] != new_record.get(key):
-            return True
-    return False
-
-
 def get_existing_record(client: bq.Client, query: str) -> Optional[Dict[str, Any]]:
     """Retrieve the first record that matches a given SQL query.
 
@@ -97,6 +214,126 @@ def get_existing_record(client: bq.Client, query: str) -> Optional[Dict[str, Any
         return None
 
 
+def get_existing_records(client: bq.Client, query: str) -> List[Dict[str, Any]]:
+    """Retrieve all records that match a given SQL query.
+
+    Args:
+        client: A BigQuery client.
+        query: A SQL query string to retrieve the records.
+
+    Returns:
+        list: The records found, empty if no records are found.
+
+    Raises:
+        Exception: If the query fails, so that a failed lookup is never mistaken for missing records.
+
+    """
+    try:
+        query_job = client.query(query)
+        records = [dict(row.items()) for row in query_job.result()]
+        print(f"Query returned {len(records)} records")
+        return records
+    except Exception as e:
+        print(f"Error fetching existing records: {str(e)}")
+        raise
+
+
+def get_partition_start(scraped_at: Any) -> str:
+    """Return the first day of the monthly partition holding a scraping time, as a literal usable in a partition filter.
+
+    Args:
+        scraped_at: The scraping time, a datetime returned by BigQuery or an ISO formatted string.
+
+    Returns:
+        str: The first day of the month, formatted as YYYY-MM-DD.
+
+    """
+    return f'{str(scraped_at)[:7]}-01'
+
+
+def build_latest_records_query(dataset_id: str, table_id: str, columns: List[str], key: str, key_values: List[str], partition_start: str) -> str:
+    """Build a query returning the latest record of a table per key value.
+
+    The query filters on constant values of the clustering key and of the partitioning column,
+    so BigQuery only reads the blocks of the given keys in the partitions from partition_start.
+
+    Args:
+        dataset_id: The ID of the BigQuery dataset.
+        table_id: The ID of the table to fetch the latest records from.
+        columns: The columns of the table to return.
+        key: The column the latest record is returned for, the clustering key of the table.
+        key_values: The values of the key to return the latest record of.
+        partition_start: The earliest scraping day of the records, see `get_partition_start`.
+
+    Returns:
+        str: The SQL query string.
+
+    """
+    selected_columns = ', '.join(f'latest.{column}' for column in columns)
+    selected_keys = ', '.join(f"'{key_value}'" for key_value in key_values)
+    return (
+        f'SELECT {selected_columns} FROM ('
+        f'SELECT t.*, ROW_NUMBER() OVER (PARTITION BY t.{key} ORDER BY t.scraped_at DESC) AS row_num '
+        f'FROM `{dataset_id}.{table_id}` AS t '
+        f"WHERE t.scraped_at >= '{partition_start}' AND t.{key} IN ({selected_keys})"
+        f') AS latest WHERE latest.row_num = 1'
+    )
+
+
+def get_product_index(client: bq.Client, dataset_id: str, competitor_uuid: str) -> Dict[str, Dict[str, Any]]:
+    """Build an in-memory index of the current products, features and prices of a competitor.
+
+    The state is fetched with three batched queries regardless of the number of products,
+    so the changes of a load can be detected locally by comparing content hashes, see `make_feature_hash`.
+    Daily loads read the same index from the local `load_state.LoadState`, this function is used by the
+    periodic full consistency check.
+
+    The features and prices of a product are never scraped before the product, so the queries of the
+    features and prices are pruned to the partitions from the first product of the competitor and to the
+    clustered blocks of its products.
+
+    Args:
+        client: A BigQuery client.
+        dataset_id: The ID of the BigQuery dataset.
+        competitor_uuid: The UUID of the competitor.
+
+    Returns:
+        dict: The index keyed by product_name. Each value holds the 'product_uuid' and 'feature_uuid' of the
+            product, the content uuid of its latest feature 'feature_hash' and its latest 'price', the latter
+            two being None if not found.
+
+    """
+    get_products_query = (f'SELECT * FROM `{dataset_id}.products` WHERE competitor_uuid="{competitor_uuid}"')
+    products = get_existing_records(client, get_products_query)
+    if not products:
+        return {}
+
+    partition_start = get_partition_start(min(str(product['scraped_at']) for product in products))
+    product_uuids = sorted({product['product_uuid'] for product in products})
+    feature_uuids = sorted({product['feature_uuid'] for product in products})
+    get_features_query = build_latest_records_query(dataset_id, 'features', FEATURE_COLUMNS, 'product_uuid', product_uuids, partition_start)
+    get_prices_query = build_latest_records_query(dataset_id, 'product_prices', PRICE_COLUMNS, 'feature_uuid', feature_uuids, partition_start)
+
+    features = {record['product_uuid']: record for record in get_existing_records(client, get_features_query)}
+    prices = {record['feature_uuid']: record for record in get_existing_records(client, get_prices_query)}
+
+    product_index = {}
+    for product in products:
+        # Keep the first product found if a product name was inserted more than once
+        if product['product_name'] in product_index:
+            continue
+        feature = features.get(product['product_uuid'])
+        price = prices.get(product['feature_uuid'])
+        product_index[product['product_name']] = {
+            'product_uuid': product['product_uuid'],
+            'feature_uuid': product['feature_uuid'],
+            'feature_hash': make_feature_hash(product['product_uuid'], feature) if feature else None,
+            'price': price['price'] if price else None,
+        }
+
+    return product_index
+
+
 def insert_rows(client: bq.Client, project_id: str, dataset_id: str, table_id: str, data_to_load: List[Dict[str, Any]]) -> None:
     """Insert rows into a BigQuery table.
 
@@ -122,16 +359,151 @@ def insert_rows(client: bq.Client, project_id: str, dataset_id: str, table_id: s
         print(f"Inserted {len(data_to_load)} rows into {table_id}.")
 
 
+def load_rows(
+    client: bq.Client,
+    project_id: str,
+    dataset_id: str,
+    table_id: str,
+    data_to_load: Iterable[Dict[str, Any]],
+    write_disposition: str = LOAD_WRITE_DISPOSITION,
+    chunk_size: Optional[int] = LOAD_CHUNK_SIZE
+) -> None:
+    """Load rows into a BigQuery table with batch load jobs.
+
+    The rows are staged as NDJSON and submitted with `load_table_from_file`. Unlike streaming inserts,
+    load jobs are free and leave no rows in the streaming buffer, so the rows can be modified with DML.
+    The rows are consumed lazily, at most `chunk_size` serialized rows are staged at once.
+
+    Args:
+        client: A BigQuery client.
+        project_id: The ID of the Google Cloud project.
+        dataset_id: The ID of the dataset.
+        table_id: The ID of the table to load data into.
+        data_to_load: The rows to load into the table, a list or an iterator.
+        write_disposition: The write disposition of the first load job, the following chunks are appended.
+        chunk_size: The maximum number of rows per load job, None to load all rows in a single job.
+
+    Raises:
+        Exception: If a load job fails.
+
+    """
+    table_ref = bq.DatasetReference(project_id, dataset_id).table(table_id)
+    rows = iter(data_to_load)
+
+    for chunk_index in itertools.count():
+        staged_file = io.BytesIO()
+        for row in itertools.islice(rows, chunk_size):
+            staged_file.write(json.dumps(row).encode('utf-8') + b'\n')
+        if staged_file.tell() == 0:
+            if chunk_index == 0:
+                print(f"No rows to load into {table_id}.")
+            return
+        staged_file.seek(0)
+
+        job_config = bq.LoadJobConfig(
+            source_format=bq.SourceFormat.NEWLINE_DELIMITED_JSON,
+            # Only the first chunk can truncate the table, otherwise each chunk would overwrite the previous one
+            write_disposition=write_disposition if chunk_index == 0 else bq.WriteDisposition.WRITE_APPEND,
+        )
+
+        load_job = None
+        try:
+            load_job = client.load_table_from_file(staged_file, table_ref, job_config=job_config)
+            load_job.result()
+        except Exception as e:
+            print(f"Error loading data: {str(e)}")
+            if load_job is not None and load_job.errors:
+                print("Errors in load_rows:")
+                print(load_job.errors)
+            raise
+
+        print(f"Loaded {load_job.output_rows} rows ({load_job.output_bytes} bytes) into {table_id} with job {load_job.job_id}.")
+
+
+def load_cleaned_file(
+    client: bq.Client,
+    project_id: str,
+    dataset_id: str,
+    table_id: str,
+    competitor: str,
+    file_name: str,
+    file_format: str = 'ndjson',
+    schema: Optional[List[bq.SchemaField]] = None,
+    write_disposition: str = LOAD_WRITE_DISPOSITION
+) -> bq.LoadJob:
+    """Load a cleaned file of a competitor into a BigQuery table with a single load job.
+
+    Parquet files carry the column types of the schema they were written with, so BigQuery loads them
+    without parsing and coercing JSON text.
+
+    Args:
+        client: A BigQuery client.
+        project_id: The ID of the Google Cloud project.
+        dataset_id: The ID of the dataset.
+        table_id: The ID of the table to load the file into.
+        competitor: The name of the competitor of the file.
+        file_name: The name of the cleaned file.
+        file_format: The format of the cleaned file, one of CLEANED_FILE_FORMATS keys.
+        schema: The schema of the table, required if the table does not exist.
+        write_disposition: The write disposition of the load job.
+
+    Returns:
+        bq.LoadJob: The finished load job.
+
+    Raises:
+        ValueError: If the Parquet file is older than the NDJSON file, so it was not written by the last clean run.
+        Exception: If the load job fails.
+    """
+    source_format, get_path = CLEANED_FILE_FORMATS[file_format]
+    path = get_path(competitor, file_name)
+    ndjson_path = get_ndjson_path(competitor, file_name)
+    if file_format == 'parquet' and ndjson_path.exists() and os.path.getmtime(path) < os.path.getmtime(ndjson_path):
+        raise ValueError(f"{path} is older than {ndjson_path}, check that the clean DAG writes Parquet files (CLEANED_FILE_FORMAT in utils.py)")
+    table_ref = bq.DatasetReference(project_id, dataset_id).table(table_id)
+    job_config = bq.LoadJobConfig(
+        source_format=source_format,
+        schema=schema,
+        write_disposition=write_disposition,
+        # Keys of the NDJSON records not in the schema are skipped, Parquet files only hold the schema columns
+        ignore_unknown_values=file_format == 'ndjson',
+    )
+
+    with open(path, 'rb') as file:
+        load_job = client.load_table_from_file(file, table_ref, job_config=job_config)
+    load_job.result()
+    print(f"Loaded {load_job.output_rows} rows ({load_job.output_bytes} bytes) of {competitor} {file_name} {file_format} into {table_id} with job {load_job.job_id}.")
+
+    return load_job
+
+
 def load_packs_to_bq(client: bq.Client, project_id: str, dataset_id: str, competitor: str) -> None:
     """
     Load packs data to the BigQuery 'packs' table for a specified competitor.
 
+    Packs already loaded are skipped, their names are read from the local load state, or from BigQuery
+    with a single query by the periodic full consistency check, see `load_state.LoadState`.
+
     Args:
         client: A BigQuery client object.
         project_id: The ID of the Google Cloud project.
         dataset_id: The ID of the BigQuery dataset.
         competitor: The name of the competitor to load packs data for.
     """
+    content_state = ContentState(competitor)
+    if content_state.is_table_unchanged('packs'):
+        print(f"Packs of {competitor} unchanged since the last load, nothing to load.")
+        return
+
+    load_state = LoadState()
+    full_check = load_state.needs_full_check(competitor, 'packs')
+    if full_check:
+        get_packs_query = (f'SELECT DISTINCT pack_name FROM `{dataset_id}.packs` WHERE competitor_name="{competitor}"')
+        existing_pack_names = {record['pack_name'] for record in get_existing_records(client, get_packs_query)}
+        stored_pack_names = load_state.get_pack_names(competitor)
+        load_state.log_drift(competitor, 'packs', dict.fromkeys(stored_pack_names, True), dict.fromkeys(existing_pack_names, True))
+    else:
+        existing_pack_names = load_state.get_pack_names(competitor)
+
     packs_data = load_ndjson(competitor, 'packs')
 
     packs_to_load = []
@@ -148,44 +520,147 @@ def load_packs_to_bq(client: bq.Client, project_id: str, dataset_id: str, compet
             # "internet_product_name": record["internet_product_name"],
         }
 
-        get_packs_query = (f'SELECT * FROM `{dataset_id}.packs` WHERE competitor_name="{new_data["competitor_name"]}" AND pack_name="{new_data["pack_name"]}" LIMIT 1')
-        existing_packs_record = get_existing_record(client, get_packs_query)
-        if not existing_packs_record:
+        if new_data["pack_name"] not in existing_pack_names:
+            existing_pack_names.add(new_data["pack_name"])
             packs_to_load.append(new_data)
 
     if packs_to_load != []:
-        insert_rows(client, project_id, dataset_id, 'packs', packs_to_load)
+        load_rows(client, project_id, dataset_id, 'packs', packs_to_load)
+
+    # After a full check the state is rebuilt from the pack names of the warehouse, otherwise the new packs are added
+    load_state.update_packs(competitor, existing_pack_names if full_check else [pack["pack_name"] for pack in packs_to_load], full_check)
+    content_state.mark_table_loaded('packs')
 
 
-def load_logs_to_bq(client: bq.Client, project_id: str, dataset_id: str, competitor: str) -> None:
+def load_logs_to_bq(client: bq.Client, project_id: str, dataset_id: str, competitor: str, file_format: str = 'ndjson') -> None:
     """
     Load logs data to the BigQuery 'logs' table for a specified competitor.
 
+    Logs already loaded are skipped, matched on the fingerprint of the whole record, see `load_state.fingerprint_log`,
+    so a retry of the load task does not append them again while the logs of a scrape run again the same day are loaded.
+
     Args:
         client: A BigQuery client object.
         project_id: The ID of the Google Cloud project.
         dataset_id: The ID of the BigQuery dataset.
         competitor: The name of the competitor to load logs data for.
+        file_format: The format of the cleaned file to load, the Parquet file is loaded as it is.
+    """
+    load_state = LoadState()
+    loaded_fingerprints = load_state.get_log_fingerprints(competitor)
+    logs_data = list(load_ndjson(competitor, 'logs'))
+    logs_to_load = [record for record in logs_data if fingerprint_log(record) not in loaded_fingerprints]
+
+    if not logs_to_load:
+        print(f"Logs of {competitor} already loaded, nothing to load.")
+        return
+
+    # The Parquet file is loaded as it is only if none of its logs was loaded yet
+    if file_format == 'parquet' and len(logs_to_load) == len(logs_data):
+        load_cleaned_file(client, project_id, dataset_id, 'logs', competitor, 'logs', file_format)
+    else:
+        load_rows(client, project_id, dataset_id, 'logs', logs_to_load)
+
+    load_state.update_logs(competitor, [fingerprint_log(record) for record in logs_to_load])
+
+
+def make_uuid(kind: str, *key: Any) -> str:
+    """
+    Derive a deterministic UUIDv5 from the kind of a row and its natural key or content.
+
+    Numbers are compared as floats, so 1000 and 1000.0 read back from a FLOAT column give the same uuid,
+    and scraping times as ISO datetimes, so '2023-10-01' read from NDJSON and the DATETIME read from
+    Parquet give the same uuid.
+
+    Args:
+        kind: The kind of row, e.g. 'competitor', 'product', 'feature' or 'price'.
+        key: The values identifying the row.
+
+    Returns:
+        str: The uuid.
+    """
+    normalized_key = [
+        float(value) if isinstance(value, (int, float)) and not isinstance(value, bool)
+        else value.isoformat() if isinstance(value, datetime)
+        else value
+        for value in key
+    ]
+    return str(uuid.uuid5(UUID_NAMESPACE, json.dumps([kind, *normalized_key])))
+
+
+def normalize_scraped_at(scraped_at: Any) -> datetime:
+    """Return the scraping time of a record as a datetime, whether it was read as a string or a DATETIME."""
+    return scraped_at if isinstance(scraped_at, datetime) else datetime.fromisoformat(str(scraped_at))
+
+
+def make_feature_hash(product_uuid: str, record: Dict[str, Any]) -> str:
+    """
+    Derive the content hash of a feature from its product and the FEATURE_CONTENT_COLUMNS of a record.
+
+    Two features of a product get the same hash if and only if their content is the same, so comparing
+    the hash of the latest loaded feature with the hash of a new record tells whether the feature changed.
+    The hash is a change-detection key only, the rows of the 'features' table are identified by
+    `make_row_uuids`, since a feature reverting to an older content is a new row of the history.
+
+    Args:
+        product_uuid: The UUID of the product.
+        record: A cleaned product record or a row of the 'features' table.
+
+    Returns:
+        str: The hash, formatted as a uuid.
+    """
+    return make_uuid('feature', product_uuid, *[record.get(column) for column in FEATURE_CONTENT_COLUMNS])
+
+
+def make_row_uuids(record: Dict[str, Any]) -> Dict[str, str]:
     """
-    logs_data = load_ndjson(competitor, 'logs')
+    Derive the uuids of the rows a cleaned product record may add, from its natural key, scraping date and values.
+
+    The scrapers stamp the products with the date only and a day may be scraped again, so the feature uuid
+    also covers the FEATURE_CONTENT_COLUMNS and the price uuid the feature content and the price: a feature
+    or price changed by a run of the same day gets a new uuid, and a value reverting on a later day too.
+    Both load engines use these uuids, see `load_products_to_bq` and `write_staged_products`, so a product
+    gets the same uuids whichever engine loads it, and a retried load inserts rows with the uuids of the first attempt.
+
+    Args:
+        record: A cleaned product record.
 
-    insert_rows(client, project_id, dataset_id, 'logs', logs_data)
+    Returns:
+        dict: The 'competitor_uuid', 'product_uuid', 'feature_uuid' and 'price_uuid' of the record.
+    """
+    product_key = (record["competitor_name"], record["product_name"])
+    scraped_at = normalize_scraped_at(record["scraped_at"])
+    feature_content = [record.get(column) for column in FEATURE_CONTENT_COLUMNS]
+    return {
+        "competitor_uuid": make_uuid('competitor', record["competitor_name"]),
+        "product_uuid": make_uuid('product', *product_key),
+        "feature_uuid": make_uuid('feature', *product_key, scraped_at, *feature_content),
+        "price_uuid": make_uuid('price', *product_key, scraped_at, *feature_content, record["price"]),
+    }
 
 
-def prepare_data_for_insertion(record: Dict[str, Any], competitor_uuid: str) -> Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]:
+def prepare_data_for_insertion(record: Dict[str, Any], competitor_uuid: str, existing_product: Optional[Dict[str, Any]] = None) -> Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]:
     """
     Prepare product, feature and price data for insertion into BigQuery from a given record.
 
+    The uuids of the rows are derived from the natural key and scraping time of the record, see `make_row_uuids`.
+    An existing product keeps its uuids, which may be random if it was loaded before the uuids were deterministic,
+    and the first feature of a product takes the feature_uuid referenced by the product.
+
     Args:
         record: A dictionary containing the product data.
         competitor_uuid: The UUID of the competitor.
+        existing_product: The entry of the product in the product index, None if the product is new.
 
     Returns:
         A tuple of three dictionaries: product_data, feature_data and price_data.
     """
-    product_uuid = str(uuid.uuid4())
-    feature_uuid = str(uuid.uuid4())
-    price_uuid = str(uuid.uuid4())
+    row_uuids = make_row_uuids(record)
+    product_uuid = existing_product['product_uuid'] if existing_product else row_uuids["product_uuid"]
+    # Prices reference the feature_uuid of the product, the uuid of its first feature
+    price_feature_uuid = existing_product['feature_uuid'] if existing_product else row_uuids["feature_uuid"]
+    has_feature = existing_product is not None and existing_product['feature_hash'] is not None
+    feature_uuid = row_uuids["feature_uuid"] if has_feature else price_feature_uuid
 
     product_data = {
         "product_uuid": product_uuid,
@@ -211,8 +686,8 @@ def prepare_data_for_insertion(record: Dict[str, Any], competitor_uuid: str) ->
     }
 
     price_data = {
-        "price_uuid": price_uuid,
-        "feature_uuid": feature_uuid,
+        "price_uuid": row_uuids["price_uuid"],
+        "feature_uuid": price_feature_uuid,
         "price": record["price"],
         "scraped_at": record["scraped_at"],
     }
@@ -223,7 +698,13 @@ def prepare_data_for_insertion(record: Dict[str, Any], competitor_uuid: str) ->
 def load_products_to_bq(client: bq.Client, project_id: str, dataset_id: str, competitor: str) -> None:
     """
     Load products, features and prices data to the BigQuery tables for a specified competitor.
-    Ensures that existing records are not duplicated.
+    Ensures that existing records are not duplicated by diffing against an index of the competitor's
+    current state, read from the local load state, see `load_state.LoadState`. The index is fetched from
+    BigQuery with a constant number of queries by the periodic full consistency check only.
+
+    The uuids are deterministic, see `prepare_data_for_insertion`: rows are deduplicated with a set
+    of uuids, and a feature changed when the hash of its content differs from the hash of the content of
+    the latest loaded feature, see `make_feature_hash`.
 
     Args:
         client: A BigQuery client object.
@@ -231,103 +712,464 @@ def load_products_to_bq(client: bq.Client, project_id: str, dataset_id: str, com
         dataset_id: The ID of the BigQuery dataset.
         competitor: The name of the competitor to load products data for.
     """
+    content_state = ContentState(competitor)
+    if content_state.is_table_unchanged('products'):
+        print(f"Products of {competitor} unchanged since the last load, nothing to load.")
+        return
+
     new_data = load_ndjson(competitor, 'products')
 
-    first_record = new_data[0]
+    first_record = next(new_data, None)
+    if first_record is None:
+        print(f"No products of {competitor} to load.")
+        return
+    new_data = itertools.chain([first_record], new_data)
     products_to_load = []
     features_to_load = []
     prices_to_load = []
 
-    competitor_uuid = str(uuid.uuid4())
+    load_state = LoadState()
+    full_check = load_state.needs_full_check(competitor, 'products')
 
-    get_competitor_query = (f'SELECT * FROM `{dataset_id}.competitors` WHERE competitor_name="{first_record["competitor_name"]}" LIMIT 1')
-    existing_competitor_record = get_existing_record(client, get_competitor_query)
+    if not full_check:
+        competitor_uuid = load_state.get_competitor_uuid(competitor)
+        product_index = load_state.get_product_index(competitor)
+    else:
+        get_competitor_query = (f'SELECT * FROM `{dataset_id}.competitors` WHERE competitor_name="{first_record["competitor_name"]}" LIMIT 1')
+        existing_competitor_record = get_existing_record(client, get_competitor_query)
 
-    # If the competitor doesn't exist, insert new competitor data with associated product, features and price data.
-    if not existing_competitor_record:
-        new_competitor = [
-            {
-                "competitor_uuid": competitor_uuid,
-                "competitor_name": first_record["competitor_name"],
-                "created_at": first_record["scraped_at"],
-            }
-        ]
-        insert_rows(client, project_id, dataset_id, 'competitors', new_competitor)
+        if existing_competitor_record:
+            competitor_uuid = existing_competitor_record['competitor_uuid']
+            # Fetch the current state of every product of the competitor once and diff locally
+            product_index = get_product_index(client, dataset_id, competitor_uuid)
+        else:
+            # A new competitor has no products yet, every product is loaded
+            competitor_uuid = make_uuid('competitor', first_record["competitor_name"])
+            new_competitor = [
+                {
+                    "competitor_uuid": competitor_uuid,
+                    "competitor_name": first_record["competitor_name"],
+                    "created_at": first_record["scraped_at"],
+                }
+            ]
+            load_rows(client, project_id, dataset_id, 'competitors', new_competitor)
+            product_index = {}
+
+        load_state.log_drift(competitor, 'products', load_state.get_product_index(competitor), product_index)
+        # The state is rebuilt from the warehouse index before loading, the loaded rows are then recorded as below
+        load_state.update_products(competitor, competitor_uuid, product_index, full_check)
+
+    # Uuids of the rows already queued, so a product listed twice in the file is loaded once
+    queued_uuids = set()
+    # State of the products recorded once their products, features and prices load jobs succeeded. The feature hash
+    # and price of a table not loaded yet are None, so a failed job leaves them changed for the next run, while
+    # the rows of the jobs that succeeded are not appended again
+    loaded_products_state = {}
+    loaded_features_state = {}
+    changed_products = {}
+
+    for record in new_data:
 
-        for record in new_data:
+        existing_product = product_index.get(record["product_name"])
+        product_data, feature_data, price_data = prepare_data_for_insertion(record, competitor_uuid, existing_product)
+        feature_hash = make_feature_hash(product_data["product_uuid"], record)
+        product_state = {
+            'product_uuid': product_data["product_uuid"],
+            'feature_uuid': price_data["feature_uuid"],
+            'feature_hash': feature_hash,
+            'price': price_data["price"],
+        }
+
+        # If product doesn't exist, load product, feature and price
+        if not existing_product:
+            if product_data["product_uuid"] not in queued_uuids:
+                queued_uuids.add(product_data["product_uuid"])
+                products_to_load.append(product_data)
+                features_to_load.append(feature_data)
+                prices_to_load.append(price_data)
+                loaded_products_state[record["product_name"]] = {**product_state, 'feature_hash': None, 'price': None}
+                loaded_features_state[record["product_name"]] = {**product_state, 'price': None}
+                changed_products[record["product_name"]] = product_state
+            continue
 
-            product_data, feature_data, price_data = prepare_data_for_insertion(record, competitor_uuid)
+        feature_changed = existing_product['feature_hash'] != feature_hash
+        price_changed = existing_product['price'] != price_data["price"]
 
-            products_to_load.append(product_data)
+        # To be loaded if feature changed, a new feature always comes with its price
+        if feature_changed and feature_data["feature_uuid"] not in queued_uuids:
+            queued_uuids.add(feature_data["feature_uuid"])
             features_to_load.append(feature_data)
+            loaded_features_state[record["product_name"]] = {**product_state, 'price': None}
+        if (feature_changed or price_changed) and price_data["price_uuid"] not in queued_uuids:
+            queued_uuids.add(price_data["price_uuid"])
             prices_to_load.append(price_data)
+        if feature_changed or price_changed:
+            changed_products[record["product_name"]] = product_state
+
+    if products_to_load:
+        load_rows(client, project_id, dataset_id, 'products', products_to_load)
+        load_state.update_products(competitor, competitor_uuid, loaded_products_state)
+    if features_to_load:
+        load_rows(client, project_id, dataset_id, 'features', features_to_load)
+        load_state.update_products(competitor, competitor_uuid, loaded_features_state)
+    if prices_to_load:
+        load_rows(client, project_id, dataset_id, 'product_prices', prices_to_load)
+
+    load_state.update_products(competitor, competitor_uuid, changed_products)
+    content_state.mark_table_loaded('products')
+
 
-        insert_rows(client, project_id, dataset_id, 'products', products_to_load)
-        insert_rows(client, project_id, dataset_id, 'features', features_to_load)
-        insert_rows(client, project_id, dataset_id, 'product_prices', prices_to_load)
+def write_staged_products(competitor: str, file_format: str = 'ndjson') -> str:
+    """Write the cleaned products of a competitor with the uuids of their rows, to be staged by the MERGE engine.
 
-        load_packs_to_bq(client, project_id, dataset_id, competitor)
-        load_logs_to_bq(client, project_id, dataset_id, competitor)
+    The uuids are computed by `make_row_uuids`, like the ones of the rows engine, so both engines give a product
+    the same uuids. The file is written from the cleaned NDJSON file, with a Parquet copy if the products are
+    staged as Parquet.
 
+    Args:
+        competitor: The name of the competitor to write the products for.
+        file_format: The format of the file to stage, one of CLEANED_FILE_FORMATS keys.
+
+    Returns:
+        str: The name of the written file, to be passed to `stage_cleaned_file`.
+    """
+    staged_file_name = 'products_staged'
+    records = ({**record, **make_row_uuids(record)} for record in load_ndjson(competitor, 'products'))
+    write_cleaned_files(records, competitor, staged_file_name, write_parquet=file_format == 'parquet')
+
+    return staged_file_name
+
+
+def stage_cleaned_file(
+    client: bq.Client,
+    project_id: str,
+    dataset_id: str,
+    competitor: str,
+    file_name: str,
+    file_format: str = 'ndjson',
+    staged_file_name: Optional[str] = None
+) -> str:
+    """Stage a cleaned file of a competitor into a staging table, replacing its previous content.
+
+    Args:
+        client: A BigQuery client object.
+        project_id: The ID of the Google Cloud project.
+        dataset_id: The ID of the BigQuery dataset.
+        competitor: The name of the competitor to stage the file for.
+        file_name: The name of the cleaned file, one of STAGING_SCHEMAS keys.
+        file_format: The format of the cleaned file, one of CLEANED_FILE_FORMATS keys.
+        staged_file_name: The name of the file to load instead of the cleaned file, e.g. the products with
+            their uuids written by `write_staged_products`.
+
+    Returns:
+        str: The ID of the staging table.
+    """
+    staging_table_id = f'_staging_{competitor}_{file_name}'
+    load_cleaned_file(
+        client, project_id, dataset_id, staging_table_id, competitor, staged_file_name or file_name, file_format,
+        schema=STAGING_SCHEMAS[file_name],
+        write_disposition=bq.WriteDisposition.WRITE_TRUNCATE,
+    )
+
+    return staging_table_id
+
+
+def build_merge_script(dataset_id: str, staged_products_table: str, staged_packs_table: str) -> str:
+    """Build the multi-statement transaction merging the staged products and packs of a competitor.
+
+    Products are matched on (competitor, product_name) and packs on (competitor_name, pack_name). A feature
+    is inserted when the latest feature of the product differs from the staged one, and a price when the
+    latest price differs or the feature changed, the same rules as `load_products_to_bq`. The inserted rows
+    take the uuids staged with the products, see `write_staged_products`. The reads of the features and
+    prices are pruned to the partitions from the first product of the staged competitors.
+
+    Args:
+        dataset_id: The ID of the BigQuery dataset.
+        staged_products_table: The ID of the staging table holding the cleaned products and their uuids.
+        staged_packs_table: The ID of the staging table holding the cleaned packs.
+
+    Returns:
+        str: The SQL script.
+    """
+    staged_products = f'`{dataset_id}.{staged_products_table}`'
+    staged_packs = f'`{dataset_id}.{staged_packs_table}`'
+    feature_changed = ' OR '.join(f'f.{key} IS DISTINCT FROM s.{key}' for key in FEATURE_CONTENT_COLUMNS)
+    same_feature = ' AND '.join(f'target.{key} IS NOT DISTINCT FROM source.{key}' for key in FEATURE_CONTENT_COLUMNS)
+
+    return f"""
+    -- Earliest monthly partition holding rows of the staged products, set once their products are merged
+    DECLARE history_start DATETIME;
+
+    BEGIN TRANSACTION;
+
+    MERGE `{dataset_id}.competitors` AS target
+    USING (
+        SELECT competitor_name, ANY_VALUE(competitor_uuid) AS competitor_uuid, MIN(scraped_at) AS created_at
+        FROM {staged_products}
+        GROUP BY competitor_name
+    ) AS source
+    ON target.competitor_name = source.competitor_name
+    WHEN NOT MATCHED THEN
+        INSERT (competitor_uuid, competitor_name, created_at)
+        VALUES (source.competitor_uuid, source.competitor_name, source.created_at);
+
+    MERGE `{dataset_id}.products` AS target
+    USING (
+        SELECT s.product_name, s.product_category, s.competitor_name, s.scraped_at, s.product_uuid, s.feature_uuid, c.competitor_uuid
+        FROM {staged_products} AS s
+        JOIN `{dataset_id}.competitors` AS c ON c.competitor_name = s.competitor_name
+    ) AS source
+    ON target.competitor_uuid = source.competitor_uuid AND target.product_name = source.product_name
+    WHEN NOT MATCHED THEN
+        INSERT (product_uuid, product_name, product_category, competitor_name, competitor_uuid, feature_uuid, scraped_at)
+        VALUES (source.product_uuid, source.product_name, source.product_category, source.competitor_name, source.competitor_uuid, source.feature_uuid, source.scraped_at);
+
+    -- The features and prices of a product are never scraped before the product, a constant lower bound prunes older partitions
+    SET history_start = (
+        SELECT DATETIME_TRUNC(MIN(p.scraped_at), MONTH)
+        FROM `{dataset_id}.products` AS p
+        JOIN `{dataset_id}.competitors` AS c ON c.competitor_uuid = p.competitor_uuid
+        WHERE c.competitor_name IN (SELECT competitor_name FROM {staged_products})
+    );
+
+    CREATE TEMP TABLE product_state AS
+    SELECT
+        s.product_name, s.product_url, s.price, s.scraped_at, s.data, s.minutes, s.sms, s.upload_speed, s.download_speed,
+        s.feature_uuid, s.price_uuid,
+        p.product_uuid,
+        p.feature_uuid AS product_feature_uuid,
+        f.feature_uuid AS latest_feature_uuid,
+        pr.price_uuid AS latest_price_uuid,
+        (f.feature_uuid IS NULL OR {feature_changed}) AS feature_changed
+    FROM (SELECT * EXCEPT(sms), CAST(sms AS INT64) AS sms FROM {staged_products}) AS s
+    JOIN `{dataset_id}.competitors` AS c ON c.competitor_name = s.competitor_name
+    JOIN `{dataset_id}.products` AS p ON p.competitor_uuid = c.competitor_uuid AND p.product_name = s.product_name
+    LEFT JOIN (
+        SELECT * FROM `{dataset_id}.features`
+        WHERE scraped_at >= history_start
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY product_uuid ORDER BY scraped_at DESC) = 1
+    ) AS f ON f.product_uuid = p.product_uuid
+    LEFT JOIN (
+        SELECT * FROM `{dataset_id}.product_prices`
+        WHERE scraped_at >= history_start
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY feature_uuid ORDER BY scraped_at DESC) = 1
+    ) AS pr ON pr.feature_uuid = p.feature_uuid;
+
+    MERGE `{dataset_id}.features` AS target
+    USING product_state AS source
+    ON target.scraped_at >= history_start AND target.feature_uuid = source.latest_feature_uuid AND {same_feature}
+    WHEN NOT MATCHED THEN
+        INSERT (feature_uuid, product_uuid, product_name, product_url, scraped_at, data, minutes, sms, upload_speed, download_speed)
+        VALUES (
+            -- The first feature of a product takes the feature_uuid referenced by the product
+            IF(source.latest_feature_uuid IS NULL, source.product_feature_uuid, source.feature_uuid),
+            source.product_uuid, source.product_name, source.product_url, source.scraped_at,
+            source.data, source.minutes, source.sms, source.upload_speed, source.download_speed
+        );
+
+    MERGE `{dataset_id}.product_prices` AS target
+    USING product_state AS source
+    ON target.scraped_at >= history_start AND target.price_uuid = source.latest_price_uuid AND target.price = source.price AND NOT source.feature_changed
+    WHEN NOT MATCHED THEN
+        INSERT (price_uuid, feature_uuid, price, scraped_at)
+        VALUES (source.price_uuid, source.product_feature_uuid, source.price, source.scraped_at);
+
+    MERGE `{dataset_id}.packs` AS target
+    USING (
+        SELECT * FROM {staged_packs}
+        WHERE TRUE
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY competitor_name, pack_name ORDER BY scraped_at DESC) = 1
+    ) AS source
+    ON target.competitor_name = source.competitor_name AND target.pack_name = source.pack_name
+    WHEN NOT MATCHED THEN
+        INSERT (competitor_name, pack_name, pack_url, pack_description, price, scraped_at)
+        VALUES (source.competitor_name, source.pack_name, source.pack_url, source.pack_description, source.price, source.scraped_at);
+
+    COMMIT TRANSACTION;
+    """
+
+
+def merge_products_to_bq(client: bq.Client, project_id: str, dataset_id: str, competitor: str, file_format: str = 'ndjson') -> None:
+    """
+    Upsert competitors, products, features, prices and packs data of a specified competitor with set-based MERGE statements.
+    The cleaned files are staged into staging tables and merged in a single multi-statement transaction,
+    so the load time does not depend on the number of products or on the history size. The merge does not
+    update the local load state, so the next load of the 'diff' engine checks the warehouse in full.
+
+    Args:
+        client: A BigQuery client object.
+        project_id: The ID of the Google Cloud project.
+        dataset_id: The ID of the BigQuery dataset.
+        competitor: The name of the competitor to merge data for.
+        file_format: The format of the cleaned files to stage, one of CLEANED_FILE_FORMATS keys.
+    """
+    content_state = ContentState(competitor)
+    if content_state.is_table_unchanged('products') and content_state.is_table_unchanged('packs'):
+        print(f"Products and packs of {competitor} unchanged since the last load, nothing to merge.")
         return
 
-    competitor_uuid = existing_competitor_record['competitor_uuid']
+    staging_table_ids = []
+    try:
+        staged_products_file = write_staged_products(competitor, file_format)
+        staged_products_table = stage_cleaned_file(client, project_id, dataset_id, competitor, 'products', file_format, staged_products_file)
+        staging_table_ids.append(staged_products_table)
+        staged_packs_table = stage_cleaned_file(client, project_id, dataset_id, competitor, 'packs', file_format)
+        staging_table_ids.append(staged_packs_table)
 
-    for record in new_data:
+        merge_script = build_merge_script(dataset_id, staged_products_table, staged_packs_table)
+        # Invalidated before merging, so the state is not trusted even if the process stops right after the merge
+        LoadState().invalidate(competitor, ['products', 'packs'])
+        client.query(merge_script).result()
+        print(f"Merged products and packs of {competitor}.")
 
-        product_data, feature_data, price_data = prepare_data_for_insertion(record, competitor_uuid)
+        content_state.mark_table_loaded('products')
+        content_state.mark_table_loaded('packs')
 
-        # Check if a product exist
-        get_product_query = (f'SELECT * FROM `{dataset_id}.products` WHERE competitor_uuid="{competitor_uuid}" AND product_name="{product_data["product_name"]}" LIMIT 1')
-        existing_product_record = get_existing_record(client, get_product_query)
-        # If product doesn't exist, load product, feature and price
-        if not existing_product_record:
-            products_to_load.append(product_data)
-            features_to_load.append(feature_data)
-            prices_to_load.append(price_data)
+    except Exception as e:
+        print(f"Error merging data: {str(e)}")
+        raise
 
-        else:
-            # Store the fetched product_uuid
-            product_uuid = existing_product_record['product_uuid']
-            feature_data["product_uuid"] = product_uuid
+    finally:
+        for staging_table_id in staging_table_ids:
+            client.delete_table(bq.DatasetReference(project_id, dataset_id).table(staging_table_id), not_found_ok=True)
 
-            # Fetch last record from product feature
-            get_feature_query = (f'SELECT * FROM `{dataset_id}.features` WHERE product_uuid="{product_uuid}" ORDER BY scraped_at LIMIT 1')
-            existing_feature_record = get_existing_record(client, get_feature_query)
 
-            if not existing_feature_record:
-                features_to_load.append(feature_data)
-                prices_to_load.append(price_data)
+class LoadScheduler:
+    """Runs load tasks on a thread pool, each task starting once the tasks it depends on succeeded.
 
-            else:
-                ignored_keys = ['scraped_at', 'product_uuid', 'feature_uuid']
-                # To be loaded if feature changed
-                if is_different_record(existing_feature_record, feature_data, ignored_keys):
+    Independent tables and competitors are loaded concurrently. A task whose dependency failed is skipped,
+    the other tasks still run, and `run` raises once every task finished or was skipped.
 
-                    features_to_load.append(feature_data)
-                    prices_to_load.append(price_data)
+    Attributes:
+        max_workers (int): The maximum number of tasks running at the same time.
+        results (dict): The status, duration in seconds and result or error of each finished task.
+        _tasks (dict): The function, arguments and dependencies of each task, keyed by name.
+    """
 
-            # Store the fetched feature_uuid
-            feature_uuid = existing_product_record['feature_uuid']
-            price_data["feature_uuid"] = feature_uuid
+    def __init__(self, max_workers: int = LOAD_WORKERS) -> None:
+        """Initialize an empty LoadScheduler object with the size of its thread pool."""
+        self.max_workers = max_workers
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self._tasks: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, name: str, function: Callable[..., Any], *args: Any, depends_on: Iterable[str] = (), **kwargs: Any) -> None:
+        """Add a task calling function with the given arguments once the tasks of depends_on succeeded.
+
+        Args:
+            name: The unique name of the task.
+            function: The load function.
+            depends_on: The names of the tasks that must succeed before this task starts.
+        """
+        if name in self._tasks:
+            raise ValueError(f"Load task {name} already added")
+        self._tasks[name] = {'function': function, 'args': args, 'kwargs': kwargs, 'depends_on': list(depends_on)}
+
+    def _run_task(self, name: str) -> Any:
+        """Run a task and record its duration."""
+        task = self._tasks[name]
+        start_time_seconds = time.perf_counter()
+        try:
+            return task['function'](*task['args'], **task['kwargs'])
+        finally:
+            self.results[name] = {'seconds': round(time.perf_counter() - start_time_seconds, 3)}
+
+    def run(self) -> Dict[str, Dict[str, Any]]:
+        """Run every task, respecting their dependencies.
+
+        Returns:
+            dict: The status ('success', 'failed' or 'skipped') and duration of each task.
+
+        Raises:
+            ValueError: If a dependency is unknown or the dependencies form a cycle.
+            Exception: If a task failed, after every other task finished.
+        """
+        for name, task in self._tasks.items():
+            unknown = set(task['depends_on']) - set(self._tasks)
+            if unknown:
+                raise ValueError(f"Load task {name} depends on unknown tasks {sorted(unknown)}")
+
+        pending = dict(self._tasks)
+        running: Dict[Future, str] = {}
+        statuses: Dict[str, str] = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='load') as executor:
+            while pending or running:
+                for name, task in list(pending.items()):
+                    dependency_statuses = [statuses.get(dependency) for dependency in task['depends_on']]
+                    if any(status in ('failed', 'skipped') for status in dependency_statuses):
+                        statuses[name] = 'skipped'
+                        self.results[name] = {'seconds': 0.0}
+                        print(f"Load task {name} skipped, a dependency failed")
+                        del pending[name]
+                    elif all(status == 'success' for status in dependency_statuses):
+                        running[executor.submit(self._run_task, name)] = name
+                        del pending[name]
+
+                if not running:
+                    if pending:
+                        raise ValueError(f"Load tasks {sorted(pending)} have cyclic dependencies")
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    error = future.exception()
+                    statuses[name] = 'failed' if error else 'success'
+                    if error:
+                        self.results[name]['error'] = error
+                    print(f"Load task {name} {statuses[name]} in {self.results[name]['seconds']:.3f}s")
+
+        for name, status in statuses.items():
+            self.results[name]['status'] = status
+
+        failed = [name for name, status in statuses.items() if status == 'failed']
+        if failed:
+            raise Exception(f"Load tasks failed: {failed}") from self.results[failed[0]]['error']
+
+        return self.results
+
+
+def load_competitors_to_bq(
+    client: bq.Client,
+    project_id: str,
+    dataset_id: str,
+    competitors: List[str],
+    engine: str = 'diff',
+    file_format: str = 'ndjson',
+    max_workers: int = LOAD_WORKERS
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Load the cleaned products, packs and logs of several competitors concurrently with a LoadScheduler.
 
-            # Fetch the last record matching that feature_uuid and product price
-            get_price_query = (f'SELECT * FROM `{dataset_id}.product_prices` WHERE feature_uuid="{feature_uuid}" ORDER BY scraped_at LIMIT 1')
-            existing_price_record = get_existing_record(client, get_price_query)
+    Products, packs and logs share no uuid, so they load independently of each other and of the other
+    competitors. Within `load_products_to_bq`, the competitor, products, features and prices keep their
+    order since each references the uuid of the previous one. The MERGE transactions of the 'merge'
+    engine update the same tables, so they run one competitor after another to avoid aborted transactions.
 
-            # If no price found insert price data with newly generated price_uuid
-            if not existing_price_record:
-                prices_to_load.append(price_data)
+    Args:
+        client: A BigQuery client object.
+        project_id: The ID of the Google Cloud project.
+        dataset_id: The ID of the BigQuery dataset.
+        competitors: The names of the competitors to load.
+        engine: 'diff' to load products with `load_products_to_bq` and packs with `load_packs_to_bq`,
+            'merge' to merge both with `merge_products_to_bq`.
+        file_format: The format of the cleaned files loaded as they are, one of CLEANED_FILE_FORMATS keys.
+        max_workers: The maximum number of tables loaded at the same time.
 
-            else:
-                ignored_keys = ['scraped_at', 'feature_uuid', 'price_uuid']
-                # If new price, load the new price
-                if is_different_record(existing_price_record, price_data, ignored_keys):
-                    prices_to_load.append(price_data)
+    Returns:
+        dict: The status and duration of each load task.
+    """
+    scheduler = LoadScheduler(max_workers)
+    previous_merge = None
+
+    for competitor in competitors:
+        if engine == 'merge':
+            name = f'merge_products_{competitor}'
+            scheduler.add(name, merge_products_to_bq, client, project_id, dataset_id, competitor, file_format, depends_on=[previous_merge] if previous_merge else [])
+            previous_merge = name
+        else:
+            scheduler.add(f'load_products_{competitor}', load_products_to_bq, client, project_id, dataset_id, competitor)
+            scheduler.add(f'load_packs_{competitor}', load_packs_to_bq, client, project_id, dataset_id, competitor)
+        scheduler.add(f'load_logs_{competitor}', load_logs_to_bq, client, project_id, dataset_id, competitor, file_format)
 
-    if products_to_load:
-        insert_rows(client, project_id, dataset_id, 'products', products_to_load)
-    if features_to_load:
-        insert_rows(client, project_id, dataset_id, 'features', features_to_load)
-    if prices_to_load:
-        insert_rows(client, project_id, dataset_id, 'product_prices', prices_to_load)
+    return scheduler.run()
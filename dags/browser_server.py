@@ -0,0 +1,120 @@
+import json
+import logging
+import os
+import socket
+import statistics
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+from playwright.sync_api import Browser, Playwright
+from playwright.async_api import Browser as AsyncBrowser, Playwright as AsyncPlaywright
+
+
+# Websocket endpoint of the browser server sidecar, e.g. ws://browser-server:3000/, the browser is launched locally if unset
+BROWSER_SERVER_URL = os.environ.get('BROWSER_SERVER_URL')
+
+# Time in seconds the browser server is given to accept the health check connection
+HEALTH_CHECK_TIMEOUT = 2
+
+# Time in milliseconds the browser server is given to accept the Playwright connection
+CONNECT_TIMEOUT = 10000
+
+# Browser startup times of the runs, used to report the startup time saved by the browser server
+STARTUP_METRICS_PATH = 'logs/browser_startup.ndjson'
+
+
+def check_browser_server(url: str, timeout: float = HEALTH_CHECK_TIMEOUT) -> bool:
+    """Checks if the browser server accepts connections on its host and port.
+
+    Args:
+        url: The websocket endpoint of the browser server.
+        timeout: The time in seconds given to the server to accept the connection.
+
+    Returns:
+        bool: True if the server is reachable.
+    """
+    endpoint = urlparse(url)
+    try:
+        with socket.create_connection((endpoint.hostname, endpoint.port or 80), timeout=timeout):
+            return True
+    except OSError as e:
+        logging.warning(f"Browser server {url} is not reachable: {str(e)}")
+        return False
+
+
+def read_startup_metrics(metrics_path: str = STARTUP_METRICS_PATH) -> List[Dict[str, Any]]:
+    """Reads the browser startup times of the previous runs."""
+    if not os.path.exists(metrics_path):
+        return []
+    with open(metrics_path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def record_startup(competitor: str, mode: str, startup_time: float, metrics_path: str = STARTUP_METRICS_PATH) -> None:
+    """Records the browser startup time of a run and logs the time saved compared to a local launch.
+
+    Args:
+        competitor: The competitor scraped.
+        mode: 'server' if the browser server was connected to, 'local' if the browser was launched.
+        startup_time: The time in seconds to get the browser.
+        metrics_path: The path of the NDJSON file of the startup times.
+    """
+    message = f"{competitor} browser startup ({mode}): {startup_time:.3f}s"
+    local_times = [metric['startup_time'] for metric in read_startup_metrics(metrics_path) if metric['mode'] == 'local']
+    if mode == 'server' and local_times:
+        message += f" | saved {statistics.median(local_times) - startup_time:.3f}s compared to the median local launch"
+    logging.info(message)
+
+    os.makedirs(os.path.dirname(metrics_path), exist_ok=True)
+    with open(metrics_path, 'a') as f:
+        f.write(json.dumps({
+            'competitor': competitor,
+            'mode': mode,
+            'startup_time': round(startup_time, 3),
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+        }) + '\n')
+
+
+def get_browser(pw: Playwright, competitor: str, slow_mo: float = 0, server_url: Optional[str] = BROWSER_SERVER_URL) -> Browser:
+    """Connects to the browser server with the sync Playwright API, falls back to launching Chromium locally.
+
+    Closing a browser connected to the server only closes its contexts, the server keeps running.
+
+    Args:
+        pw: The Playwright instance.
+        competitor: The competitor scraped, used in the startup metrics.
+        slow_mo: The delay in ms added to each browser operation.
+        server_url: The websocket endpoint of the browser server, None to launch locally.
+
+    Returns:
+        Browser: The connected or launched browser.
+    """
+    start_time_seconds = time.time()
+    if server_url and check_browser_server(server_url):
+        try:
+            browser = pw.chromium.connect(server_url, timeout=CONNECT_TIMEOUT, slow_mo=slow_mo)
+            record_startup(competitor, 'server', time.time() - start_time_seconds)
+            return browser
+        except Exception as e:
+            logging.warning(f"Connection to browser server {server_url} failed, launching locally: {str(e)}")
+
+    browser = pw.chromium.launch(headless=True, slow_mo=slow_mo)
+    record_startup(competitor, 'local', time.time() - start_time_seconds)
+    return browser
+
+
+async def get_browser_async(pw: AsyncPlaywright, competitor: str, slow_mo: float = 0, server_url: Optional[str] = BROWSER_SERVER_URL) -> AsyncBrowser:
+    """Connects to the browser server with the async Playwright API, falls back to launching Chromium locally, see `get_browser`."""
+    start_time_seconds = time.time()
+    if server_url and check_browser_server(server_url):
+        try:
+            browser = await pw.chromium.connect(server_url, timeout=CONNECT_TIMEOUT, slow_mo=slow_mo)
+            record_startup(competitor, 'server', time.time() - start_time_seconds)
+            return browser
+        except Exception as e:
+            logging.warning(f"Connection to browser server {server_url} failed, launching locally: {str(e)}")
+
+    browser = await pw.chromium.launch(headless=True, slow_mo=slow_mo)
+    record_startup(competitor, 'local', time.time() - start_time_seconds)
+    return browser
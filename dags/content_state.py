@@ -0,0 +1,209 @@
+import copy
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import partial
+from types import CodeType
+from typing import Any, Callable, Dict, Iterable, Iterator
+
+
+# Directory of the state file of each competitor, holding the fingerprints of its pages and tables
+CONTENT_STATE_DIR = 'data/content_state'
+
+# Tables whose cleaning and loading are skipped when their content did not change, logs are loaded every run
+SHORT_CIRCUIT_TABLES = ['products', 'packs']
+
+# Version of the extractors shared by all of them, bump it to stop reusing every stored extraction,
+# e.g. after changing a helper function the extractors call, which their own code version does not cover
+EXTRACTORS_VERSION = 1
+
+
+def fingerprint_records(records: Iterable[Dict[str, Any]]) -> str:
+    """Returns the fingerprint of the records of a table, ignoring their scraping date.
+
+    The records are hashed one at a time, so the iterable is consumed lazily.
+
+    Args:
+        records: The records of the table.
+
+    Returns:
+        str: The SHA-256 hex digest of the records.
+    """
+    digest = hashlib.sha256()
+    for record in records:
+        content = {key: value for key, value in record.items() if key != 'scraped_at'}
+        digest.update(json.dumps(content, sort_keys=True, default=str).encode('utf-8') + b'\n')
+    return digest.hexdigest()
+
+
+def refresh_scraped_at(result: Any, scraped_at: str) -> Any:
+    """Returns a copy of an extraction result with the scraping date of its records set to the current run."""
+    if isinstance(result, list):
+        return [refresh_scraped_at(item, scraped_at) for item in result]
+    if isinstance(result, dict):
+        return {key: scraped_at if key == 'scraped_at' else refresh_scraped_at(value, scraped_at) for key, value in result.items()}
+    return result
+
+
+def hash_code(code: CodeType, digest: Any) -> None:
+    """Adds the bytecode, names and constants of a code object and of its nested functions to a digest."""
+    digest.update(code.co_code)
+    digest.update(repr(code.co_names).encode('utf-8'))
+    for constant in code.co_consts:
+        if isinstance(constant, CodeType):
+            hash_code(constant, digest)
+        elif isinstance(constant, frozenset):
+            # Sorted since the iteration order of a set of strings changes between processes
+            digest.update(repr(sorted(map(repr, constant))).encode('utf-8'))
+        else:
+            digest.update(repr(constant).encode('utf-8'))
+
+
+def get_extractor_version(extract: Callable[..., Any]) -> str:
+    """Returns the version of an extractor, changing whenever its code, e.g. a selector, changes.
+
+    Args:
+        extract: The extractor, a function, a method or a partial of either.
+
+    Returns:
+        str: The SHA-256 hex digest of EXTRACTORS_VERSION and of the code of the extractor.
+    """
+    digest = hashlib.sha256(str(EXTRACTORS_VERSION).encode('utf-8'))
+    while isinstance(extract, partial):
+        digest.update(repr(extract.args).encode('utf-8'))
+        extract = extract.func
+    function = getattr(extract, '__func__', extract)
+    code = getattr(function, '__code__', None)
+    if code is not None:
+        hash_code(code, digest)
+    else:
+        digest.update(repr(function).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ContentState:
+    """Fingerprints of the pages and tables of a competitor, stored in a local state file between runs.
+
+    The scrapers reuse the extraction result of the last successful run for the pages whose fingerprint
+    did not change. The clean stage fingerprints each table and the load stage skips the tables whose
+    fingerprint matches the last successful load, so quiet days finish without cleaning or loading.
+
+    The state file holds:
+        pages: The fingerprint, extractor version and extraction result of each page, keyed by url, DOM state and extractor.
+        tables: The 'staged' fingerprint of each table set by the clean stage and the 'loaded' one set by the load stage.
+
+    Attributes:
+        competitor (str): The competitor of the state.
+        path (str): The path of the state file.
+        stats (Counter): The extractions reused and run during the run.
+        _pages (dict): The pages of the last successful run.
+        _new_pages (dict): The pages of the current run, saved when the run succeeds.
+    """
+
+    def __init__(self, competitor: str, state_dir: str = CONTENT_STATE_DIR) -> None:
+        """Initialize the ContentState object of a competitor from its state file."""
+        self.competitor = competitor
+        self.path = os.path.join(state_dir, f'{competitor}.json')
+        self.stats = Counter()
+        self._pages = self._read().get('pages', {})
+        self._new_pages = {}
+
+    def _read(self) -> Dict[str, Any]:
+        """Reads the state file, empty if it does not exist."""
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, 'r') as f:
+            return json.load(f)
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Holds an exclusive lock on the state file, so concurrent tasks of the competitor do not lose each other's updates."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(f'{self.path}.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write(self, state: Dict[str, Any]) -> None:
+        """Writes the state file atomically, so a failed task never leaves a truncated state."""
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(temp_path, self.path)
+
+    def extract(self, snapshot: Any, key: str, extract: Callable[[Any, str], Any]) -> Any:
+        """Runs an extractor on a snapshot, reusing its result of the last run if the page fingerprint did not change.
+
+        A result is only reused by the same version of the extractor, see `get_extractor_version`, so a fixed
+        extractor runs again on the next deployment instead of serving the result of the previous code.
+
+        Args:
+            snapshot (PageSnapshot): The snapshot of the page.
+            key: The name of the extractor.
+            extract: The extractor, taking the parse tree and url of the page.
+
+        Returns:
+            Any: The result of the extractor, with the scraping date of the current run.
+        """
+        page_key = f'{snapshot.url}|{snapshot.state}|{key}'
+        previous = self._pages.get(page_key)
+        extractor_version = get_extractor_version(extract)
+
+        # The version is stored with the result rather than in the key, so the results of older versions are replaced
+        if previous is not None and previous['fingerprint'] == snapshot.fingerprint and previous.get('extractor_version') == extractor_version:
+            self.stats['reused'] += 1
+            logging.info(f"Page unchanged, reusing the {key} extraction of the last run: {snapshot.url} [{snapshot.state}]")
+            result = refresh_scraped_at(previous['result'], time.strftime("%Y-%m-%d"))
+        else:
+            self.stats['extracted'] += 1
+            result = extract(snapshot.soup, snapshot.url)
+
+        # Stored as a copy, callers may extend the result they get
+        self._new_pages[page_key] = {'fingerprint': snapshot.fingerprint, 'extractor_version': extractor_version, 'result': copy.deepcopy(result)}
+        return result
+
+    def save_pages(self) -> None:
+        """Saves the fingerprints and extraction results of the run, called once the run succeeded."""
+        with self._locked():
+            state = self._read()
+            state['pages'] = {**state.get('pages', {}), **self._new_pages}
+            self._write(state)
+        logging.info(f"{self.competitor} pages: {self.stats['reused']} extractions reused, {self.stats['extracted']} run")
+
+    def stage_table(self, table: str, records: Iterable[Dict[str, Any]]) -> bool:
+        """Fingerprints the records of a table before cleaning.
+
+        Args:
+            table: The name of the table.
+            records: The raw records of the table.
+
+        Returns:
+            bool: True if the records are unchanged since the last successful load, so cleaning and loading are no-ops.
+        """
+        fingerprint = fingerprint_records(records)
+        with self._locked():
+            state = self._read()
+            table_state = state.setdefault('tables', {}).setdefault(table, {})
+            table_state['staged'] = fingerprint
+            self._write(state)
+        return table_state.get('loaded') == fingerprint
+
+    def is_table_unchanged(self, table: str) -> bool:
+        """Checks if the staged records of a table were already loaded by the last successful load."""
+        table_state = self._read().get('tables', {}).get(table, {})
+        return table_state.get('staged') is not None and table_state.get('staged') == table_state.get('loaded')
+
+    def mark_table_loaded(self, table: str) -> None:
+        """Records that the staged records of a table were loaded."""
+        with self._locked():
+            state = self._read()
+            table_state = state.setdefault('tables', {}).setdefault(table, {})
+            table_state['loaded'] = table_state.get('staged')
+            self._write(state)
@@ -0,0 +1,117 @@
+import argparse
+import logging
+from typing import Any, Callable, Dict, List, Optional
+from playwright.sync_api import Browser, sync_playwright
+
+import scarlet_scraper
+from viking_class_scraper import Scraper, STATIC_PRODUCT_TYPES
+from viking_scraper import goto_page
+from page_snapshot import PageSnapshot
+from utils import fetch_static_page, read_config_from_json
+
+
+def try_extract(extract: Callable[[Any, str], Any], page_content: str, url: str) -> Optional[Any]:
+    """Runs an extractor, returning None if it fails on the page content."""
+    try:
+        return extract(PageSnapshot(url, page_content).soup, url)
+    except Exception as e:
+        logging.info(f"Extraction failed on {url}: {str(e)}")
+        return None
+
+
+def compare_extraction(name: str, extract: Callable[[Any, str], Any], static_content: str, rendered_content: str, url: str) -> Dict[str, Any]:
+    """Compares the result of an extractor on the HTML fetched over HTTP and on the DOM rendered by the browser.
+
+    Args:
+        name: The name of the extractor.
+        extract: The extractor, taking the parse tree and url of the page.
+        static_content: The HTML fetched with a plain HTTP request.
+        rendered_content: The HTML of the page rendered by the browser.
+        url: The URL of the page.
+
+    Returns:
+        dict: The comparison, with the recommended fetch strategy.
+    """
+    static_result = try_extract(extract, static_content, url)
+    rendered_result = try_extract(extract, rendered_content, url)
+    same_result = bool(rendered_result) and static_result == rendered_result
+
+    return {
+        'extractor': name,
+        'url': url,
+        'static_records': len(static_result) if static_result else 0,
+        'rendered_records': len(rendered_result) if rendered_result else 0,
+        'strategy': 'static' if same_result else 'browser',
+    }
+
+
+def detect_scarlet(browser: Browser) -> List[Dict[str, Any]]:
+    """Detects the fetch strategy of each scarlet extractor."""
+    extractors = {
+        'mobile_subscription': (scarlet_scraper.extract_mobile_subscription_data, ['mobile_subscription']),
+        'options': (scarlet_scraper.extract_options_data, ['option_mobile_subscription']),
+        'internet_subscription': (scarlet_scraper.extract_internet_subscription_data, ['internet_subscription']),
+        'options_streaming': (scarlet_scraper.extract_options_streaming, ['options_streaming_trio', 'options_streaming_trio_mobile']),
+        'options_tv': (scarlet_scraper.extract_options_tv, ['options_tv']),
+    }
+
+    comparisons = []
+    for name, (extract, url_keys) in extractors.items():
+        for url_key in url_keys:
+            url = scarlet_scraper.URL[url_key]
+            page, _ = scarlet_scraper.navigate(browser, url, scarlet_scraper.READINESS[name])
+            rendered_content = page.content()
+            page.close()
+            comparisons.append(compare_extraction(name, extract, fetch_static_page(url), rendered_content, url))
+
+    return comparisons
+
+
+def detect_mobileviking(browser: Browser, config: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Detects the fetch strategy of the mobileviking product types extracted from the page content only."""
+    # The extractors log to the root logger, the scraper log file of the DAG runs is left untouched
+    scraper_object = Scraper(None, config, logger=logging.getLogger())
+
+    comparisons = []
+    for product_type in STATIC_PRODUCT_TYPES:
+        url = config['baseurl'] + config['endpoint'][product_type]
+        page = goto_page(browser, url, config['readiness'].get(product_type))
+        rendered_content = page.content()
+        page.close()
+
+        def extract(soup: Any, page_url: str) -> List[Dict[str, Any]]:
+            return scraper_object._extract_content_data(product_type, soup, page_url)
+
+        comparisons.append(compare_extraction(product_type, extract, fetch_static_page(url), rendered_content, url))
+
+    return comparisons
+
+
+def main(config_path: str) -> None:
+    """Prints the recommended fetch strategy of each extractor.
+
+    An extractor can use the 'static' strategy when it returns the same non-empty result on the HTML
+    fetched over HTTP as on the DOM rendered by Chromium.
+
+    Args:
+        config_path: The path of the scraper config file.
+    """
+    config = read_config_from_json(config_path)
+
+    with sync_playwright() as pw:
+        browser = pw.chromium.launch(headless=True)
+        try:
+            comparisons = detect_scarlet(browser) + detect_mobileviking(browser, config['mobileviking'])
+        finally:
+            browser.close()
+
+    for comparison in comparisons:
+        print("{extractor:<24} {strategy:<8} static: {static_records:>3} records | rendered: {rendered_records:>3} records | {url}".format(**comparison))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare HTTP-only and rendered extraction results to pick the fetch strategy of each extractor.')
+    parser.add_argument('--config', default='dags/scraper_config.json', help='Path of the scraper config file.')
+    args = parser.parse_args()
+
+    main(args.config)
@@ -0,0 +1,92 @@
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from page_snapshot import PageSnapshot
+
+
+# Directory of the saved HTML pages used to benchmark and replay the extractors offline
+FIXTURES_DIR = 'data/fixtures'
+
+
+class FixtureRecorder:
+    """Saves the page snapshots of a scraping run as fixtures for the offline replay of the extractors.
+
+    A snapshot is saved once per extractor reading it as `<competitor>/<extractor>__<state>__<url hash>.html`
+    next to a `.json` metadata file holding the competitor, extractor, url, DOM state and the metadata of the
+    snapshot, such as the navigation response and the clicks leading to the state. Recording a page again
+    overwrites its previous fixture.
+
+    Attributes:
+        competitor (str): The competitor scraped.
+        fixtures_dir (str): The directory of the fixtures.
+    """
+
+    def __init__(self, competitor: str, fixtures_dir: str = FIXTURES_DIR) -> None:
+        """Initialize the FixtureRecorder object with the competitor and the fixture directory."""
+        self.competitor = competitor
+        self.fixtures_dir = fixtures_dir
+
+    def record(self, snapshot: PageSnapshot, extractor: str) -> None:
+        """Saves a snapshot and its metadata as the fixture of an extractor reading it.
+
+        Args:
+            snapshot: The snapshot of the page.
+            extractor: The name of the extractor, replayed on the fixture by benchmark_extractors.py.
+        """
+        metadata = dict(snapshot.metadata)
+        # The extractor whose load took the snapshot may differ from the extractor reading it
+        metadata.pop('extractor', None)
+        url_hash = hashlib.sha1(snapshot.url.encode('utf-8')).hexdigest()[:8]
+
+        directory = Path(self.fixtures_dir) / self.competitor
+        directory.mkdir(parents=True, exist_ok=True)
+        html_path = directory / f'{extractor}__{snapshot.state}__{url_hash}.html'
+
+        html = snapshot.html.decode('utf-8') if isinstance(snapshot.html, bytes) else snapshot.html
+        html_path.write_text(html, encoding='utf-8')
+        with open(html_path.with_suffix('.json'), 'w') as f:
+            json.dump({
+                'competitor': self.competitor,
+                'extractor': extractor,
+                'url': snapshot.url,
+                'state': snapshot.state,
+                'recorded_at': datetime.now().isoformat(timespec='seconds'),
+                **metadata,
+            }, f, indent=4)
+
+        logging.info(f"Recorded fixture {html_path}")
+
+
+def get_recorder(competitor: str) -> Optional[FixtureRecorder]:
+    """Returns the fixture recorder of a competitor in record mode, enabled by setting RECORD_FIXTURES_DIR, else None."""
+    fixtures_dir = os.environ.get('RECORD_FIXTURES_DIR')
+    return FixtureRecorder(competitor, fixtures_dir) if fixtures_dir else None
+
+
+def load_fixtures(fixtures_dir: str = FIXTURES_DIR) -> List[Dict[str, Any]]:
+    """Loads the saved HTML pages of a fixture directory, see `FixtureRecorder`.
+
+    Pages without metadata file are skipped.
+
+    Args:
+        fixtures_dir: The directory of the fixtures.
+
+    Returns:
+        list: The fixtures, as the metadata dictionaries with the page content under 'html' and its path under 'path'.
+    """
+    fixtures = []
+    for html_path in sorted(Path(fixtures_dir).glob('*/*.html')):
+        metadata_path = html_path.with_suffix('.json')
+        if not metadata_path.exists():
+            continue
+        with open(metadata_path, 'r') as f:
+            fixture = json.load(f)
+        fixture['html'] = html_path.read_text(encoding='utf-8')
+        fixture['path'] = str(html_path)
+        fixtures.append(fixture)
+    return fixtures
@@ -0,0 +1,175 @@
+import hashlib
+import json
+import logging
+import time
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+import requests
+from airflow import AirflowException
+
+from utils import HTTP_TIMEOUT, get_http_session
+
+
+# Directory of the cached pages and of the results extracted from them
+HTTP_CACHE_DIR = 'data/http_cache'
+
+# Time in seconds a cached page is reused without revalidating it with the server
+HTTP_CACHE_TTL = 6 * 3600
+
+# Size in bytes of the cached pages above which the least recently used pages are evicted
+HTTP_CACHE_MAX_BYTES = 50 * 1024 * 1024
+
+
+class HttpCache:
+    """Disk-backed cache of static pages revalidated with conditional requests.
+
+    Each page is stored as `<url hash>.html` next to a `<url hash>.json` entry holding its ETag and
+    Last-Modified validators and the results extracted from it, keyed by extractor. A page fetched less
+    than `ttl` seconds ago is not requested again, an older page is requested with If-None-Match and
+    If-Modified-Since and a 304 response reuses the previous extraction result without parsing the page.
+    The entry is rewritten on every use, so its modification time is the last access of the page.
+
+    Attributes:
+        cache_dir (Path): The directory of the cache.
+        ttl (float): The time in seconds a page is reused without revalidation.
+        max_bytes (int): The size of the cached pages above which the least recently used are evicted.
+        stats (Counter): The fresh hits, 304 revalidations and misses of the run.
+    """
+
+    def __init__(self, cache_dir: str = HTTP_CACHE_DIR, ttl: float = HTTP_CACHE_TTL, max_bytes: int = HTTP_CACHE_MAX_BYTES) -> None:
+        """Initialize the HttpCache object with its directory, TTL and size bound."""
+        self.cache_dir = Path(cache_dir)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.stats = Counter()
+
+    def _path(self, url: str, suffix: str) -> Path:
+        """Returns the path of the cached page or entry of a url."""
+        return self.cache_dir / (hashlib.sha1(url.encode('utf-8')).hexdigest() + suffix)
+
+    def _read_entry(self, url: str) -> Optional[Dict[str, Any]]:
+        """Returns the cache entry of a url, None if the page is not cached."""
+        entry_path = self._path(url, '.json')
+        if not entry_path.exists() or not self._path(url, '.html').exists():
+            return None
+        with open(entry_path, 'r') as f:
+            return json.load(f)
+
+    def _write_entry(self, url: str, entry: Dict[str, Any]) -> None:
+        """Writes the cache entry of a url."""
+        with open(self._path(url, '.json'), 'w') as f:
+            json.dump(entry, f)
+
+    def _evict(self) -> None:
+        """Removes the least recently used pages until the cached pages fit in max_bytes."""
+        # Sizes and access times come from the stat data of the files, the entries are not read
+        pages = []
+        for page_path in self.cache_dir.glob('*.html'):
+            entry_path = page_path.with_suffix('.json')
+            try:
+                pages.append((entry_path.stat().st_mtime, page_path.stat().st_size, page_path, entry_path))
+            except FileNotFoundError:
+                continue
+
+        total_bytes = sum(size for _, size, _, _ in pages)
+        for _, size, page_path, entry_path in sorted(pages):
+            if total_bytes <= self.max_bytes:
+                break
+            page_path.unlink(missing_ok=True)
+            entry_path.unlink(missing_ok=True)
+            total_bytes -= size
+            self.stats['evicted'] += 1
+            logging.info(f"Evicted {page_path.name} from the HTTP cache")
+
+    def extract(self, url: str, key: str, extract: Callable[[str], Any]) -> Any:
+        """Returns the result of an extractor on a page, only fetching and parsing the page if it changed.
+
+        Results must be JSON serializable, since they are stored in the cache entry of the page.
+
+        Args:
+            url: The URL of the page.
+            key: The name of the extractor, a page can hold the results of several extractors.
+            extract: The extractor, taking the HTML of the page.
+
+        Returns:
+            Any: The result of the extractor.
+        """
+        entry = self._read_entry(url)
+        now = time.time()
+
+        if entry is not None and key in entry['results'] and now - entry['fetched_at'] < self.ttl:
+            self.stats['fresh'] += 1
+            logging.info(f"HTTP cache fresh hit: {url}")
+            # Rewriting the entry records the access, see `_evict`
+            self._write_entry(url, entry)
+            return entry['results'][key]
+
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        try:
+            logging.info(f"Fetching URL without browser: {url}")
+            response = get_http_session().get(url, headers=headers, timeout=HTTP_TIMEOUT)
+            response.raise_for_status()
+
+        except requests.exceptions.RequestException as e:
+            logging.error(e)
+            raise AirflowException(e)
+
+        if response.status_code == 304 and entry is not None:
+            self.stats['not_modified'] += 1
+            logging.info(f"HTTP cache revalidated (304): {url}")
+            entry['fetched_at'] = now
+            if key not in entry['results']:
+                entry['results'][key] = extract(self._path(url, '.html').read_text(encoding='utf-8'))
+            self._write_entry(url, entry)
+            return entry['results'][key]
+
+        self.stats['miss'] += 1
+        html = response.text
+        entry = {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'fetched_at': now,
+            'results': {key: extract(html)},
+        }
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._path(url, '.html').write_text(html, encoding='utf-8')
+        self._write_entry(url, entry)
+        self._evict()
+
+        return entry['results'][key]
+
+    def log_stats(self, logger: Optional[logging.Logger] = None) -> Dict[str, int]:
+        """Logs the hit ratio of the run, counting fresh hits and 304 revalidations as hits.
+
+        Args:
+            logger (logging.Logger): Logger for recording the stats, the root logger if None.
+
+        Returns:
+            dict: The stats of the run.
+        """
+        logger = logger or logging.getLogger()
+        stats = dict(self.stats)
+        hits = stats.get('fresh', 0) + stats.get('not_modified', 0)
+        requests_count = hits + stats.get('miss', 0)
+        hit_ratio = hits / requests_count if requests_count else 0.0
+        logger.info(
+            f"HTTP cache: hit ratio {hit_ratio:.0%} ({stats.get('fresh', 0)} fresh, {stats.get('not_modified', 0)} not modified, "
+            f"{stats.get('miss', 0)} misses, {stats.get('evicted', 0)} evicted)"
+        )
+        return stats
+
+
+@lru_cache(maxsize=None)
+def get_http_cache() -> HttpCache:
+    """Returns the HTTP cache of the process, shared by the extractors of static pages."""
+    return HttpCache()
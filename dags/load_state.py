@@ -0,0 +1,206 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from contextlib import closing, contextmanager
+from typing import Any, Dict, Iterable, Iterator, Optional, Set
+
+
+# SQLite file holding the state of the rows loaded into the warehouse, shared by the load tasks of every competitor
+LOAD_STATE_PATH = 'data/load_state.db'
+
+# Maximum age in seconds of the last full consistency check of a table, the loader reads the warehouse again after it
+FULL_CHECK_INTERVAL = 7 * 24 * 3600
+
+LOAD_STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS competitors (
+    competitor TEXT PRIMARY KEY,
+    competitor_uuid TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS products (
+    competitor TEXT NOT NULL,
+    product_name TEXT NOT NULL,
+    product_uuid TEXT NOT NULL,
+    feature_uuid TEXT NOT NULL,
+    feature_hash TEXT,
+    price REAL,
+    PRIMARY KEY (competitor, product_name)
+);
+CREATE TABLE IF NOT EXISTS packs (
+    competitor TEXT NOT NULL,
+    pack_name TEXT NOT NULL,
+    PRIMARY KEY (competitor, pack_name)
+);
+CREATE TABLE IF NOT EXISTS log_fingerprints (
+    competitor TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    PRIMARY KEY (competitor, fingerprint)
+);
+CREATE TABLE IF NOT EXISTS checks (
+    competitor TEXT NOT NULL,
+    table_name TEXT NOT NULL,
+    checked_at REAL NOT NULL,
+    PRIMARY KEY (competitor, table_name)
+);
+"""
+
+
+def fingerprint_log(record: Dict[str, Any]) -> str:
+    """Returns the fingerprint of a log record, covering all its fields.
+
+    The scraping time of a log is the date only, so a scrape failing and run again the same day writes
+    a second log with the same scraping time, told apart from the first one by its status and error details.
+    """
+    return hashlib.sha256(json.dumps(record, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class LoadState:
+    """Local store of the rows loaded into the warehouse, so daily loads diff against it instead of querying the warehouse.
+
+    For each product of a competitor, the store holds its uuids, the content hash of its latest feature
+    (see `bigquery.make_feature_hash`) and its latest price. For packs, it holds the names of the packs loaded,
+    and for logs the fingerprints of the log records loaded, so a retried load does not append the same logs again.
+    The store is rebuilt from the warehouse by a full consistency check when a table was never checked
+    or its last check is older than FULL_CHECK_INTERVAL. Each operation opens its own connection, so the
+    store can be used by concurrent load threads and tasks.
+
+    Attributes:
+        path (str): The path of the SQLite file.
+        full_check_interval (float): The maximum age in seconds of the last full consistency check of a table.
+    """
+
+    def __init__(self, path: str = LOAD_STATE_PATH, full_check_interval: float = FULL_CHECK_INTERVAL) -> None:
+        """Initialize the LoadState object with the path of its SQLite file, created if it does not exist."""
+        self.path = path
+        self.full_check_interval = full_check_interval
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with self._transaction() as connection:
+            connection.executescript(LOAD_STATE_SCHEMA)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Opens a connection committing on success and rolling back on error."""
+        with closing(sqlite3.connect(self.path, timeout=30)) as connection:
+            connection.row_factory = sqlite3.Row
+            with connection:
+                yield connection
+
+    def needs_full_check(self, competitor: str, table_name: str) -> bool:
+        """Checks if a table of a competitor must be reconciled with the warehouse before being loaded."""
+        with self._transaction() as connection:
+            row = connection.execute(
+                'SELECT checked_at FROM checks WHERE competitor = ? AND table_name = ?', (competitor, table_name)
+            ).fetchone()
+        return row is None or time.time() - row['checked_at'] > self.full_check_interval
+
+    def get_competitor_uuid(self, competitor: str) -> Optional[str]:
+        """Returns the uuid of a competitor, None if it was never loaded."""
+        with self._transaction() as connection:
+            row = connection.execute('SELECT competitor_uuid FROM competitors WHERE competitor = ?', (competitor,)).fetchone()
+        return row['competitor_uuid'] if row else None
+
+    def get_product_index(self, competitor: str) -> Dict[str, Dict[str, Any]]:
+        """Returns the loaded products of a competitor in the format of `bigquery.get_product_index`.
+
+        Args:
+            competitor: The name of the competitor.
+
+        Returns:
+            dict: The product_uuid, feature_uuid, feature_hash and price of each product, keyed by product name.
+        """
+        with self._transaction() as connection:
+            rows = connection.execute(
+                'SELECT product_name, product_uuid, feature_uuid, feature_hash, price FROM products WHERE competitor = ?', (competitor,)
+            ).fetchall()
+        return {row['product_name']: {key: row[key] for key in ('product_uuid', 'feature_uuid', 'feature_hash', 'price')} for row in rows}
+
+    def update_products(self, competitor: str, competitor_uuid: str, products: Dict[str, Dict[str, Any]], full_check: bool = False) -> None:
+        """Records the products loaded for a competitor.
+
+        Args:
+            competitor: The name of the competitor.
+            competitor_uuid: The uuid of the competitor.
+            products: The product_uuid, feature_uuid, feature_hash and price of the products, keyed by product name.
+            full_check: Whether the products are the full state of the competitor read from the warehouse, replacing
+                the stored products and resetting the age of the last full check.
+        """
+        with self._transaction() as connection:
+            connection.execute('INSERT OR REPLACE INTO competitors (competitor, competitor_uuid) VALUES (?, ?)', (competitor, competitor_uuid))
+            if full_check:
+                connection.execute('DELETE FROM products WHERE competitor = ?', (competitor,))
+                self._mark_checked(connection, competitor, 'products')
+            connection.executemany(
+                'INSERT OR REPLACE INTO products (competitor, product_name, product_uuid, feature_uuid, feature_hash, price) VALUES (?, ?, ?, ?, ?, ?)',
+                [
+                    (competitor, product_name, product['product_uuid'], product['feature_uuid'], product['feature_hash'], product['price'])
+                    for product_name, product in products.items()
+                ]
+            )
+
+    def get_pack_names(self, competitor: str) -> Set[str]:
+        """Returns the names of the loaded packs of a competitor."""
+        with self._transaction() as connection:
+            rows = connection.execute('SELECT pack_name FROM packs WHERE competitor = ?', (competitor,)).fetchall()
+        return {row['pack_name'] for row in rows}
+
+    def update_packs(self, competitor: str, pack_names: Iterable[str], full_check: bool = False) -> None:
+        """Records the packs loaded for a competitor, replacing the stored packs after a full check, see `update_products`."""
+        with self._transaction() as connection:
+            if full_check:
+                connection.execute('DELETE FROM packs WHERE competitor = ?', (competitor,))
+                self._mark_checked(connection, competitor, 'packs')
+            connection.executemany(
+                'INSERT OR IGNORE INTO packs (competitor, pack_name) VALUES (?, ?)',
+                [(competitor, pack_name) for pack_name in pack_names]
+            )
+
+    def get_log_fingerprints(self, competitor: str) -> Set[str]:
+        """Returns the fingerprints of the loaded logs of a competitor, see `fingerprint_log`."""
+        with self._transaction() as connection:
+            rows = connection.execute('SELECT fingerprint FROM log_fingerprints WHERE competitor = ?', (competitor,)).fetchall()
+        return {row['fingerprint'] for row in rows}
+
+    def update_logs(self, competitor: str, fingerprints: Iterable[str]) -> None:
+        """Records the fingerprints of the logs loaded for a competitor."""
+        with self._transaction() as connection:
+            connection.executemany(
+                'INSERT OR IGNORE INTO log_fingerprints (competitor, fingerprint) VALUES (?, ?)',
+                [(competitor, fingerprint) for fingerprint in fingerprints]
+            )
+
+    def invalidate(self, competitor: str, table_names: Iterable[str]) -> None:
+        """Forgets the last full check of tables of a competitor, e.g. loaded without this store, so their next load checks the warehouse."""
+        with self._transaction() as connection:
+            connection.executemany(
+                'DELETE FROM checks WHERE competitor = ? AND table_name = ?', [(competitor, table_name) for table_name in table_names]
+            )
+
+    @staticmethod
+    def _mark_checked(connection: sqlite3.Connection, competitor: str, table_name: str) -> None:
+        """Records that a table of a competitor was reconciled with the warehouse."""
+        connection.execute(
+            'INSERT OR REPLACE INTO checks (competitor, table_name, checked_at) VALUES (?, ?, ?)', (competitor, table_name, time.time())
+        )
+
+    def log_drift(self, competitor: str, table_name: str, stored: Dict[str, Any], warehouse: Dict[str, Any]) -> int:
+        """Logs the rows of a table on which the store and the warehouse disagree, found by a full check.
+
+        Args:
+            competitor: The name of the competitor.
+            table_name: The name of the table.
+            stored: The rows of the store, keyed by natural key.
+            warehouse: The rows read from the warehouse, keyed by natural key.
+
+        Returns:
+            int: The number of keys missing from one side or with different values.
+        """
+        drift = sum(stored.get(key) != warehouse.get(key) for key in set(stored) | set(warehouse))
+        if not stored:
+            logging.info(f"Load state of {competitor} {table_name} built from the warehouse ({len(warehouse)} rows)")
+        elif drift:
+            logging.warning(f"Load state of {competitor} {table_name} drifted from the warehouse on {drift} rows, state rebuilt")
+        else:
+            logging.info(f"Load state of {competitor} {table_name} consistent with the warehouse ({len(warehouse)} rows)")
+        return drift
@@ -3,80 +3,24 @@ from airflow.decorators import dag
 from airflow.operators.python import PythonOperator
 from airflow.sensors.python import PythonSensor
 from airflow.sensors.time_delta import TimeDeltaSensor
-from airflow.operators.empty import EmptyOperator
 
 from bigquery import *
-import google.cloud.bigquery as bq
+from table_schemas import BQ_TABLE_LAYOUTS, BQ_TABLE_SCHEMAS
+from utils import CLEANED_FILE_FORMAT
 
-import os
-
-# Retrieve the Google Cloud service account key path from environment variables
-service_acc_key_path = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS")
-# Initialize the bigquery client with the service account key
-client = bq.Client.from_service_account_json(service_acc_key_path)
 
+# The warehouse client is built lazily by the tasks, see `bigquery.get_client`, never when the DAG file is parsed
 
 PROJECT_ID = 'arched-media-273319'
 DATASET_ID = 'competitors_dataset'
 TABLE_NAMES = ['competitors', 'products', 'features', 'product_prices', 'packs', 'logs']
 COMPETITORS = ['mobileviking', 'scarlet']
 FILE_NAMES = ['products', 'packs', 'logs']
-
-BQ_TABLE_SCHEMAS = {
-    "competitors": [
-        bq.SchemaField('competitor_uuid', 'STRING', mode='REQUIRED'),
-        bq.SchemaField('competitor_name', 'STRING', mode='REQUIRED'),
-        bq.SchemaField('created_at', 'DATETIME', mode='REQUIRED'),
-
-    ],
-
-    "products": [
-        bq.SchemaField('product_uuid', 'STRING', mode='REQUIRED'),
-        bq.SchemaField('product_name', 'STRING', mode='REQUIRED'),
-        bq.SchemaField('product_category', 'STRING', mode='REQUIRED'),
-        bq.SchemaField('competitor_name', 'STRING', mode='REQUIRED'),
-        bq.SchemaField('competitor_uuid', 'STRING', mode='REQUIRED'),
-        bq.SchemaField('feature_uuid', 'STRING', mode='REQUIRED'),
-        bq.SchemaField('scraped_at', 'DATETIME', mode='REQUIRED'),
-
-    ],
-    "features": [
-        bq.SchemaField('feature_uuid', 'STRING', mode='REQUIRED'),
-        bq.SchemaField('product_uuid', 'STRING', mode='REQUIRED'),
-        bq.SchemaField('product_name', 'STRING', mode='REQUIRED'),
-        bq.SchemaField('product_url', 'STRING', mode='REQUIRED'),
-        bq.SchemaField('scraped_at', 'DATETIME', mode='REQUIRED'),
-        bq.SchemaField('data', 'FLOAT', mode='NULLABLE'),
-        bq.SchemaField('minutes', 'FLOAT', mode='NULLABLE'),
-        bq.SchemaField('sms', 'INTEGER', mode='NULLABLE'),
-        bq.SchemaField('upload_speed', 'FLOAT', mode='NULLABLE'),
-        bq.SchemaField('download_speed', 'FLOAT', mode='NULLABLE'),
-
-    ],
-    "product_prices": [
-        bq.SchemaField('price_uuid', 'STRING', mode='REQUIRED'),
-        bq.SchemaField('feature_uuid', 'STRING', mode='REQUIRED'),
-        bq.SchemaField('price', 'FLOAT', mode='REQUIRED'),
-        bq.SchemaField('scraped_at', 'DATETIME', mode='REQUIRED'),
-    ],
-    "packs": [
-        bq.SchemaField('competitor_name', 'STRING', mode='REQUIRED'),
-        bq.SchemaField('pack_name', 'STRING', mode='REQUIRED'),
-        bq.SchemaField('pack_url', 'STRING', mode='REQUIRED'),
-        bq.SchemaField('pack_description', 'STRING', mode='NULLABLE'),
-        bq.SchemaField('price', 'FLOAT', mode='REQUIRED'),
-        bq.SchemaField('scraped_at', 'DATETIME', mode='REQUIRED'),
-        bq.SchemaField('mobile_product_name', 'STRING', mode='NULLABLE'),
-        bq.SchemaField('internet_product_name', 'STRING', mode='NULLABLE'),
-    ],
-    "logs": [
-        bq.SchemaField('competitor_name', 'STRING', mode='REQUIRED'),
-        bq.SchemaField('scraped_at', 'DATETIME', mode='REQUIRED'),
-        bq.SchemaField('error_details', 'STRING', mode='NULLABLE'),
-        bq.SchemaField('status', 'STRING', mode='NULLABLE'),
-    ]
-
-}
+# 'diff' compares the cleaned data with the tables in Python, 'merge' upserts products and packs with MERGE statements
+LOAD_ENGINE = 'diff'
+# 'parquet' loads the typed Parquet files written by the clean DAG, for the staged files of the MERGE engine and the logs.
+# Set with CLEANED_FILE_FORMAT in utils.py, so the clean DAG writes the files the load DAG submits
+LOAD_FILE_FORMAT = CLEANED_FILE_FORMAT
 
 DEFAULT_DAG_ARGS = {
     'owner': 'admin',
@@ -102,9 +46,8 @@ def load_to_bigquery_dag():
 
     create_dataset = PythonOperator(
         task_id='create_dataset',
-        python_callable=create_dataset_if_not_exist,
+        python_callable=with_client(create_dataset_if_not_exist),
         op_kwargs={
-            "client": client,
             "project_id": PROJECT_ID,
             "dataset_id": DATASET_ID,
         },
@@ -112,76 +55,32 @@ def load_to_bigquery_dag():
 
     create_table = PythonOperator(
         task_id='create_table',
-        python_callable=create_table_if_not_exist,
+        python_callable=with_client(create_table_if_not_exist),
         op_kwargs={
-            "client": client,
             "project_id": PROJECT_ID,
             "dataset_id": DATASET_ID,
             "tables": TABLE_NAMES,
             "schemas": BQ_TABLE_SCHEMAS,
+            "layouts": BQ_TABLE_LAYOUTS,
         },
     )
 
-    # End tasks to set trigger rules
-    end_products = EmptyOperator(
-        task_id='end_products',
-        trigger_rule='all_done',
-    )
-
-    end_packs = EmptyOperator(
-        task_id='end_packs',
-        trigger_rule='all_done',
-    )
-
-    end_logs = EmptyOperator(
-        task_id='end_logs',
-        trigger_rule='all_done',
+    # Products, packs and logs of every competitor are loaded by one task, concurrently where they are independent
+    load_data = PythonOperator(
+        task_id='load_data',
+        python_callable=with_client(load_competitors_to_bq),
+        op_kwargs={
+            "project_id": PROJECT_ID,
+            "dataset_id": DATASET_ID,
+            "competitors": COMPETITORS,
+            "engine": LOAD_ENGINE,
+            "file_format": LOAD_FILE_FORMAT,
+            # Maximum number of tables loaded at the same time, defined with the HTTP pool it must fit in bigquery.py
+            "max_workers": LOAD_WORKERS,
+        },
     )
 
-    delay_task >> create_dataset >> create_table
-
-    # Iterate over each competitor to create a loading task for each table
-    for competitor in COMPETITORS:
-        load_products = PythonOperator(
-            task_id=f'load_products_{competitor}',
-            python_callable=load_products_to_bq,
-            op_kwargs={
-                "client": client,
-                "project_id": PROJECT_ID,
-                "dataset_id": DATASET_ID,
-                "competitor": competitor
-            },
-        )
-
-        create_table >> load_products >> end_products
-
-    for competitor in COMPETITORS:
-        load_packs = PythonOperator(
-            task_id=f'load_packs_{competitor}',
-            python_callable=load_packs_to_bq,
-            op_kwargs={
-                "client": client,
-                "project_id": PROJECT_ID,
-                "dataset_id": DATASET_ID,
-                "competitor": competitor
-            },
-        )
-
-        end_products >> load_packs >> end_packs
-
-    for competitor in COMPETITORS:
-        load_logs = PythonOperator(
-            task_id=f'load_logs_{competitor}',
-            python_callable=load_logs_to_bq,
-            op_kwargs={
-                "client": client,
-                "project_id": PROJECT_ID,
-                "dataset_id": DATASET_ID,
-                "competitor": competitor
-            },
-        )
-
-        end_packs >> load_logs >> end_logs
+    delay_task >> create_dataset >> create_table >> load_data
 
 
 load_job = load_to_bigquery_dag()
@@ -0,0 +1,188 @@
+import google.cloud.bigquery as bq
+from google.cloud.exceptions import NotFound
+from datetime import datetime
+import io
+import json
+import pyarrow.parquet as pq
+import sqlite3
+import threading
+import uuid
+from typing import Any, Dict, IO, Iterable, List, Optional, Union
+
+
+SQLITE_TYPES = {
+    'STRING': 'TEXT',
+    'DATETIME': 'TEXT',
+    'TIMESTAMP': 'TEXT',
+    'DATE': 'TEXT',
+    'FLOAT': 'REAL',
+    'INTEGER': 'INTEGER',
+    'BOOLEAN': 'INTEGER',
+}
+
+
+class LocalQueryJob:
+    """A finished query job of the local warehouse.
+
+    Attributes:
+        job_id (str): The ID of the job.
+        _rows (list): The rows returned by the query.
+    """
+
+    def __init__(self, rows: List[Dict[str, Any]]) -> None:
+        self.job_id = str(uuid.uuid4())
+        self._rows = rows
+
+    def result(self) -> List[Dict[str, Any]]:
+        """Returns the rows of the query, as dictionaries so they expose `items()` like BigQuery rows."""
+        return self._rows
+
+
+class LocalLoadJob:
+    """A finished load job of the local warehouse.
+
+    Attributes:
+        job_id (str): The ID of the job.
+        output_rows (int): The number of rows loaded.
+        output_bytes (int): The number of bytes read from the source file.
+        errors (list): The errors of the job, always None since failures raise.
+    """
+
+    def __init__(self, output_rows: int, output_bytes: int) -> None:
+        self.job_id = str(uuid.uuid4())
+        self.output_rows = output_rows
+        self.output_bytes = output_bytes
+        self.errors = None
+
+    def result(self) -> 'LocalLoadJob':
+        """Returns the job, load jobs are executed synchronously."""
+        return self
+
+
+class LocalClient:
+    """A file-backed SQLite warehouse exposing the subset of `bigquery.Client` used by the loader.
+
+    Each BigQuery table is stored as a SQLite table named `dataset_id.table_id`, so the backtick-quoted
+    table references of the loader queries resolve unchanged. BigQuery specific statements such as the
+    multi-statement MERGE script of `merge_products_to_bq` are not supported.
+
+    Attributes:
+        _path (str): The path of the SQLite database file.
+        _connection (sqlite3.Connection): The connection to the database.
+        _lock (threading.Lock): Lock serializing access to the connection across threads.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Initialize the LocalClient object with the path of the database file, created if it does not exist."""
+        self._path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute('CREATE TABLE IF NOT EXISTS _datasets (dataset_id TEXT PRIMARY KEY)')
+
+    @staticmethod
+    def _table_name(table_ref: Union[bq.TableReference, bq.Table]) -> str:
+        """Returns the quoted SQLite name of a table reference."""
+        return f'"{table_ref.dataset_id}.{table_ref.table_id}"'
+
+    def _table_exists(self, table_ref: Union[bq.TableReference, bq.Table]) -> bool:
+        """Checks if a table exists in the database."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                (f'{table_ref.dataset_id}.{table_ref.table_id}',)
+            ).fetchone()
+        return row is not None
+
+    def _create_table(self, table_ref: Union[bq.TableReference, bq.Table], schema: List[bq.SchemaField]) -> None:
+        """Creates a table from a BigQuery schema."""
+        columns = ', '.join(f'"{field.name}" {SQLITE_TYPES.get(field.field_type, "TEXT")}' for field in schema)
+        with self._lock, self._connection:
+            self._connection.execute(f'CREATE TABLE IF NOT EXISTS {self._table_name(table_ref)} ({columns})')
+
+    def _insert(self, table_ref: Union[bq.TableReference, bq.Table], rows: List[Dict[str, Any]]) -> None:
+        """Inserts rows into a table, keys missing from a row are stored as NULL."""
+        with self._lock:
+            columns = [column[1] for column in self._connection.execute(f'PRAGMA table_info({self._table_name(table_ref)})')]
+        placeholders = ', '.join('?' for _ in columns)
+        column_names = ', '.join(f'"{column}"' for column in columns)
+        values = [tuple(row.get(column) for column in columns) for row in rows]
+        with self._lock, self._connection:
+            self._connection.executemany(f'INSERT INTO {self._table_name(table_ref)} ({column_names}) VALUES ({placeholders})', values)
+
+    def get_dataset(self, dataset_ref: Union[bq.DatasetReference, bq.Dataset]) -> bq.Dataset:
+        """Returns a dataset, raises NotFound if it does not exist."""
+        with self._lock:
+            row = self._connection.execute('SELECT 1 FROM _datasets WHERE dataset_id = ?', (dataset_ref.dataset_id,)).fetchone()
+        if row is None:
+            raise NotFound(f'Dataset {dataset_ref.dataset_id} not found')
+        return bq.Dataset(bq.DatasetReference(dataset_ref.project, dataset_ref.dataset_id))
+
+    def create_dataset(self, dataset: bq.Dataset) -> bq.Dataset:
+        """Registers a dataset, tables of a dataset only share its name as prefix."""
+        with self._lock, self._connection:
+            self._connection.execute('INSERT OR IGNORE INTO _datasets (dataset_id) VALUES (?)', (dataset.dataset_id,))
+        return dataset
+
+    def get_table(self, table_ref: Union[bq.TableReference, bq.Table]) -> bq.Table:
+        """Returns a table, raises NotFound if it does not exist."""
+        if not self._table_exists(table_ref):
+            raise NotFound(f'Table {table_ref.table_id} not found')
+        return bq.Table(bq.TableReference(bq.DatasetReference(table_ref.project, table_ref.dataset_id), table_ref.table_id))
+
+    def create_table(self, table: bq.Table) -> bq.Table:
+        """Creates a table from its BigQuery schema."""
+        self._create_table(table, table.schema)
+        return table
+
+    def delete_table(self, table_ref: Union[bq.TableReference, bq.Table], not_found_ok: bool = False) -> None:
+        """Drops a table, raises NotFound if it does not exist unless not_found_ok is set."""
+        if not self._table_exists(table_ref):
+            if not_found_ok:
+                return
+            raise NotFound(f'Table {table_ref.table_id} not found')
+        with self._lock, self._connection:
+            self._connection.execute(f'DROP TABLE {self._table_name(table_ref)}')
+
+    def query(self, query: str, job_config: Optional[bq.QueryJobConfig] = None) -> LocalQueryJob:
+        """Runs a query, which must be valid in both BigQuery and SQLite."""
+        with self._lock:
+            rows = [dict(row) for row in self._connection.execute(query)]
+        return LocalQueryJob(rows)
+
+    def insert_rows_json(self, table_ref: Union[bq.TableReference, bq.Table], json_rows: List[Dict[str, Any]], row_ids: Optional[Iterable] = None) -> List[Dict[str, Any]]:
+        """Inserts rows into an existing table, the equivalent of a streaming insert."""
+        if not self._table_exists(table_ref):
+            raise NotFound(f'Table {table_ref.table_id} not found')
+        self._insert(table_ref, json_rows)
+        # Streaming inserts return the list of row errors, empty on success
+        return []
+
+    def load_table_from_file(self, file_obj: IO[bytes], destination: Union[bq.TableReference, bq.Table], job_config: Optional[bq.LoadJobConfig] = None) -> LocalLoadJob:
+        """Loads a NDJSON or Parquet file into a table, created from the job schema if it does not exist."""
+        job_config = job_config or bq.LoadJobConfig()
+        content = file_obj.read()
+
+        if job_config.source_format in (None, bq.SourceFormat.NEWLINE_DELIMITED_JSON):
+            rows = [json.loads(line) for line in content.decode('utf-8').splitlines() if line.strip()]
+        elif job_config.source_format == bq.SourceFormat.PARQUET:
+            # Timestamps are stored as ISO strings like the dates of the NDJSON files
+            rows = [
+                {key: value.isoformat() if isinstance(value, datetime) else value for key, value in row.items()}
+                for row in pq.read_table(io.BytesIO(content)).to_pylist()
+            ]
+        else:
+            raise NotImplementedError(f'Source format {job_config.source_format} is not supported by the local warehouse')
+
+        if not self._table_exists(destination):
+            if not job_config.schema:
+                raise NotFound(f'Table {destination.table_id} not found')
+            self._create_table(destination, job_config.schema)
+        elif job_config.write_disposition == bq.WriteDisposition.WRITE_TRUNCATE:
+            with self._lock, self._connection:
+                self._connection.execute(f'DELETE FROM {self._table_name(destination)}')
+
+        self._insert(destination, rows)
+
+        return LocalLoadJob(len(rows), len(content))
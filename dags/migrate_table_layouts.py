@@ -0,0 +1,110 @@
+import argparse
+from typing import Any, Dict, List
+
+import google.cloud.bigquery as bq
+from google.cloud.exceptions import NotFound
+
+from bigquery import apply_table_layout, get_client, get_existing_record, table_layout_matches
+from local_warehouse import LocalClient
+from table_schemas import BQ_TABLE_LAYOUTS, BQ_TABLE_SCHEMAS
+
+
+PROJECT_ID = 'arched-media-273319'
+DATASET_ID = 'competitors_dataset'
+
+
+def count_rows(client: bq.Client, dataset_id: str, table_id: str) -> int:
+    """Returns the number of rows of a table."""
+    return get_existing_record(client, f'SELECT COUNT(*) AS row_count FROM `{dataset_id}.{table_id}`')['row_count']
+
+
+def migrate_table(client: bq.Client, project_id: str, dataset_id: str, table_id: str, schema: List[bq.SchemaField], layout: Dict[str, Any]) -> None:
+    """Rebuild an existing table with the partitioning and clustering of its layout.
+
+    The partitioning of a BigQuery table cannot be changed in place, so the rows are copied into a new table
+    created with the layout, which replaces the table once both hold the same number of rows. The loads must
+    be paused during the migration, the table does not exist between its drop and the rename of the new table.
+
+    Args:
+        client: A BigQuery client.
+        project_id: The ID of the Google Cloud project.
+        dataset_id: The ID of the BigQuery dataset.
+        table_id: The ID of the table to migrate.
+        schema: The schema of the table.
+        layout: The layout of the table, see `table_schemas.BQ_TABLE_LAYOUTS`.
+
+    Raises:
+        RuntimeError: If the new table does not hold the rows of the table, which is then left untouched.
+    """
+    dataset_ref = bq.DatasetReference(project_id, dataset_id)
+    migrating_table_id = f'_migrating_{table_id}'
+    columns = ', '.join(field.name for field in schema)
+
+    client.delete_table(dataset_ref.table(migrating_table_id), not_found_ok=True)
+    client.create_table(apply_table_layout(bq.Table(dataset_ref.table(migrating_table_id), schema=schema), layout))
+    client.query(
+        f'INSERT INTO `{dataset_id}.{migrating_table_id}` ({columns}) SELECT {columns} FROM `{dataset_id}.{table_id}`'
+    ).result()
+
+    row_count = count_rows(client, dataset_id, table_id)
+    migrated_row_count = count_rows(client, dataset_id, migrating_table_id)
+    if migrated_row_count != row_count:
+        raise RuntimeError(f"Table {table_id} has {row_count} rows but {migrating_table_id} has {migrated_row_count}, migration aborted")
+
+    client.delete_table(dataset_ref.table(table_id))
+    client.query(f'ALTER TABLE `{dataset_id}.{migrating_table_id}` RENAME TO `{table_id}`').result()
+    print(f"Table {table_id} migrated ({row_count} rows).")
+
+
+def migrate_tables(client: bq.Client, project_id: str, dataset_id: str, tables: List[str], apply: bool = False) -> List[str]:
+    """Find the tables whose partitioning or clustering differs from their layout and migrate them.
+
+    Args:
+        client: A BigQuery client.
+        project_id: The ID of the Google Cloud project.
+        dataset_id: The ID of the BigQuery dataset.
+        tables: The IDs of the tables to check, keys of BQ_TABLE_LAYOUTS.
+        apply: Whether to migrate the tables, otherwise they are only listed.
+
+    Returns:
+        list: The IDs of the tables to migrate, or migrated if apply is set.
+    """
+    if isinstance(client, LocalClient):
+        print("The local warehouse has no partitioning or clustering, nothing to migrate.")
+        return []
+
+    dataset_ref = bq.DatasetReference(project_id, dataset_id)
+    tables_to_migrate = []
+
+    for table_id in tables:
+        layout = BQ_TABLE_LAYOUTS[table_id]
+        try:
+            table = client.get_table(dataset_ref.table(table_id))
+        except NotFound:
+            print(f"Table {table_id} does not exist, it is created with its layout by the load DAG.")
+            continue
+
+        if table_layout_matches(table, layout):
+            print(f"Table {table_id} already has its layout.")
+            continue
+
+        print(f"Table {table_id} is partitioned by {table.time_partitioning} and clustered by {table.clustering_fields}, expected {layout}.")
+        tables_to_migrate.append(table_id)
+        if apply:
+            migrate_table(client, project_id, dataset_id, table_id, BQ_TABLE_SCHEMAS[table_id], layout)
+
+    if tables_to_migrate and not apply:
+        print(f"Run with --apply to migrate {', '.join(tables_to_migrate)}.")
+
+    return tables_to_migrate
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Partition and cluster the warehouse tables created before their layout was declared.')
+    parser.add_argument('--project', default=PROJECT_ID, help='ID of the Google Cloud project.')
+    parser.add_argument('--dataset', default=DATASET_ID, help='ID of the BigQuery dataset.')
+    parser.add_argument('--tables', nargs='+', default=list(BQ_TABLE_LAYOUTS), choices=list(BQ_TABLE_LAYOUTS), help='Tables to migrate.')
+    parser.add_argument('--apply', action='store_true', help='Migrate the tables, otherwise only list those to migrate.')
+    args = parser.parse_args()
+
+    migrate_tables(get_client(), args.project, args.dataset, args.tables, args.apply)
@@ -0,0 +1,164 @@
+import hashlib
+import re
+from bs4 import BeautifulSoup
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+
+# Parser backends of BeautifulSoup, 'lxml' is C-backed and exposes the same selector API as the pure-Python 'html.parser'
+PARSERS = ('html.parser', 'lxml')
+
+
+# Content changing on every request without changing the offers: scripts, styles, comments, nonces,
+# integrity hashes, CSRF tokens, cache busting query strings, timestamps and long hexadecimal ids
+DYNAMIC_CONTENT_PATTERNS = [
+    re.compile(r'<script\b.*?</script\s*>', re.IGNORECASE | re.DOTALL),
+    re.compile(r'<style\b.*?</style\s*>', re.IGNORECASE | re.DOTALL),
+    re.compile(r'<noscript\b.*?</noscript\s*>', re.IGNORECASE | re.DOTALL),
+    re.compile(r'<!--.*?-->', re.DOTALL),
+    re.compile(r'\s(?:nonce|integrity|data-csrf|csrf-token|data-token)="[^"]*"', re.IGNORECASE),
+    re.compile(r'(<input\b[^>]*name="[^"]*(?:csrf|token)[^"]*"[^>]*value=")[^"]*', re.IGNORECASE),
+    re.compile(r'\?(?:v|ver|version|t|ts|cb|_)=[\w.-]+', re.IGNORECASE),
+    re.compile(r'\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?'),
+    re.compile(r'\b\d{10,13}\b'),
+    re.compile(r'\b[0-9a-f]{16,}\b', re.IGNORECASE),
+]
+WHITESPACE_PATTERN = re.compile(r'\s+')
+BETWEEN_TAGS_PATTERN = re.compile(r'>\s+<')
+
+
+def fingerprint_html(html: Union[str, bytes]) -> str:
+    """Returns the fingerprint of the content of a page, identical for pages differing only by dynamic content.
+
+    Args:
+        html: The HTML of the page.
+
+    Returns:
+        str: The SHA-256 hex digest of the normalized HTML.
+    """
+    if isinstance(html, bytes):
+        html = html.decode('utf-8', errors='replace')
+    for pattern in DYNAMIC_CONTENT_PATTERNS:
+        html = pattern.sub(lambda match: match.group(1) if pattern.groups else '', html)
+    html = WHITESPACE_PATTERN.sub(' ', BETWEEN_TAGS_PATTERN.sub('><', html))
+    return hashlib.sha256(html.encode('utf-8')).hexdigest()
+
+
+def parse_html(html: Union[str, bytes], parser: str = 'html.parser') -> BeautifulSoup:
+    """Parses HTML with a parser backend.
+
+    Args:
+        html: The HTML to parse.
+        parser: The parser backend, one of PARSERS.
+
+    Returns:
+        BeautifulSoup: The parse tree.
+    """
+    if parser not in PARSERS:
+        raise ValueError(f"Unknown parser '{parser}', expected one of {PARSERS}")
+    return BeautifulSoup(html, parser)
+
+
+class PageSnapshot:
+    """The HTML of a page in a given DOM state, parsed at most once.
+
+    Attributes:
+        url (str): The URL of the page.
+        html (str): The HTML content of the page.
+        state (str): The DOM state of the page, e.g. 'initial' or the state reached after clicking a toggle.
+        parser (str): The parser backend used to build the parse tree.
+        metadata (dict): How the page was loaded, e.g. the extractor, the navigation response and the clicks
+            leading to the DOM state, saved with the snapshot in record mode.
+        _soup (BeautifulSoup): The parse tree, built on first access.
+        _fingerprint (str): The fingerprint of the content, computed on first access.
+    """
+
+    def __init__(self, url: str, html: str, state: str = 'initial', parser: str = 'html.parser', metadata: Optional[Dict[str, Any]] = None) -> None:
+        """Initialize the PageSnapshot object with the URL, HTML content and DOM state of the page."""
+        self.url = url
+        self.html = html
+        self.state = state
+        self.parser = parser
+        self.metadata = metadata or {}
+        self._soup = None
+        self._fingerprint = None
+
+    @property
+    def soup(self) -> BeautifulSoup:
+        """Returns the parse tree of the page, shared by all the extractors reading the snapshot."""
+        if self._soup is None:
+            self._soup = parse_html(self.html, self.parser)
+        return self._soup
+
+    @property
+    def fingerprint(self) -> str:
+        """Returns the fingerprint of the page content, see `fingerprint_html`."""
+        if self._fingerprint is None:
+            self._fingerprint = fingerprint_html(self.html)
+        return self._fingerprint
+
+
+class SnapshotCache:
+    """Cache of the page snapshots of a run keyed by URL and DOM state.
+
+    Extractors reading the same page in the same state reuse a single navigation and a single parse.
+    With a recorder, every snapshot read by an extractor is also saved as a fixture of that extractor,
+    see `fixtures.FixtureRecorder`.
+    With a content state, extractors reuse their result of the last run on pages whose content did not
+    change, see `content_state.ContentState`.
+
+    Attributes:
+        parser (str): The parser backend of the snapshots loaded by the cache.
+        recorder (FixtureRecorder): Saves the snapshots read by the extractors, None outside record mode.
+        content_state (ContentState): The fingerprints and extraction results of the last run, None to always extract.
+        _snapshots (dict): The snapshots keyed by (url, state).
+    """
+
+    def __init__(self, parser: str = 'html.parser', recorder: Optional[Any] = None, content_state: Optional[Any] = None) -> None:
+        """Initialize an empty SnapshotCache object with the parser backend of its snapshots, an optional recorder and content state."""
+        self.parser = parser
+        self.recorder = recorder
+        self.content_state = content_state
+        self._snapshots: Dict[Tuple[str, str], PageSnapshot] = {}
+
+    def get(self, url: str, state: str = 'initial') -> Optional[PageSnapshot]:
+        """Returns the snapshot of a page in a DOM state, None if it was not taken yet."""
+        return self._snapshots.get((url, state))
+
+    def put(self, snapshot: PageSnapshot) -> PageSnapshot:
+        """Stores a snapshot, replacing any previous snapshot of the same page and state."""
+        self._snapshots[(snapshot.url, snapshot.state)] = snapshot
+        return snapshot
+
+    def get_or_load(self, url: str, load_page: Callable[[], Tuple[str, Dict[str, Any]]], state: str = 'initial') -> PageSnapshot:
+        """Returns the snapshot of a page in a DOM state, loading it with load_page on a cache miss.
+
+        Args:
+            url: The URL of the page.
+            load_page: Function returning the HTML of the page and the metadata of the load, only called on a cache miss.
+            state: The DOM state of the page.
+
+        Returns:
+            PageSnapshot: The snapshot of the page.
+        """
+        snapshot = self.get(url, state)
+        if snapshot is None:
+            html, metadata = load_page()
+            snapshot = self.put(PageSnapshot(url, html, state, self.parser, metadata))
+        return snapshot
+
+    def extract(self, snapshot: PageSnapshot, key: str, extract: Callable[[BeautifulSoup, str], Any]) -> Any:
+        """Runs an extractor on a snapshot, reusing its result of the last run if the page content did not change.
+
+        Args:
+            snapshot: The snapshot of the page.
+            key: The name of the extractor.
+            extract: The extractor, taking the parse tree and url of the page.
+
+        Returns:
+            Any: The result of the extractor.
+        """
+        if self.recorder is not None:
+            self.recorder.record(snapshot, key)
+        if self.content_state is None:
+            return extract(snapshot.soup, snapshot.url)
+        return self.content_state.extract(snapshot, key, extract)
@@ -0,0 +1,93 @@
+import logging
+import time
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Union
+from airflow import AirflowException
+from playwright.sync_api import Page
+from playwright.async_api import Page as AsyncPage
+
+
+# Default time in milliseconds a page is given to meet its readiness conditions
+DEFAULT_READY_TIMEOUT = 15000
+
+
+def get_readiness_waits(page: Union[Page, AsyncPage], readiness: Dict[str, Any]) -> List[Callable[[], Any]]:
+    """Builds the waits checking the readiness conditions of a page, shared by the sync and async APIs.
+
+    Args:
+        page (Page): The sync or async page to wait for.
+        readiness (dict): The conditions, see `wait_until_ready`.
+
+    Returns:
+        list: The waits in order, each returns an awaitable for an async page.
+    """
+    timeout = readiness.get('timeout', DEFAULT_READY_TIMEOUT)
+    waits = []
+    if readiness.get('load_state'):
+        waits.append(partial(page.wait_for_load_state, readiness['load_state'], timeout=timeout))
+    for selector in readiness.get('selectors', []):
+        waits.append(partial(page.wait_for_selector, selector, state='attached', timeout=timeout))
+    return waits
+
+
+def log_not_ready(page: Union[Page, AsyncPage], readiness: Dict[str, Any], start_time_seconds: float, error: Exception, logger: logging.Logger) -> AirflowException:
+    """Logs a page that did not meet its readiness conditions and returns the exception to raise."""
+    error_message = f"Page not ready after {time.time() - start_time_seconds:.3f}s: {page.url} | conditions: {readiness} | {str(error)}"
+    logger.error(error_message)
+    return AirflowException(error_message)
+
+
+def log_ready(page: Union[Page, AsyncPage], start_time_seconds: float, logger: logging.Logger) -> float:
+    """Logs a page that met its readiness conditions and returns the time waited in seconds."""
+    wait_time = time.time() - start_time_seconds
+    logger.info(f"Page ready in {wait_time:.3f}s: {page.url}")
+    return wait_time
+
+
+def wait_until_ready(page: Page, readiness: Optional[Dict[str, Any]], logger: Optional[logging.Logger] = None) -> float:
+    """Waits until a page meets the readiness conditions declared by an extractor, instead of sleeping a fixed time.
+
+    Args:
+        page (Page): The page to wait for.
+        readiness (dict): The conditions, with optional keys 'selectors' (list of CSS selectors that must be
+            attached to the DOM), 'load_state' ('load', 'domcontentloaded' or 'networkidle') and 'timeout' in ms.
+        logger (logging.Logger): Logger for recording the wait time, the root logger if None.
+
+    Returns:
+        float: The time waited in seconds.
+    """
+    logger = logger or logging.getLogger()
+    readiness = readiness or {}
+    start_time_seconds = time.time()
+
+    try:
+        for wait in get_readiness_waits(page, readiness):
+            wait()
+    except Exception as e:
+        raise log_not_ready(page, readiness, start_time_seconds, e, logger)
+
+    return log_ready(page, start_time_seconds, logger)
+
+
+async def wait_until_ready_async(page: AsyncPage, readiness: Optional[Dict[str, Any]], logger: Optional[logging.Logger] = None) -> float:
+    """Waits until a page of the async Playwright API meets its readiness conditions, see `wait_until_ready`.
+
+    Args:
+        page (Page): The async page to wait for.
+        readiness (dict): The conditions, with optional keys 'selectors', 'load_state' and 'timeout'.
+        logger (logging.Logger): Logger for recording the wait time, the root logger if None.
+
+    Returns:
+        float: The time waited in seconds.
+    """
+    logger = logger or logging.getLogger()
+    readiness = readiness or {}
+    start_time_seconds = time.time()
+
+    try:
+        for wait in get_readiness_waits(page, readiness):
+            await wait()
+    except Exception as e:
+        raise log_not_ready(page, readiness, start_time_seconds, e, logger)
+
+    return log_ready(page, start_time_seconds, logger)
@@ -0,0 +1,142 @@
+import logging
+from collections import Counter
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse
+from playwright.sync_api import BrowserContext, Request, Response, Route
+from playwright.async_api import BrowserContext as AsyncBrowserContext, Route as AsyncRoute
+
+
+# Requests not needed to read the text of the pages, e.g. images, fonts, videos and analytics tags
+DEFAULT_REQUEST_FILTER = {
+    'block_resource_types': ['image', 'media', 'font'],
+    'block_domains': [
+        'google-analytics.com',
+        'googletagmanager.com',
+        'doubleclick.net',
+        'facebook.net',
+        'hotjar.com',
+    ],
+}
+
+
+def match_domain(hostname: str, domain: str) -> bool:
+    """Checks if a hostname is a domain or one of its subdomains."""
+    return hostname == domain or hostname.endswith('.' + domain)
+
+
+class RequestFilter:
+    """Route interception layer aborting the requests of the pages not needed by the extractors.
+
+    A request is blocked when its resource type or domain is in a deny list, or when an allow list is set
+    and does not contain it. The navigation request of a page itself is never blocked.
+
+    Attributes:
+        block_resource_types (set): Resource types to block, e.g. 'image', 'media', 'font', 'stylesheet'.
+        allow_resource_types (set): Resource types to allow, all if empty.
+        block_domains (list): Domains to block, including their subdomains.
+        allow_domains (list): Domains to allow, including their subdomains, all if empty.
+        stats (Counter): The requests and bytes allowed and blocked during the run.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None) -> None:
+        """Initialize the RequestFilter object with the allow and deny lists of the scraper config."""
+        config = config or {}
+        self.block_resource_types = set(config.get('block_resource_types', []))
+        self.allow_resource_types = set(config.get('allow_resource_types', []))
+        self.block_domains = config.get('block_domains', [])
+        self.allow_domains = config.get('allow_domains', [])
+        self.stats = Counter()
+
+    @property
+    def enabled(self) -> bool:
+        """Checks if the filter has any rule, routing requests disables the browser cache so it is only set up if needed."""
+        return bool(self.block_resource_types or self.allow_resource_types or self.block_domains or self.allow_domains)
+
+    def should_block(self, request: Request) -> bool:
+        """Checks if a request must be aborted.
+
+        Args:
+            request (Request): The request of the page, from the sync or async Playwright API.
+
+        Returns:
+            bool: True if the request is blocked.
+        """
+        if request.is_navigation_request() and request.frame.parent_frame is None:
+            return False
+
+        resource_type = request.resource_type
+        hostname = urlparse(request.url).hostname or ''
+
+        if resource_type in self.block_resource_types:
+            return True
+        if self.allow_resource_types and resource_type not in self.allow_resource_types:
+            return True
+        if any(match_domain(hostname, domain) for domain in self.block_domains):
+            return True
+        if self.allow_domains and not any(match_domain(hostname, domain) for domain in self.allow_domains):
+            return True
+
+        return False
+
+    def _count_request(self, request: Request, blocked: bool) -> None:
+        """Counts a routed request in the stats of the run."""
+        status = 'blocked' if blocked else 'allowed'
+        self.stats[f'requests_{status}'] += 1
+        self.stats[f'requests_{status}:{request.resource_type}'] += 1
+
+    def _count_response(self, response: Response) -> None:
+        """Counts the bytes downloaded by an allowed request, from its Content-Length header when the server sends it."""
+        self.stats['bytes_downloaded'] += int(response.headers.get('content-length', 0) or 0)
+
+    def _route(self, route: Route) -> None:
+        """Aborts or continues a request of the sync Playwright API."""
+        blocked = self.should_block(route.request)
+        self._count_request(route.request, blocked)
+        if blocked:
+            route.abort('blockedbyclient')
+        else:
+            route.continue_()
+
+    async def _route_async(self, route: AsyncRoute) -> None:
+        """Aborts or continues a request of the async Playwright API."""
+        blocked = self.should_block(route.request)
+        self._count_request(route.request, blocked)
+        if blocked:
+            await route.abort('blockedbyclient')
+        else:
+            await route.continue_()
+
+    def apply(self, context: BrowserContext) -> BrowserContext:
+        """Filters the requests of all the pages opened in a context of the sync Playwright API."""
+        if self.enabled:
+            context.route('**/*', self._route)
+            context.on('response', self._count_response)
+        return context
+
+    async def apply_async(self, context: AsyncBrowserContext) -> AsyncBrowserContext:
+        """Filters the requests of all the pages opened in a context of the async Playwright API."""
+        if self.enabled:
+            await context.route('**/*', self._route_async)
+            context.on('response', self._count_response)
+        return context
+
+    def log_stats(self, logger: Optional[logging.Logger] = None) -> Dict[str, int]:
+        """Logs the requests blocked and allowed and the bytes downloaded during the run.
+
+        Bytes of blocked requests are never downloaded, compare `bytes_downloaded` with a run without filter
+        to measure the bandwidth saved.
+
+        Args:
+            logger (logging.Logger): Logger for recording the stats, the root logger if None.
+
+        Returns:
+            dict: The stats of the run.
+        """
+        logger = logger or logging.getLogger()
+        stats = dict(self.stats)
+        blocked_by_type = {key.split(':', 1)[1]: count for key, count in stats.items() if key.startswith('requests_blocked:')}
+        logger.info(
+            f"Request filter: {stats.get('requests_blocked', 0)} requests blocked {blocked_by_type} | "
+            f"{stats.get('requests_allowed', 0)} requests allowed | {stats.get('bytes_downloaded', 0) / 1024:.0f} KiB downloaded"
+        )
+        return stats
@@ -1,49 +1,112 @@
 from playwright.sync_api import sync_playwright
 import re
 import time
-from bs4 import BeautifulSoup
 from datetime import date
 import logging
 import traceback
-import requests
 from airflow import AirflowException
+from readiness import wait_until_ready
 from utils import *
+from page_snapshot import PageSnapshot, SnapshotCache, parse_html
+from fixtures import get_recorder
+from request_filter import DEFAULT_REQUEST_FILTER, RequestFilter
+from browser_server import get_browser
+from http_cache import get_http_cache
+from content_state import ContentState
+from storage_state import StorageState, has_stored_consent, mark_consent_accepted
 
 
 URL = {
     'mobile_subscription': 'https://www.scarlet.be/en/abonnement-gsm.html',
     'option_mobile_subscription': 'https://www.scarlet.be/en/abonnement-gsm.html',
     'internet_subscription': 'https://www.scarlet.be/en/abonnement-internet.html',
-    'packs': 'https://www.scarlet.be/en/packs.html'
+    'packs': 'https://www.scarlet.be/en/packs.html',
+    'options_streaming_trio': 'https://www.scarlet.be/en/homepage/packs/trio_packs/trio_pack',
+    'options_streaming_trio_mobile': 'https://www.scarlet.be/en/homepage/packs/all_packs_arc_dof/trio_mobile',
+    'options_tv': 'https://www.scarlet.be/en/tv-digitale.html'
+}
+
+# Conditions each extractor needs before reading the page content
+READINESS = {
+    # The options are read from the mobile subscription page snapshot, so it also waits for them
+    'mobile_subscription': {'selectors': ['div.rs-ctable-panel.jsrs-resizerContainer', 'span.rs-unit', 'div.rs-checkbox']},
+    'options': {'selectors': ['div.rs-checkbox']},
+    'internet_subscription': {'selectors': ['h3.rs-ctable-panel-title', 'ul.rs-ctable-nobulletlist', 'span.rs-unit']},
+    'options_streaming': {'selectors': ['div.rs-sbox-with-extracontent span.rs-decimal']},
+    'options_tv': {'selectors': ['div.rs-panel-flex-cell-big .jsrs-resizerPart']},
+}
+
+# Probe each url with a HEAD request before navigating, the navigation response is always checked
+PROBE_URLS = False
+
+# Allow and deny lists by resource type and domain of the requests of the pages, see request_filter.py
+REQUEST_FILTER = DEFAULT_REQUEST_FILTER
+
+# Parser backend of BeautifulSoup, 'html.parser' or 'lxml', run benchmark_extractors.py to compare them
+PARSER = 'html.parser'
+
+# 'static' fetches the page of an extractor with a plain HTTP request, 'browser' renders it with Chromium.
+# Run fetch_strategy.py to check which pages are not rendered by JavaScript.
+FETCH_STRATEGY = {
+    'mobile_subscription': 'browser',
+    'options': 'browser',
+    'internet_subscription': 'browser',
+    'options_streaming': 'browser',
+    'options_tv': 'browser',
 }
 
 
-def navigate(browser, url):
-    check_request(url)
+def navigate(browser, url, readiness=None):
+    """Open the url, accept the cookies and wait until the page meets the readiness conditions, returns the page and its navigation response"""
+    if PROBE_URLS:
+        check_request(url)
 
     page = browser.new_page()
     logging.info(f"Navigating to URL: {url}")
-    page.goto(url, wait_until='domcontentloaded')
-    time.sleep(5)
+    start_time_seconds = time.time()
+    response = page.goto(url, wait_until='domcontentloaded')
+    load_time = time.time() - start_time_seconds
+    check_response(response, url, load_time)
     try:
-        page.wait_for_selector('#onetrust-accept-btn-handler')
-        page.query_selector('#onetrust-accept-btn-handler').click(force=True)
-
-        return page
+        # The cookie consent saved by a previous run is loaded in the context, so the banner is not shown
+        if not has_stored_consent(page.context):
+            page.wait_for_selector('#onetrust-accept-btn-handler')
+            page.query_selector('#onetrust-accept-btn-handler').click(force=True)
+            mark_consent_accepted(page.context)
 
     except Exception as e:
         error_message = f"Accept cookie button error: {str(e)}"
         logging.error(error_message)
         raise AirflowException(error_message)
 
+    wait_until_ready(page, readiness)
+
+    return page, response_metadata(response, load_time)
+
 
-def extract_mobile_subscription_data(page_content, url):
+def load_page_content(browser, url, extractor):
+    """function to load the page content of an extractor with its fetch strategy, returns the content and the metadata of the load"""
+    if FETCH_STRATEGY[extractor] == 'static':
+        return fetch_static_page(url), {'extractor': extractor, 'fetch': 'static'}
+
+    page, response = navigate(browser, url, READINESS[extractor])
+    page_content = page.content()
+    page.close()
+
+    return page_content, {'extractor': extractor, 'fetch': 'browser', 'response': response}
+
+
+def get_page_snapshot(browser, url, extractor, snapshots):
+    """function to get the snapshot of a page, only loaded and parsed once for all the extractors reading it"""
+    return snapshots.get_or_load(url, lambda: load_page_content(browser, url, extractor))
+
+
+def extract_mobile_subscription_data(soup, url):
 
     mobile_subscription_data = []
     date = time.strftime("%Y-%m-%d")
 
     try:
-        soup = BeautifulSoup(page_content, 'html.parser')
         mobile_subscription_elements = soup.find_all('div', class_="rs-ctable-panel jsrs-resizerContainer")
 
         for element in mobile_subscription_elements:
@@ -79,9 +142,7 @@ def extract_mobile_subscription_data(page_content, url):
         raise AirflowException(error_message)
 
 
-def extract_internet_subscription_data(page_content, url):
-    soup = BeautifulSoup(page_content, 'html.parser')
-
+def extract_internet_subscription_data(soup, url):
     try:
         internet_data = []
         tables = soup.find_all('div', class_='small-12 medium-6 large-6 columns')
@@ -116,12 +177,11 @@ def extract_internet_subscription_data(page_content, url):
         raise AirflowException(error_message)
 
 
-def extract_options_data(page_content, url):
+def extract_options_data(soup, url):
     """function to extract options data for extra internet"""
     options_data = []
     date = time.strftime("%Y-%m-%d")
     try:
-        soup = BeautifulSoup(page_content, 'html.parser')
         options_data_element = soup.find('div', class_="rs-checkbox")
 
         option_info = options_data_element.get_text().replace('Option:', '').strip()
@@ -147,49 +207,43 @@ def extract_options_data(page_content, url):
         raise AirflowException(error_message)
 
 
-def get_mobile_subscription_data(browser, url):
+def get_mobile_subscription_data(browser, url, snapshots):
     """function to load content from the page and extract data"""
-    page = navigate(browser, url)
-    time.sleep(5)
-    page_content = page.content()
+    snapshot = get_page_snapshot(browser, url, 'mobile_subscription', snapshots)
     logging.info(f"Extracting mobile subscription data from URL: {url}")
-    mobile_subscription_data = extract_mobile_subscription_data(page_content, url)
+    mobile_subscription_data = snapshots.extract(snapshot, 'mobile_subscription', extract_mobile_subscription_data)
 
-    page.close()
     return mobile_subscription_data
 
 
-def get_internet_subscription_data(browser, url):
+def get_internet_subscription_data(browser, url, snapshots):
     """function to load content from the page and extract data"""
-    page = navigate(browser, url)
-    time.sleep(5)
-    page_content = page.content()
+    snapshot = get_page_snapshot(browser, url, 'internet_subscription', snapshots)
     logging.info(f"Extracting internet subscription data from URL: {url}")
-    internet_subscription_data = extract_internet_subscription_data(page_content, url)
-    page.close()
+    internet_subscription_data = snapshots.extract(snapshot, 'internet_subscription', extract_internet_subscription_data)
 
     return internet_subscription_data
 
 
-def get_options_data(browser, url):
+def get_options_data(browser, url, snapshots):
     """function to load content from the page and extract data"""
-    page = navigate(browser, url)
-    time.sleep(5)
-    page_content = page.content()
+    snapshot = get_page_snapshot(browser, url, 'options', snapshots)
     logging.info(f"Extracting options data from URL: {url}")
-    options_data = extract_options_data(page_content, url)
+    options_data = snapshots.extract(snapshot, 'options', extract_options_data)
 
-    page.close()
     return options_data
 
 
-def get_products(browser, url):
-    mobile_subscription_data = get_mobile_subscription_data(browser, url['mobile_subscription'])
-    options_data = get_options_data(browser, url['option_mobile_subscription'])
-    internet_subscription_data = get_internet_subscription_data(browser, url['internet_subscription'])
-    options_dict_trio = get_options_streaming(browser, "https://www.scarlet.be/en/homepage/packs/trio_packs/trio_pack")
-    options_dict__trio_mobile = get_options_streaming(browser, "https://www.scarlet.be/en/homepage/packs/all_packs_arc_dof/trio_mobile")
-    tv_options = get_options_tv(browser, "https://www.scarlet.be/en/tv-digitale.html")
+def get_products(browser, url, content_state=None):
+    # Pages read by several extractors, such as the mobile subscription page, are loaded and parsed once,
+    # pages unchanged since the last run reuse its extraction results
+    snapshots = SnapshotCache(PARSER, get_recorder('scarlet'), content_state)
+    mobile_subscription_data = get_mobile_subscription_data(browser, url['mobile_subscription'], snapshots)
+    options_data = get_options_data(browser, url['option_mobile_subscription'], snapshots)
+    internet_subscription_data = get_internet_subscription_data(browser, url['internet_subscription'], snapshots)
+    options_dict_trio = get_options_streaming(browser, url['options_streaming_trio'], snapshots)
+    options_dict__trio_mobile = get_options_streaming(browser, url['options_streaming_trio_mobile'], snapshots)
+    tv_options = get_options_tv(browser, url['options_tv'], snapshots)
 
     packs_data_1 = scarlet_trio()
     packs_data_2 = scarlet_trio_mobile()
@@ -212,14 +266,8 @@ def get_products(browser, url):
     return product_dict, options_dict, packs_dict
 
 
-def scarlet_trio():
+def extract_trio_pack(soup, url):
     packs = {}
-    url = 'https://www.scarlet.be/en/packs/trio.html'
-
-    session = requests.Session()
-    response = session.get(url)
-    time.sleep(5)
-    soup = BeautifulSoup(response.content, "html.parser")
     internet_speed = soup.find_all("h3", class_="rs-mediabox-title")
     pack_name = soup.find("h1").get_text().lower().replace(' ', '_')
     pack_description = soup.find_all("p")
@@ -251,96 +299,59 @@ def scarlet_trio():
 
     pack_description = (f"{pack_desc} {pack_desc1} Internet info: Upload speed:{upload_speed}, Download speed:{download_speed}, Data:{internet_data}")
 
-    today = date.today()
-    today = today.strftime("%Y-%m-%d")
-
     packs['competitor_name'] = 'scarlet'
     packs['pack_name'] = pack_name
     packs['pack_url'] = url
     packs['pack_description'] = pack_description.encode('ascii', 'ignore').decode('ascii')
     packs['price'] = float(price)
-    packs['scraped_at'] = today
     # packs["mobile_product_name"] = None
     # packs["internet_product_name"] = None
 
     return packs
 
 
-def scarlet_trio_mobile():
-    packs = {}
-
-    url = 'https://www.scarlet.be/en/packs/trio-mobile.html?#/OurTrioMobile'
-
-    session = requests.Session()
-    response = session.get(url)
-    time.sleep(5)
-    soup = BeautifulSoup(response.content, "html.parser")
-    internet_speed = soup.find_all("h3", class_="rs-mediabox-title")
-    pack_name = soup.find("h1").get_text().lower().replace(' ', '_')
-    pack_description = soup.find_all("p")
-    price = soup.find(class_="rs-unit").get_text()
-
-    for i in pack_description:
-        if i.find_parent(class_="panel rs-emphasis-light rs-usp"):
-            pack_desc = i.get_text()
-        elif i.find("strong"):
-            pack_desc1 = i.get_text()
-            break
-        else:
-            continue
-
-    for i in internet_speed:
-        if 'download' in i.get_text():
-            download_speed = ''.join(filter(str.isdigit, i.get_text()))
-            download_speed = int(download_speed)
+def get_trio_pack(url):
+    """function to get a trio pack, reusing the previous extraction while the page is not modified"""
+    recorder = get_recorder('scarlet')
+    if recorder is not None:
+        # In record mode the page is fetched past the HTTP cache, so every run records its fixture
+        snapshot = PageSnapshot(url, fetch_static_page(url), parser=PARSER, metadata={'fetch': 'static'})
+        recorder.record(snapshot, 'trio_pack')
+        packs = extract_trio_pack(snapshot.soup, url)
+    else:
+        packs = dict(get_http_cache().extract(url, 'trio_pack', lambda page_content: extract_trio_pack(parse_html(page_content, PARSER), url)))
 
-        elif 'upload' in i.get_text():
-            upload_speed = ''.join(filter(str.isdigit, i.get_text()))
-            upload_speed = int(upload_speed)
+    today = date.today()
+    packs['scraped_at'] = today.strftime("%Y-%m-%d")
 
-        elif 'Unlimited' in i.get_text():
-            internet_data = -1
-        else:
-            continue
+    return packs
 
-    pack_description = (f"{pack_desc} {pack_desc1} Internet info: Upload speed:{upload_speed}, Download speed:{download_speed}, Data:{internet_data}")
 
-    today = date.today()
-    today = today.strftime("%Y-%m-%d")
+def scarlet_trio():
+    return get_trio_pack('https://www.scarlet.be/en/packs/trio.html')
 
-    packs['competitor_name'] = 'scarlet'
-    packs['pack_name'] = pack_name
-    packs['pack_url'] = url
-    packs['pack_description'] = pack_description.encode('ascii', 'ignore').decode('ascii')
-    packs['price'] = float(price)
-    packs['scraped_at'] = today
-    # packs["mobile_product_name"] = None
-    # packs["internet_product_name"] = None
 
-    return packs
+def scarlet_trio_mobile():
+    return get_trio_pack('https://www.scarlet.be/en/packs/trio-mobile.html?#/OurTrioMobile')
 
 
-def get_options_streaming(browser, url):
-    page = navigate(browser, url)
-    time.sleep(5)
-    page_content = page.content()
+def get_options_streaming(browser, url, snapshots):
+    snapshot = get_page_snapshot(browser, url, 'options_streaming', snapshots)
 
-    options_data = extract_options_streaming(page_content, url)
+    options_data = snapshots.extract(snapshot, 'options_streaming', extract_options_streaming)
 
-    page.close()
     return options_data
 
 
-def extract_options_streaming(page_content, url):
+def extract_options_streaming(soup, url):
     options_data = []
     today = date.today()
     today = today.strftime("%Y-%m-%d")
     try:
-        soup = BeautifulSoup(page_content, 'html.parser')
-        pack_list = soup.find_all("span")
+        # The pack name is the last span inside an anchor pointing to "#"
+        pack_list = soup.select('a[href="#"] span')
         for i in pack_list:
-            if i.find_parent('a', href="#"):
-                pack_name = i.get_text().lower().replace(' ', '_')
+            pack_name = i.get_text().lower().replace(' ', '_')
         detail_list = soup.find_all("div", class_="rs-sbox rs-sbox-with-topimage rs-sbox-with-extracontent")
         for i in detail_list:
             titles = i.find("span", class_="rs-sbox-title")
@@ -361,24 +372,19 @@ def extract_options_streaming(page_content, url):
         raise AirflowException(error_message)
 
 
-def get_options_tv(browser, url):
-    time.sleep(5)
-    page = navigate(browser, url)
-    time.sleep(5)
-    page_content = page.content()
+def get_options_tv(browser, url, snapshots):
+    snapshot = get_page_snapshot(browser, url, 'options_tv', snapshots)
 
-    options_data_tv = extract_options_tv(page_content, url)
+    options_data_tv = snapshots.extract(snapshot, 'options_tv', extract_options_tv)
 
-    page.close()
     return options_data_tv
 
 
-def extract_options_tv(page_content, url):
+def extract_options_tv(soup, url):
     options_data = []
     today = date.today()
     today = today.strftime("%Y-%m-%d")
     try:
-        soup = BeautifulSoup(page_content, 'html.parser')
         details = soup.find_all("div", class_="rs-panel-flex-cell-big rs-bg-grey2")
 
         for i in details:
@@ -411,18 +417,23 @@ def scarlet_scraper():
         logging.basicConfig(filename=log_file_path, level=logging.INFO, format=log_format)
         logging.info(f"=========== scarlet_scraper start: {start_time} ===========")
 
-        browser = p.chromium.launch(headless=True)
+        browser = None
+        context = None
+        request_filter = RequestFilter(REQUEST_FILTER)
+        storage_state = StorageState('scarlet')
+        content_state = ContentState('scarlet')
         try:
-            product_dict, options_dict, packs_dict = get_products(browser, URL)
-            # list_product = [product_dict]
-            # list_options = [options_dict]
-            # list_packs = [packs_dict]
-            save_to_json(product_dict, 'scarlet', 'products')
-            save_to_json(options_dict, 'scarlet', 'options')
-            save_to_json(packs_dict, 'scarlet', 'packs')
-            # save_to_ndjson(list_product, 'scarlet', 'products')
-            # save_to_ndjson(list_options, 'scarlet', 'options')
-            # save_to_ndjson(list_packs, 'scarlet', 'packs')
+            # Only launch Chromium if a page is not fetched statically
+            if 'browser' in FETCH_STRATEGY.values():
+                browser = get_browser(p, 'scarlet')
+                # Pages are opened in a context filtering the requests not needed by the extractors
+                context = request_filter.apply(storage_state.new_context(browser))
+
+            product_dict, options_dict, packs_dict = get_products(context, URL, content_state)
+            save_to_ndjson(product_dict['products'], 'scarlet', 'products')
+            save_to_ndjson(options_dict['options'], 'scarlet', 'options')
+            save_to_ndjson(packs_dict['packs'], 'scarlet', 'packs')
+            content_state.save_pages()
 
         except Exception as e:
             error_message = f"Error in scarlet_scraper function: {str(e)}"
@@ -432,7 +443,11 @@ def scarlet_scraper():
             raise AirflowException(error_message)
 
         finally:
-            browser.close()
+            get_http_cache().log_stats()
+            if browser is not None:
+                request_filter.log_stats()
+                storage_state.save(context)
+                browser.close()
 
             end_time_seconds = time.time()
             execution_time_message = "scarlet_scraper execution time: {:.3f}s".format(end_time_seconds - start_time_seconds)
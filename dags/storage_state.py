@@ -0,0 +1,86 @@
+import logging
+import os
+import time
+import weakref
+from typing import Any, Dict
+from playwright.sync_api import Browser, BrowserContext
+from playwright.async_api import Browser as AsyncBrowser, BrowserContext as AsyncBrowserContext
+
+
+# Directory of the storage state (cookies and localStorage) of the browser context of each competitor
+STORAGE_STATE_DIR = 'data/browser_state'
+
+# Age in days after which a saved storage state is discarded, so the cookie consent is renewed before it expires
+STORAGE_STATE_MAX_AGE_DAYS = 7
+
+# Storage state of the contexts created by a StorageState, looked up from the pages of the contexts
+_CONTEXT_STATES = weakref.WeakKeyDictionary()
+
+
+class StorageState:
+    """The storage state of the browser context of a competitor, saved to disk between runs.
+
+    A warm run loads the cookie consent saved by a previous run in its context, so the pages skip the
+    cookie banner. A cold run accepts the banner and saves the storage state when its context is closed.
+
+    Attributes:
+        path (str): The path of the storage state file.
+        warm (bool): Whether a fresh storage state was saved by a previous run.
+        consent_accepted (bool): Whether a cookie banner was accepted during the run.
+    """
+
+    def __init__(self, competitor: str, state_dir: str = STORAGE_STATE_DIR, max_age_days: float = STORAGE_STATE_MAX_AGE_DAYS) -> None:
+        """Initialize the StorageState object of a competitor, warm if its state file is younger than max_age_days."""
+        self.path = os.path.join(state_dir, f'{competitor}.json')
+        self.warm = os.path.exists(self.path) and time.time() - os.path.getmtime(self.path) < max_age_days * 86400
+        self.consent_accepted = False
+
+    def _context_options(self) -> Dict[str, Any]:
+        """Returns the options loading the saved storage state in a new context."""
+        return {'storage_state': self.path} if self.warm else {}
+
+    def new_context(self, browser: Browser, **kwargs: Any) -> BrowserContext:
+        """Creates a context of the sync Playwright API with the saved storage state."""
+        context = browser.new_context(**self._context_options(), **kwargs)
+        _CONTEXT_STATES[context] = self
+        logging.info(f"Browser context created {'with' if self.warm else 'without'} saved storage state {self.path}")
+        return context
+
+    async def new_context_async(self, browser: AsyncBrowser, **kwargs: Any) -> AsyncBrowserContext:
+        """Creates a context of the async Playwright API with the saved storage state."""
+        context = await browser.new_context(**self._context_options(), **kwargs)
+        _CONTEXT_STATES[context] = self
+        logging.info(f"Browser context created {'with' if self.warm else 'without'} saved storage state {self.path}")
+        return context
+
+    def _should_save(self) -> bool:
+        """Checks if the storage state must be saved, only after a cold run accepted the cookie consent."""
+        if self.warm or not self.consent_accepted:
+            return False
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        return True
+
+    def save(self, context: BrowserContext) -> None:
+        """Saves the storage state of a context of the sync Playwright API."""
+        if self._should_save():
+            context.storage_state(path=self.path)
+            logging.info(f"Storage state saved to {self.path}")
+
+    async def save_async(self, context: AsyncBrowserContext) -> None:
+        """Saves the storage state of a context of the async Playwright API."""
+        if self._should_save():
+            await context.storage_state(path=self.path)
+            logging.info(f"Storage state saved to {self.path}")
+
+
+def has_stored_consent(context: Any) -> bool:
+    """Checks if a context was created with a saved cookie consent, so its pages do not show the cookie banner."""
+    state = _CONTEXT_STATES.get(context)
+    return state is not None and state.warm
+
+
+def mark_consent_accepted(context: Any) -> None:
+    """Records that a cookie banner was accepted in a context, so its storage state is saved when closed."""
+    state = _CONTEXT_STATES.get(context)
+    if state is not None:
+        state.consent_accepted = True
@@ -0,0 +1,109 @@
+import google.cloud.bigquery as bq
+
+
+BQ_TABLE_SCHEMAS = {
+    "competitors": [
+        bq.SchemaField('competitor_uuid', 'STRING', mode='REQUIRED'),
+        bq.SchemaField('competitor_name', 'STRING', mode='REQUIRED'),
+        bq.SchemaField('created_at', 'DATETIME', mode='REQUIRED'),
+
+    ],
+
+    "products": [
+        bq.SchemaField('product_uuid', 'STRING', mode='REQUIRED'),
+        bq.SchemaField('product_name', 'STRING', mode='REQUIRED'),
+        bq.SchemaField('product_category', 'STRING', mode='REQUIRED'),
+        bq.SchemaField('competitor_name', 'STRING', mode='REQUIRED'),
+        bq.SchemaField('competitor_uuid', 'STRING', mode='REQUIRED'),
+        bq.SchemaField('feature_uuid', 'STRING', mode='REQUIRED'),
+        bq.SchemaField('scraped_at', 'DATETIME', mode='REQUIRED'),
+
+    ],
+    "features": [
+        bq.SchemaField('feature_uuid', 'STRING', mode='REQUIRED'),
+        bq.SchemaField('product_uuid', 'STRING', mode='REQUIRED'),
+        bq.SchemaField('product_name', 'STRING', mode='REQUIRED'),
+        bq.SchemaField('product_url', 'STRING', mode='REQUIRED'),
+        bq.SchemaField('scraped_at', 'DATETIME', mode='REQUIRED'),
+        bq.SchemaField('data', 'FLOAT', mode='NULLABLE'),
+        bq.SchemaField('minutes', 'FLOAT', mode='NULLABLE'),
+        bq.SchemaField('sms', 'INTEGER', mode='NULLABLE'),
+        bq.SchemaField('upload_speed', 'FLOAT', mode='NULLABLE'),
+        bq.SchemaField('download_speed', 'FLOAT', mode='NULLABLE'),
+
+    ],
+    "product_prices": [
+        bq.SchemaField('price_uuid', 'STRING', mode='REQUIRED'),
+        bq.SchemaField('feature_uuid', 'STRING', mode='REQUIRED'),
+        bq.SchemaField('price', 'FLOAT', mode='REQUIRED'),
+        bq.SchemaField('scraped_at', 'DATETIME', mode='REQUIRED'),
+    ],
+    "packs": [
+        bq.SchemaField('competitor_name', 'STRING', mode='REQUIRED'),
+        bq.SchemaField('pack_name', 'STRING', mode='REQUIRED'),
+        bq.SchemaField('pack_url', 'STRING', mode='REQUIRED'),
+        bq.SchemaField('pack_description', 'STRING', mode='NULLABLE'),
+        bq.SchemaField('price', 'FLOAT', mode='REQUIRED'),
+        bq.SchemaField('scraped_at', 'DATETIME', mode='REQUIRED'),
+        bq.SchemaField('mobile_product_name', 'STRING', mode='NULLABLE'),
+        bq.SchemaField('internet_product_name', 'STRING', mode='NULLABLE'),
+    ],
+    "logs": [
+        bq.SchemaField('competitor_name', 'STRING', mode='REQUIRED'),
+        bq.SchemaField('scraped_at', 'DATETIME', mode='REQUIRED'),
+        bq.SchemaField('error_details', 'STRING', mode='NULLABLE'),
+        bq.SchemaField('status', 'STRING', mode='NULLABLE'),
+    ]
+
+}
+
+# Schemas of the cleaned files staged by the MERGE engine, sms is staged as FLOAT since unlimited is scraped as -1.0
+STAGING_SCHEMAS = {
+    "products": [
+        bq.SchemaField('product_name', 'STRING', mode='REQUIRED'),
+        bq.SchemaField('competitor_name', 'STRING', mode='REQUIRED'),
+        bq.SchemaField('product_category', 'STRING', mode='REQUIRED'),
+        bq.SchemaField('product_url', 'STRING', mode='REQUIRED'),
+        bq.SchemaField('price', 'FLOAT', mode='REQUIRED'),
+        bq.SchemaField('scraped_at', 'DATETIME', mode='REQUIRED'),
+        bq.SchemaField('data', 'FLOAT', mode='NULLABLE'),
+        bq.SchemaField('minutes', 'FLOAT', mode='NULLABLE'),
+        bq.SchemaField('sms', 'FLOAT', mode='NULLABLE'),
+        bq.SchemaField('upload_speed', 'FLOAT', mode='NULLABLE'),
+        bq.SchemaField('download_speed', 'FLOAT', mode='NULLABLE'),
+        # Uuids of the rows a product may add, computed by `bigquery.make_row_uuids` when the products are staged
+        bq.SchemaField('competitor_uuid', 'STRING', mode='REQUIRED'),
+        bq.SchemaField('product_uuid', 'STRING', mode='REQUIRED'),
+        bq.SchemaField('feature_uuid', 'STRING', mode='REQUIRED'),
+        bq.SchemaField('price_uuid', 'STRING', mode='REQUIRED'),
+    ],
+    "packs": [
+        bq.SchemaField('competitor_name', 'STRING', mode='REQUIRED'),
+        bq.SchemaField('pack_name', 'STRING', mode='REQUIRED'),
+        bq.SchemaField('pack_url', 'STRING', mode='REQUIRED'),
+        bq.SchemaField('pack_description', 'STRING', mode='NULLABLE'),
+        bq.SchemaField('price', 'FLOAT', mode='REQUIRED'),
+        bq.SchemaField('scraped_at', 'DATETIME', mode='REQUIRED'),
+    ],
+}
+
+# Schemas of the typed cleaned files written as Parquet, the products and packs, the products with the uuids
+# of their rows staged by the MERGE engine and the logs table
+CLEANED_FILE_SCHEMAS = {
+    "products": [field for field in STAGING_SCHEMAS["products"] if not field.name.endswith('_uuid')],
+    "products_staged": STAGING_SCHEMAS["products"],
+    "packs": STAGING_SCHEMAS["packs"],
+    "logs": BQ_TABLE_SCHEMAS["logs"],
+}
+
+# Partitioning and clustering of the warehouse tables, applied by `bigquery.create_table_if_not_exist` and by
+# migrate_table_layouts.py to the tables created before. History tables are partitioned by month on scraped_at,
+# a daily scrape adds far less than the recommended partition size, and clustered on the keys the loader filters on
+BQ_TABLE_LAYOUTS = {
+    "competitors": {"partition_field": None, "partition_type": None, "clustering_fields": ['competitor_name']},
+    "products": {"partition_field": 'scraped_at', "partition_type": 'MONTH', "clustering_fields": ['competitor_uuid', 'product_name']},
+    "features": {"partition_field": 'scraped_at', "partition_type": 'MONTH', "clustering_fields": ['product_uuid']},
+    "product_prices": {"partition_field": 'scraped_at', "partition_type": 'MONTH', "clustering_fields": ['feature_uuid']},
+    "packs": {"partition_field": 'scraped_at', "partition_type": 'MONTH', "clustering_fields": ['competitor_name', 'pack_name']},
+    "logs": {"partition_field": 'scraped_at', "partition_type": 'MONTH', "clustering_fields": ['competitor_name']},
+}
@@ -1,8 +1,47 @@
+import os
 import re
-import json
-import ndjson
+import time
 from pathlib import Path
-from typing import Optional, Union, List, Dict, Any
+from typing import Optional, Union, Iterable, Iterator, List, Dict, Any
+import google.cloud.bigquery as bq
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.json as pa_json
+import pyarrow.parquet as pq
+
+from content_state import SHORT_CIRCUIT_TABLES, ContentState
+from table_schemas import CLEANED_FILE_SCHEMAS
+from utils import NdjsonWriter, get_parquet_path, get_raw_ndjson_path, iter_ndjson, unlimited_check_to_float
+
+
+# Cleaning engines of the products: 'rows' cleans one dictionary at a time, 'columnar' cleans whole Arrow columns
+CLEANING_ENGINES = ('rows', 'columnar')
+
+# Speed strings such as '100mbps' or '1Gbps', the numeric prefix is the value in the unit
+SPEED_PATTERN = re.compile(r'(\d+)(mbps|gbps)', re.IGNORECASE)
+# Same pattern in the RE2 syntax of the Arrow compute functions, with named groups
+SPEED_COLUMN_PATTERN = r'(?i)^(?P<value>\d+)(?P<unit>mbps|gbps)'
+
+SPEED_COLUMNS = ['upload_speed', 'download_speed']
+# Quantities scraped as 'unlimited' in older raw files, stored as -1 like `utils.unlimited_check_to_float`
+UNLIMITED_COLUMNS = ['data', 'minutes', 'sms']
+# Text columns read as strings, so the Arrow JSON reader does not infer timestamps from the dates
+PRODUCT_STRING_COLUMNS = ['product_name', 'competitor_name', 'product_category', 'product_url', 'scraped_at']
+
+# Number of rows converted back to dictionaries at a time when writing a cleaned table
+RECORD_BATCH_SIZE = 65536
+
+# Arrow types of the BigQuery column types, DATETIME is a timestamp without time zone as BigQuery expects from Parquet
+ARROW_TYPES = {
+    'STRING': pa.string(),
+    'DATETIME': pa.timestamp('us'),
+    'FLOAT': pa.float64(),
+    'INTEGER': pa.int64(),
+    'BOOLEAN': pa.bool_(),
+}
+# Settings of the typed Parquet files written alongside the cleaned NDJSON files
+PARQUET_COMPRESSION = 'zstd'
+PARQUET_ROW_GROUP_SIZE = 131072
 
 
 def convert_speed(speed: Optional[Union[int, float, str]]) -> Optional[int]:
@@ -19,7 +58,7 @@ def convert_speed(speed: Optional[Union[int, float, str]]) -> Optional[int]:
     if isinstance(speed, (int, float)):
         return int(speed)
     if isinstance(speed, str):
-        match = re.match(r'(\d+)(mbps|gbps)', speed, re.IGNORECASE)
+        match = SPEED_PATTERN.match(speed)
         if not match:
             return None
         value, unit = match.groups()
@@ -29,24 +68,51 @@ def convert_speed(speed: Optional[Union[int, float, str]]) -> Optional[int]:
         return value
 
 
-def json_to_list_of_dicts(competitor: str, header: str) -> Optional[List[Dict[str, Any]]]:
-    """Reads a JSON file and returns a list of dictionaries.
+def read_raw_records(competitor: str, header: str) -> Optional[Iterator[Dict[str, Any]]]:
+    """Returns an iterator over the records of a raw NDJSON file saved by a scraper.
 
     Args:
         competitor (str): The competitor's name.
         header (str): The header or category of the data.
 
     Returns:
-        Optional[List[Dict[str, Any]]]: A list of dictionaries containing the data or None if file not found.
+        Optional[Iterator[Dict[str, Any]]]: An iterator yielding the records one at a time or None if file not found.
     """
-    json_file_path = Path(f'data/raw_data/{competitor}_{header}.json')
-    try:
-        with open(json_file_path, 'r') as f:
-            data_dict = json.load(f)
-        return data_dict[header]
-    except FileNotFoundError:
-        print(f"File not found: {json_file_path}")
+    ndjson_file_path = get_raw_ndjson_path(competitor, header)
+    if not ndjson_file_path.exists():
+        print(f"File not found: {ndjson_file_path}")
         return None
+    return iter_ndjson(ndjson_file_path)
+
+
+def clean_product_record(data_dict: Dict[str, Any]) -> Dict[str, Any]:
+    """Cleans a product record by converting speed values and 'unlimited' quantities to a consistent format.
+
+    Args:
+        data_dict (dict): The product data dictionary to clean.
+
+    Returns:
+        dict: The cleaned product data dictionary.
+    """
+    for key in SPEED_COLUMNS:
+        data_dict[key] = convert_speed(data_dict.get(key))
+    for key in UNLIMITED_COLUMNS:
+        if isinstance(data_dict.get(key), str):
+            data_dict[key] = float(unlimited_check_to_float(data_dict[key]))
+    return data_dict
+
+
+def clean_product_records(records: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """Generator stage cleaning the product records one at a time, see `clean_product_record`.
+
+    Args:
+        records (iterable): The product data dictionaries to clean.
+
+    Yields:
+        dict: The cleaned product data dictionaries.
+    """
+    for data_dict in records:
+        yield clean_product_record(data_dict)
 
 
 def clean_product_data(data_list: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
@@ -58,43 +124,348 @@ def clean_product_data(data_list: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     Returns:
         list: The cleaned list of product data dictionaries.
     """
-    for data_dict in data_list:
-        data_dict['upload_speed'] = convert_speed(data_dict.get('upload_speed'))
-        data_dict['download_speed'] = convert_speed(data_dict.get('download_speed'))
-        for key, value in data_dict.items():
-            if value is None:
-                data_dict[key] = None
-    return data_list
+    return list(clean_product_records(data_list))
+
+
+def to_arrow_schema(schema: List[bq.SchemaField]) -> pa.Schema:
+    """Converts a BigQuery schema to an Arrow schema, REQUIRED columns being non-nullable.
+
+    Args:
+        schema (list): The BigQuery schema fields.
+
+    Returns:
+        pa.Schema: The Arrow schema.
+    """
+    return pa.schema([
+        pa.field(field.name, ARROW_TYPES[field.field_type], nullable=field.mode != 'REQUIRED') for field in schema
+    ])
+
+
+def read_products_table(ndjson_file_path: Union[str, Path]) -> pa.Table:
+    """Reads a raw products NDJSON file into an Arrow table with the multithreaded Arrow JSON reader.
+
+    Files whose columns mix JSON types, e.g. speeds scraped as numbers by one run and as strings by
+    another, cannot be read by the Arrow reader and are converted from the records, see `records_to_table`.
+
+    Args:
+        ndjson_file_path (str, Path): The path of the raw products file.
+
+    Returns:
+        pa.Table: The products, one column per key.
+    """
+    parse_options = pa_json.ParseOptions(
+        explicit_schema=pa.schema([(column, pa.string()) for column in PRODUCT_STRING_COLUMNS]),
+        unexpected_field_behavior='infer'
+    )
+    try:
+        return pa_json.read_json(ndjson_file_path, parse_options=parse_options)
+    except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+        print(f"Mixed column types in {ndjson_file_path}, converting the records: {str(e)}")
+        return records_to_table(iter_ndjson(ndjson_file_path))
+
+
+def records_to_table(records: Iterable[Dict[str, Any]]) -> pa.Table:
+    """Converts product dictionaries to an Arrow table, keys missing from a record are null.
+
+    Columns mixing types are converted value by value: speeds with `convert_speed`, other columns to strings.
+
+    Args:
+        records (iterable): The product data dictionaries.
+
+    Returns:
+        pa.Table: The products, one column per key.
+    """
+    columns: Dict[str, List[Any]] = {}
+    for index, record in enumerate(records):
+        for key in record:
+            if key not in columns:
+                columns[key] = [None] * index
+        for key, values in columns.items():
+            values.append(record.get(key))
+
+    arrays = {}
+    for key, values in columns.items():
+        try:
+            arrays[key] = pa.array(values)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            if key in SPEED_COLUMNS:
+                arrays[key] = pa.array([convert_speed(value) for value in values], pa.int64())
+            else:
+                arrays[key] = pa.array([None if value is None else str(value) for value in values], pa.string())
+    return pa.table(arrays)
+
+
+def speed_column_to_mbps(column: Union[pa.Array, pa.ChunkedArray]) -> Union[pa.Array, pa.ChunkedArray]:
+    """Converts a column of speeds to integer Mbps with the semantics of `convert_speed`.
+
+    Args:
+        column (pa.Array, pa.ChunkedArray): The speeds, as numbers or strings.
+
+    Returns:
+        pa.Array, pa.ChunkedArray: The speeds in Mbps, null where the conversion is not possible.
+    """
+    if pa.types.is_integer(column.type) or pa.types.is_floating(column.type):
+        # Truncates toward zero like int()
+        return pc.cast(column, pa.int64(), safe=False)
+    if not pa.types.is_string(column.type):
+        return pa.nulls(len(column), pa.int64())
+
+    parts = pc.extract_regex(column, SPEED_COLUMN_PATTERN)
+    value = pc.cast(pc.struct_field(parts, 'value'), pa.int64())
+    is_gbps = pc.equal(pc.utf8_lower(pc.struct_field(parts, 'unit')), 'gbps')
+    return pc.if_else(is_gbps, pc.multiply(value, 1000), value)
+
+
+def unlimited_column_to_float(column: Union[pa.Array, pa.ChunkedArray]) -> Union[pa.Array, pa.ChunkedArray]:
+    """Converts a column of quantities scraped as strings to floats, 'unlimited' being -1.
+
+    Args:
+        column (pa.Array, pa.ChunkedArray): The quantities, numeric columns are returned unchanged.
+
+    Returns:
+        pa.Array, pa.ChunkedArray: The quantities as floats.
+    """
+    if not pa.types.is_string(column.type):
+        return column
+    is_unlimited = pc.equal(pc.utf8_lower(column), 'unlimited')
+    return pc.cast(pc.if_else(is_unlimited, '-1', column), pa.float64())
+
+
+def clean_product_table(table: pa.Table) -> pa.Table:
+    """Cleans a table of products with whole-column operations, the columnar equivalent of `clean_product_record`.
+
+    Args:
+        table (pa.Table): The products, see `read_products_table`.
+
+    Returns:
+        pa.Table: The cleaned products, with the speeds in Mbps and the 'unlimited' quantities as -1.
+    """
+    for name in SPEED_COLUMNS:
+        if name in table.column_names:
+            table = table.set_column(table.schema.get_field_index(name), name, speed_column_to_mbps(table[name]))
+        else:
+            table = table.append_column(name, pa.nulls(table.num_rows, pa.int64()))
+    for name in UNLIMITED_COLUMNS:
+        if name in table.column_names:
+            table = table.set_column(table.schema.get_field_index(name), name, unlimited_column_to_float(table[name]))
+    return table
 
 
-def list_of_dicts_to_ndjson(data_list: List[Dict[str, Any]], competitor: str, header: str) -> None:
-    """Writes a list of dictionaries to a newline delimited JSON (ndjson) file.
+def column_to_pylist(array: pa.Array) -> List[Any]:
+    """Converts an Arrow array to a list of Python values, through NumPy when the conversion keeps the nulls.
 
     Args:
-        data_list (list): The list of dictionaries to write to file.
+        array (pa.Array): The array.
+
+    Returns:
+        list: The values, None for nulls.
+    """
+    # NumPy converts the nulls of numeric arrays to NaN, and nested values to arrays
+    if pa.types.is_string(array.type) or (array.null_count == 0 and (pa.types.is_integer(array.type) or pa.types.is_floating(array.type) or pa.types.is_boolean(array.type))):
+        return array.to_numpy(zero_copy_only=False).tolist()
+    return array.to_pylist()
+
+
+def iter_table_records(table: pa.Table) -> Iterator[Dict[str, Any]]:
+    """Yields the rows of an Arrow table as dictionaries, converting one record batch at a time column by column.
+
+    Args:
+        table (pa.Table): The table.
+
+    Yields:
+        dict: The rows of the table.
+    """
+    for batch in table.to_batches(max_chunksize=RECORD_BATCH_SIZE):
+        columns = [column_to_pylist(column) for column in batch.columns]
+        for values in zip(*columns):
+            yield dict(zip(batch.schema.names, values))
+
+
+class ParquetWriter:
+    """Parquet writer typing the records with a BigQuery schema, buffering them into row groups.
+
+    The dates of the records are JSON strings, they are parsed into timestamps when a row group is
+    written. Keys missing from a record are null, keys not in the schema are dropped. Like
+    `utils.NdjsonWriter`, the file is written to a temporary path renamed when the writer is closed
+    without error.
+
+    Attributes:
+        path (Path): The path of the Parquet file.
+        schema (pa.Schema): The Arrow schema of the file.
+        row_group_size (int): The number of records per row group.
+        compression (str): The compression codec of the file.
+        count (int): The number of records written.
+        _input_schema (pa.Schema): The schema of the buffered records, with the dates as strings.
+        _buffer (list): The records of the row group being filled.
+        _temp_path (Path): The path of the file being written.
+        _writer (pq.ParquetWriter): The Arrow Parquet writer.
+    """
+
+    def __init__(self, path: Union[str, Path], schema: List[bq.SchemaField], row_group_size: int = PARQUET_ROW_GROUP_SIZE, compression: str = PARQUET_COMPRESSION) -> None:
+        """Initialize the ParquetWriter object with the path of the file and the BigQuery schema of its records."""
+        self.path = Path(path)
+        self.schema = to_arrow_schema(schema)
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.count = 0
+        self._input_schema = pa.schema([
+            field.with_type(pa.string()) if pa.types.is_timestamp(field.type) else field for field in self.schema
+        ])
+        self._buffer = []
+        self._temp_path = self.path.with_name(self.path.name + '.tmp')
+        self._writer = None
+
+    def __enter__(self) -> 'ParquetWriter':
+        self._writer = pq.ParquetWriter(self._temp_path, self.schema, compression=self.compression)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        try:
+            if exc_type is None:
+                self._flush()
+        except Exception:
+            exc_type = True
+            raise
+        finally:
+            self._writer.close()
+            if exc_type is None:
+                os.replace(self._temp_path, self.path)
+            else:
+                self._temp_path.unlink(missing_ok=True)
+
+    def _flush(self) -> None:
+        """Writes the buffered records as a row group."""
+        if not self._buffer:
+            return
+        table = pa.Table.from_pylist(self._buffer, schema=self._input_schema).cast(self.schema)
+        self._writer.write_table(table, row_group_size=self.row_group_size)
+        self._buffer = []
+
+    def write(self, record: Dict[str, Any]) -> None:
+        """Appends a record, writing a row group when the buffer is full."""
+        self._buffer.append(record)
+        self.count += 1
+        if len(self._buffer) >= self.row_group_size:
+            self._flush()
+
+
+def list_of_dicts_to_ndjson(data_list: Iterable[Dict[str, Any]], competitor: str, header: str) -> int:
+    """Writes dictionaries to a newline delimited JSON (ndjson) file, consuming the iterable lazily.
+
+    Args:
+        data_list (iterable): The dictionaries to write to file.
         competitor (str): The competitor's name.
         header (str): The header or category of the data.
+
+    Returns:
+        int: The number of dictionaries written.
     """
     ndjson_file_path = Path(f'data/cleaned_data/{competitor}_{header}.ndjson')
-    with open(ndjson_file_path, 'w') as f:
-        ndjson.dump(data_list, f)
+    with NdjsonWriter(ndjson_file_path) as writer:
+        return writer.write_all(data_list)
+
+
+def write_cleaned_files(records: Iterable[Dict[str, Any]], competitor: str, header: str, write_parquet: bool = False) -> int:
+    """Writes the cleaned records to a NDJSON file and optionally to a typed Parquet file, in a single pass.
+
+    Args:
+        records (iterable): The cleaned dictionaries.
+        competitor (str): The competitor's name.
+        header (str): The header or category of the data, one of CLEANED_FILE_SCHEMAS keys for Parquet.
+        write_parquet (bool): Whether to also write the records to a Parquet file typed with the schema of the header.
+
+    Returns:
+        int: The number of dictionaries written.
+    """
+    if not write_parquet:
+        return list_of_dicts_to_ndjson(records, competitor, header)
+
+    with ParquetWriter(get_parquet_path(competitor, header), CLEANED_FILE_SCHEMAS[header]) as parquet_writer:
+        def tee(records: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+            for record in records:
+                parquet_writer.write(record)
+                yield record
 
+        return list_of_dicts_to_ndjson(tee(records), competitor, header)
 
-def clean_data_task(competitors: List[str], headers: List[str]) -> None:
-    """Performs the cleaning task for each competitor and header combination.
+
+def get_cleaning_units(competitors: List[str], headers: List[str], engine: str = 'rows', write_parquet: bool = False) -> List[Dict[str, Any]]:
+    """Returns the keyword arguments of `clean_unit` for each competitor and header combination.
 
     Args:
         competitors (list): A list of competitors.
         headers (list): A list of data headers/categories to clean.
+        engine (str): The cleaning engine of the products, one of CLEANING_ENGINES.
+        write_parquet (bool): Whether to also write typed Parquet files, see `write_cleaned_files`.
+
+    Returns:
+        list: One dictionary of keyword arguments per unit, the arguments of the mapped cleaning tasks.
     """
-    for competitor in competitors:
-        for header in headers:
-            data_list = json_to_list_of_dicts(competitor, header)
-            if data_list is None:
-                continue
-            if header == 'products':
-                cleaned_data = clean_product_data(data_list)
-                if cleaned_data is not None:
-                    list_of_dicts_to_ndjson(cleaned_data, competitor, header)
-            else:
-                list_of_dicts_to_ndjson(data_list, competitor, header)
+    return [
+        {'competitor': competitor, 'header': header, 'engine': engine, 'write_parquet': write_parquet}
+        for competitor in competitors for header in headers
+    ]
+
+
+def clean_unit(competitor: str, header: str, engine: str = 'rows', write_parquet: bool = False) -> Dict[str, Any]:
+    """Cleans the raw file of a competitor and header, the unit of work of the cleaning stage.
+
+    With the 'rows' engine, the records are streamed from the raw file through the cleaning stage to the
+    cleaned file, so the memory used does not depend on the size of the files. The 'columnar' engine loads
+    the products of a competitor into an Arrow table and cleans whole columns at once, which is faster on
+    large files such as replayed historical dumps. Tables whose content is unchanged since their last
+    successful load are not cleaned again, their loading is a no-op, see `content_state.ContentState`.
+
+    Units share no file except the content state of the competitor, whose updates are locked, so they
+    can run concurrently.
+
+    Args:
+        competitor (str): The competitor's name.
+        header (str): The header or category of the data.
+        engine (str): The cleaning engine of the products, one of CLEANING_ENGINES.
+        write_parquet (bool): Whether to also write a typed Parquet file, see `write_cleaned_files`.
+
+    Returns:
+        dict: The unit with its status ('missing', 'unchanged' or 'cleaned'), records written and duration in seconds.
+    """
+    if engine not in CLEANING_ENGINES:
+        raise ValueError(f"Unknown cleaning engine '{engine}', expected one of {CLEANING_ENGINES}")
+
+    start_time_seconds = time.perf_counter()
+    unit = {'competitor': competitor, 'header': header, 'status': 'cleaned', 'records': 0}
+
+    records = read_raw_records(competitor, header)
+    if records is None:
+        unit['status'] = 'missing'
+    # The fingerprint is computed in a first streaming pass over the raw file
+    elif header in SHORT_CIRCUIT_TABLES and ContentState(competitor).stage_table(header, read_raw_records(competitor, header)):
+        print(f"{competitor} {header} unchanged since the last load, cleaning skipped")
+        unit['status'] = 'unchanged'
+    else:
+        if header == 'products' and engine == 'columnar':
+            records = iter_table_records(clean_product_table(read_products_table(get_raw_ndjson_path(competitor, header))))
+        elif header == 'products':
+            records = clean_product_records(records)
+        unit['records'] = write_cleaned_files(records, competitor, header, write_parquet)
+
+    unit['seconds'] = round(time.perf_counter() - start_time_seconds, 3)
+    print(f"{competitor} {header} {unit['status']} in {unit['seconds']:.3f}s | {unit['records']} records")
+    return unit
+
+
+def clean_data_task(competitors: List[str], headers: List[str], engine: str = 'rows', write_parquet: bool = False) -> List[Dict[str, Any]]:
+    """Performs the cleaning task for each competitor and header combination one after another, see `clean_unit`.
+
+    The clean DAG runs the units as parallel mapped tasks instead, this function cleans everything in
+    the current process, e.g. when replaying raw files locally.
+
+    Args:
+        competitors (list): A list of competitors.
+        headers (list): A list of data headers/categories to clean.
+        engine (str): The cleaning engine of the products, one of CLEANING_ENGINES.
+        write_parquet (bool): Whether to also write typed Parquet files, see `write_cleaned_files`.
+
+    Returns:
+        list: The status, records written and duration of each unit.
+    """
+    return [clean_unit(**kwargs) for kwargs in get_cleaning_units(competitors, headers, engine, write_parquet)]
@@ -5,11 +5,18 @@ from airflow.sensors.time_delta import TimeDeltaSensor
 from airflow.sensors.python import PythonSensor
 
 
-from transform import clean_data_task
+from transform import clean_unit, get_cleaning_units
+from utils import CLEANED_FILE_FORMAT
 
 
 HEADERS = ['products', 'packs', 'logs']
 COMPETITORS = ['mobileviking', 'scarlet']
+# 'rows' streams the products record by record, 'columnar' cleans them as Arrow columns, see `transform.clean_unit`
+CLEANING_ENGINE = 'rows'
+# Maximum number of (competitor, header) units cleaned at the same time
+CLEANING_WORKERS = 4
+# Also write typed Parquet files next to the cleaned NDJSON files, derived from the format the load DAG submits
+WRITE_PARQUET = CLEANED_FILE_FORMAT == 'parquet'
 
 DEFAULT_ARGS = {
     'owner': 'admin',
@@ -33,11 +40,12 @@ def clean_dag():
         delta=timedelta(seconds=2)
     )
 
-    clean_data = PythonOperator(
+    # One mapped task instance per (competitor, header), so cleaning time stays flat as competitors are added
+    clean_data = PythonOperator.partial(
         task_id='clean_data',
-        python_callable=clean_data_task,
-        op_kwargs={'competitors': COMPETITORS, 'headers': HEADERS}
-    )
+        python_callable=clean_unit,
+        max_active_tis_per_dag=CLEANING_WORKERS
+    ).expand(op_kwargs=get_cleaning_units(COMPETITORS, HEADERS, CLEANING_ENGINE, WRITE_PARQUET))
 
     delay_task >> clean_data
 
@@ -1,30 +1,85 @@
 from pathlib import Path
-import ndjson
 import json
 import logging
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from airflow import AirflowException
+from functools import lru_cache
 import time
 import os
-from typing import Dict, List, Union, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Union, Optional
 
 
-def save_to_json(dict_data: Dict, competitor: str, filename: str) -> None:
-    json_path = Path(f"data/raw_data/{competitor}_{filename}.json")
-    json_data = json.dumps(dict_data, indent=4)
-    with open(json_path, mode="w", encoding="utf-8") as f:
-        f.write(json_data)
+# Timeout in seconds and number of retries of the plain HTTP requests
+HTTP_TIMEOUT = 10
+HTTP_RETRIES = 3
+
+# Format of the cleaned files submitted by the load DAG, the clean DAG also writes typed Parquet files when it is 'parquet'
+CLEANED_FILE_FORMAT = 'ndjson'
+
+
+class NdjsonWriter:
+    """Append-only NDJSON writer, records are serialized one line at a time as they are produced.
+
+    The records are appended to a temporary file renamed to the target path when the writer is closed
+    without error, so readers never see a partially written file.
+
+    Attributes:
+        path (Path): The path of the NDJSON file.
+        count (int): The number of records written.
+        _temp_path (Path): The path of the file being written.
+        _file (IO): The temporary file.
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        """Initialize the NdjsonWriter object with the path of the NDJSON file."""
+        self.path = Path(path)
+        self.count = 0
+        self._temp_path = self.path.with_name(self.path.name + '.tmp')
+        self._file = None
+
+    def __enter__(self) -> 'NdjsonWriter':
+        self._file = open(self._temp_path, mode="w", encoding="utf-8")
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self._file.close()
+        if exc_type is None:
+            os.replace(self._temp_path, self.path)
+        else:
+            self._temp_path.unlink(missing_ok=True)
+
+    def write(self, record: Dict) -> None:
+        """Appends a record."""
+        self._file.write(json.dumps(record) + '\n')
+        self.count += 1
+
+    def write_all(self, records: Iterable[Dict]) -> int:
+        """Appends the records of an iterable, consuming it lazily, and returns the number of records written."""
+        for record in records:
+            self.write(record)
+        return self.count
 
-    file_saved_message = f"{filename} JSON file saved | {json_path}"
-    logging.info(file_saved_message)
 
+def iter_ndjson(file_path: Union[str, Path]) -> Iterator[Dict]:
+    """Yields the records of a NDJSON file one at a time."""
+    with open(file_path, mode="r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
 
-def save_to_ndjson(list_data: List[Dict], competitor: str, filename: str) -> None:
-    ndjson_path = Path(f"data/raw_data/{competitor}_{filename}.ndjson")
-    with open(ndjson_path, mode="w", encoding="utf-8") as f:
-        ndjson.dump(list_data, f)
 
-    file_saved_message = f"{filename} NDJSON file saved | {ndjson_path}"
+def get_raw_ndjson_path(competitor: str, filename: str) -> Path:
+    return Path(f"data/raw_data/{competitor}_{filename}.ndjson")
+
+
+def save_to_ndjson(records: Iterable[Dict], competitor: str, filename: str) -> None:
+    ndjson_path = get_raw_ndjson_path(competitor, filename)
+    with NdjsonWriter(ndjson_path) as writer:
+        writer.write_all(records)
+
+    file_saved_message = f"{filename} NDJSON file saved | {writer.count} records | {ndjson_path}"
     logging.info(file_saved_message)
 
 
@@ -32,13 +87,30 @@ def unlimited_check_to_float(string: str) -> float:
     return -1 if string.lower() == 'unlimited' else float(string)
 
 
+@lru_cache(maxsize=None)
+def get_http_session() -> requests.Session:
+    """
+    Return the HTTP session of the process, pooling connections and retrying failed requests
+    """
+    retries = Retry(total=HTTP_RETRIES, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=['HEAD', 'GET'])
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=10, max_retries=retries)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return session
+
+
 def check_request(url: str) -> None:
     """
-    Check url request for errors
+    Check url request for errors with a lightweight HEAD probe
     """
     try:
-        response = requests.get(url)
-        response.raise_for_status()
+        response = get_http_session().head(url, timeout=HTTP_TIMEOUT, allow_redirects=True)
+        # Servers refusing HEAD requests are still reachable
+        if response.status_code not in (405, 501):
+            response.raise_for_status()
 
     except requests.exceptions.ConnectionError as ec:
         logging.error(ec)
@@ -51,21 +123,60 @@ def check_request(url: str) -> None:
         raise AirflowException(eh)
 
 
+def fetch_static_page(url: str) -> str:
+    """
+    Fetch the HTML of a page not rendered by JavaScript without a browser
+    """
+    try:
+        logging.info(f"Fetching URL without browser: {url}")
+        response = get_http_session().get(url, timeout=HTTP_TIMEOUT)
+        response.raise_for_status()
+        return response.text
+
+    except requests.exceptions.RequestException as e:
+        logging.error(e)
+        raise AirflowException(e)
+
+
+def check_response(response: Optional[Any], url: str, load_time: float) -> None:
+    """
+    Check the response of a Playwright navigation for errors
+    """
+    if response is None:
+        error_message = f"No response received from {url}"
+        logging.error(error_message)
+        raise AirflowException(error_message)
+
+    logging.info(f"{url} responded {response.status} in {load_time:.3f}s")
+
+    if not response.ok:
+        error_message = f"{response.status} {response.status_text} error for url: {url}"
+        logging.error(error_message)
+        raise AirflowException(error_message)
+
+
+def response_metadata(response: Any, load_time: float) -> Dict[str, Any]:
+    """
+    Returns the metadata of a Playwright navigation response saved with the recorded page snapshots
+    """
+    return {
+        'url': response.url,
+        'status': response.status,
+        'headers': response.headers,
+        'load_time': round(load_time, 3),
+    }
+
+
 def save_scraping_log(error_details: str, competitor: str) -> None:
 
     status = 'success' if error_details == 'no error' else 'failed'
     log_entry = {
-        "logs":
-            [
-                {
-                    'competitor_name': competitor,
-                    'scraped_at': time.strftime("%Y-%m-%d"),
-                    'error_details': error_details,
-                    'status': status
-                }
-            ]
+        'competitor_name': competitor,
+        'scraped_at': time.strftime("%Y-%m-%d"),
+        'error_details': error_details,
+        'status': status
     }
-    save_to_json(log_entry, competitor, "logs")
+    save_to_ndjson([log_entry], competitor, "logs")
 
 
 def read_config_from_json(filename: str) -> Dict:
@@ -78,12 +189,21 @@ def check_empty_el(el: Optional[Union[str, List]], selector_name: str) -> None:
         raise Exception(f"Selector '{selector_name}' not found")
 
 
-def load_ndjson(competitor: str, table_name: str) -> List[Dict]:
-    file_path = Path(f'data/cleaned_data/{competitor}_{table_name}.ndjson')
-    with open(file_path, "rb") as file:
-        return ndjson.load(file)
+def get_ndjson_path(competitor: str, table_name: str) -> Path:
+    return Path(f'data/cleaned_data/{competitor}_{table_name}.ndjson')
+
+
+def get_parquet_path(competitor: str, table_name: str) -> Path:
+    return Path(f'data/cleaned_data/{competitor}_{table_name}.parquet')
+
+
+def load_ndjson(competitor: str, table_name: str) -> Iterator[Dict]:
+    """
+    Yield the records of a cleaned NDJSON file, so the loader never holds the whole file in memory
+    """
+    return iter_ndjson(get_ndjson_path(competitor, table_name))
 
 
 def check_file_exists(competitor: str, table_name: str) -> bool:
-    file_path = f'data/cleaned_data/{competitor}_{table_name}.ndjson'
+    file_path = get_ndjson_path(competitor, table_name)
     return os.path.isfile(file_path)
@@ -1,29 +1,71 @@
 from data_model import validate_products
-from playwright.sync_api import sync_playwright, Playwright
+from playwright.async_api import async_playwright
 from bs4 import BeautifulSoup
-import requests
+import asyncio
+import functools
 import re
 import time
 import logging
 import traceback
 from typing import List, Dict
 from airflow import AirflowException
+from readiness import wait_until_ready_async
 from utils import *
-from typing import Any, Dict, List, Optional
-from playwright.sync_api import Page, Browser
+from page_snapshot import PageSnapshot, SnapshotCache, parse_html
+from fixtures import get_recorder
+from request_filter import RequestFilter
+from browser_server import get_browser_async
+from http_cache import get_http_cache
+from content_state import ContentState
+from storage_state import StorageState, has_stored_consent, mark_consent_accepted
+from typing import Any, Dict, List, Optional, Tuple
+from playwright.async_api import Page, Browser, BrowserContext
+
+
+PRODUCT_TYPES = ['mobile_prepaid', 'mobile_subscription', 'internet_subscription']
+# Product types extracted from the page content only, which can be fetched without a browser
+STATIC_PRODUCT_TYPES = ['mobile_subscription']
+
+
+def get_fetch_strategy(config: Dict[str, Any], product_type: str) -> str:
+    """Returns the fetch strategy of a product type, 'static' to fetch its page with a plain HTTP request or 'browser'.
+
+    Args:
+        config: Configuration settings for the scraper.
+        product_type: The type of product.
+
+    Returns:
+        str: The fetch strategy, 'browser' if the product type needs page interactions.
+    """
+    strategy = config.get('fetch', {}).get(product_type, 'browser')
+    if strategy == 'static' and product_type not in STATIC_PRODUCT_TYPES:
+        logging.warning(f"{product_type} needs page interactions, fetching it with the browser")
+        return 'browser'
+    return strategy
 
 
 class Scraper:
     """A scraper for extracting telecom provider offering from webpage.
 
+    Product pages are scraped concurrently with the async Playwright API, in a single browser context
+    holding at most `max_concurrency` open pages (1 scrapes them sequentially). The context reuses the
+    cookie consent saved by the previous run.
+
     Attributes:
         _browser (Browser): The browser instance for web scraping.
         _config (dict): Configuration dictionary for scraper settings.
         logger (logging.Logger): Logger for recording log messages.
         _date (str): Current date in YYYY-MM-DD format.
-        _url (str): The URL to scrape.
-        _page (Page): The current page object from the browser.
-        _page_content (str): The content of the current page.
+        _url (str): The URL of the combo page the packs are generated from.
+        _context (BrowserContext): The long-lived browser context all the pages are opened in.
+        _page_slots (asyncio.Semaphore): Bounds the number of pages open at once to `max_concurrency`.
+        content_state (ContentState): The page fingerprints and extraction results of the last successful run.
+        _storage_state (StorageState): The cookie consent and localStorage of the context saved between runs.
+        _parser (str): The parser backend of BeautifulSoup, 'html.parser' or 'lxml'.
+        _snapshots (SnapshotCache): The page snapshots of the run, each parsed once for all its extractors.
+        request_filter (RequestFilter): Filters the requests of the pages opened in the browser context.
+        _page_metadata (dict): The product type, fetch strategy and navigation response of each page keyed by URL,
+            saved with the snapshots of the page in record mode.
     """
 
     def __init__(
@@ -31,8 +73,6 @@ class Scraper:
         browser: Browser,
         config: Dict[str, Any],
         url: Optional[str] = None,
-        page: Optional[Page] = None,
-        page_content: Optional[str] = None,
         logger: Optional[logging.Logger] = None
     ) -> None:
         """Initialize the Scraper object with a browser instance, configuration, and logger."""
@@ -42,8 +82,14 @@ class Scraper:
         self._initialize_logging()
         self._date = time.strftime("%Y-%m-%d")
         self._url = url
-        self._page = page
-        self._page_content = page_content
+        self._context = None
+        self._page_slots = asyncio.Semaphore(config.get('max_concurrency', 1))
+        self._storage_state = StorageState(config['competitor'])
+        self._parser = config.get('parser', 'html.parser')
+        self.content_state = ContentState(config['competitor'])
+        self._snapshots = SnapshotCache(self._parser, get_recorder(config['competitor']), self.content_state)
+        self._page_metadata = {}
+        self.request_filter = RequestFilter(config.get('request_filter'))
 
     def _initialize_logging(self) -> None:
         """Initializes logging for the scraper."""
@@ -65,44 +111,98 @@ class Scraper:
             # Add the handler to the logger
             self.logger.addHandler(handler)
 
-    def _accept_cookie(self) -> None:
-        """Accepts the cookie consent on the page."""
+    async def open_context(self) -> None:
+        """Opens the browser context of the run, loading the storage state saved by the previous run.
+
+        The requests of the pages opened in the context go through the request filter of the scraper.
+        """
+        context = await self._storage_state.new_context_async(self._browser)
+        self._context = await self.request_filter.apply_async(context)
+
+    async def close_context(self) -> None:
+        """Saves the storage state of the browser context if the cookie consent was accepted, then closes it."""
+        if self._context is not None:
+            await self._storage_state.save_async(self._context)
+            await self._context.close()
+            self._context = None
+
+    async def _accept_cookie(self, page: Page) -> None:
+        """Accepts the cookie consent on the page, skipped if the consent was loaded from the saved storage state.
+
+        Args:
+            page (Page): The page showing the cookie consent.
+        """
+        if has_stored_consent(page.context):
+            return
+
         try:
             btn_selector = self._config['selector']['cookie_btn']
-            self._page.wait_for_selector(btn_selector)
-            self._page.query_selector(btn_selector).click(force=True)
+            await page.wait_for_selector(btn_selector)
+            btn = await page.query_selector(btn_selector)
+            await btn.click(force=True)
+            mark_consent_accepted(page.context)
         except Exception as e:
             error_message = f"Accept cookie button error: {str(e)}"
             self.logger.error(error_message)
 
             raise AirflowException(error_message)
 
-    def _navigate(self, endpoint: str) -> None:
-        """Navigates to a specific endpoint on the website.
+    async def _navigate(self, context: BrowserContext, endpoint: str) -> Tuple[Page, str]:
+        """Navigates to a specific endpoint on the website in a new page of the context.
 
         Args:
+            context (BrowserContext): The browser context to open the page in.
             endpoint (str): The endpoint to navigate to.
+
+        Returns:
+            tuple: The opened page and its URL.
         """
-        self._url = self._config['baseurl'] + self._config['endpoint'][endpoint]
+        url = self._config['baseurl'] + self._config['endpoint'][endpoint]
+
+        # Optionally probe the url, in a thread so the other pages keep loading
+        if self._config.get('probe_urls', False):
+            await asyncio.to_thread(check_request, url)
 
-        # Check url for errors
-        check_request(self._url)
+        self.logger.info(f"Navigating to url: {url}")
+        page = await context.new_page()
+        start_time_seconds = time.time()
+        response = await page.goto(url, wait_until='domcontentloaded')
+        load_time = time.time() - start_time_seconds
+        # Check url for errors from the navigation response
+        check_response(response, url, load_time)
+        self._page_metadata[url] = {'extractor': endpoint, 'fetch': 'browser', 'response': response_metadata(response, load_time)}
 
-        self.logger.info(f"Navigating to url: {self._url}")
-        self._page = self._browser.new_page()
-        self._page.goto(self._url, wait_until='domcontentloaded')
+        await self._accept_cookie(page)
+        await wait_until_ready_async(page, self._config['readiness'].get(endpoint), self.logger)
 
-        self._accept_cookie()
-        time.sleep(3)
+        return page, url
 
-    def _extract_prepaid_selector_data(self) -> List[Dict[str, Any]]:
+    async def _take_snapshot(self, page: Page, url: str, state: str, clicks: Optional[List[str]] = None) -> PageSnapshot:
+        """Takes a snapshot of the page in its current DOM state.
+
+        Args:
+            page (Page): The page to take the snapshot of.
+            url (str): The URL of the page.
+            state (str): The name of the current DOM state of the page.
+            clicks (list): The selectors clicked since the navigation to reach the state.
+
+        Returns:
+            PageSnapshot: The snapshot of the page.
+        """
+        metadata = {**self._page_metadata.get(url, {}), 'clicks': clicks or []}
+        return self._snapshots.put(PageSnapshot(url, await page.content(), state, self._parser, metadata))
+
+    def _extract_prepaid_selector_data(self, soup: BeautifulSoup, url: str) -> List[Dict[str, Any]]:
         """Extracts prepaid product data from the page selector.
 
+        Args:
+            soup (BeautifulSoup): The parse tree of the page.
+            url (str): The URL of the page.
+
         Returns:
             list: A list of dictionaries containing prepaid product data.
         """
         prepaid_data = []
-        soup = BeautifulSoup(self._page_content, 'html.parser')
         try:
             prepaid_elements = soup.select(self._config['selector']['mobile_prepaid']['prepaid_card'])
 
@@ -127,7 +227,7 @@ class Scraper:
                     'product_name': f"mobile_prepaid_{data_focus}_{data}_gb",
                     'competitor_name': self._config['competitor'],
                     'product_category': 'mobile_prepaid',
-                    'product_url': self._url,
+                    'product_url': url,
                     'price': float(price),
                     'scraped_at': self._date,
                     'data': float(data),
@@ -145,44 +245,54 @@ class Scraper:
             traceback.print_exc()
             raise AirflowException(error_message)
 
-    def _activate_toggle_switch(self) -> None:
-        """Activates toggle switch elements on the page."""
+    async def _activate_toggle_switch(self, page: Page) -> None:
+        """Activates toggle switch elements on the page.
+
+        Args:
+            page (Page): The page holding the toggle switches.
+        """
         try:
-            toggles = self._page.query_selector_all(self._config['selector']['toggle_switch'])
+            toggles = await page.query_selector_all(self._config['selector']['toggle_switch'])
             check_empty_el(toggles, self._config['selector']['toggle_switch'])
             for i in range(len(toggles)):
-                toggles[i].click()
+                await toggles[i].click()
         except Exception as e:
             error_message = f"Error activating toggles: {str(e)}"
             self.logger.error(error_message)
             traceback.print_exc()
             raise AirflowException(error_message)
 
-    def _extract_prepaid_data(self) -> List[Dict[str, Any]]:
+    async def _extract_prepaid_data(self, page: Page, url: str) -> List[Dict[str, Any]]:
         """Extracts all prepaid data from the page.
 
+        Args:
+            page (Page): The prepaid page.
+            url (str): The URL of the page.
+
         Returns:
             list: A list of dictionaries containing all prepaid data.
         """
-        self._page_content = self._page.content()
-        prepaid_data = self._extract_prepaid_selector_data()
-        self._activate_toggle_switch()
-        self._page_content = self._page.content()
-        prepaid_data_calls = self._extract_prepaid_selector_data()
+        snapshot = await self._take_snapshot(page, url, 'initial')
+        prepaid_data = self._snapshots.extract(snapshot, 'mobile_prepaid', self._extract_prepaid_selector_data)
+        await self._activate_toggle_switch(page)
+        snapshot = await self._take_snapshot(page, url, 'toggled', [self._config['selector']['toggle_switch']])
+        prepaid_data_calls = self._snapshots.extract(snapshot, 'mobile_prepaid', self._extract_prepaid_selector_data)
         prepaid_data.extend(prepaid_data_calls)
 
         return prepaid_data
 
-    def _extract_subscription_data(self) -> List[Dict[str, Any]]:
+    def _extract_subscription_data(self, soup: BeautifulSoup, url: str) -> List[Dict[str, Any]]:
         """Extracts subscription product data from the page.
 
+        Args:
+            soup (BeautifulSoup): The parse tree of the page.
+            url (str): The URL of the page.
+
         Returns:
             list: A list of dictionaries containing subscription data.
         """
         subscription_data = []
-        self._page_content = self._page.content()
         try:
-            soup = BeautifulSoup(self._page_content, 'html.parser')
             subscription_elements = soup.select(self._config['selector']['mobile_subscription']['mobile_subscription_card'])
 
             check_empty_el(subscription_elements, self._config['selector']['mobile_subscription']['mobile_subscription_card'])
@@ -211,7 +321,7 @@ class Scraper:
                     'product_name': f"mobile_subscription_{mobile_data}_gb",
                     'competitor_name': self._config['competitor'],
                     'product_category': 'mobile_subscription',
-                    'product_url': self._url,
+                    'product_url': url,
                     'price': float(price_per_month),
                     'scraped_at': self._date,
                     'data': float(mobile_data),
@@ -229,14 +339,16 @@ class Scraper:
             traceback.print_exc()
             raise AirflowException(error_message)
 
-    def _extract_internet_table_data(self) -> Dict[str, Any]:
+    def _extract_internet_table_data(self, soup: BeautifulSoup, url: str) -> Dict[str, Any]:
         """Extracts internet subscription data from the page.
 
+        Args:
+            soup (BeautifulSoup): The parse tree of the page.
+            url (str): The URL of the page.
+
         Returns:
             dict: A dictionary containing internet subscription data.
         """
-        soup = BeautifulSoup(self._page_content, 'html.parser')
-
         internet_data = {}
 
         try:
@@ -261,7 +373,7 @@ class Scraper:
 
             internet_data['competitor_name'] = self._config['competitor']
             internet_data['product_category'] = 'internet_subscription'
-            internet_data['product_url'] = self._url
+            internet_data['product_url'] = url
             internet_data['price'] = float(cleaned_price)
             internet_data['scraped_at'] = self._date
             internet_data['data'] = monthly_data
@@ -278,28 +390,32 @@ class Scraper:
             traceback.print_exc()
             raise AirflowException(error_message)
 
-    def _extract_internet_data(self) -> List[Dict[str, Any]]:
+    async def _extract_internet_data(self, page: Page, url: str) -> List[Dict[str, Any]]:
         """Extracts all internet subscription data from the page.
 
+        Args:
+            page (Page): The internet subscription page.
+            url (str): The URL of the page.
+
         Returns:
             list: A list of dictionaries containing all internet data.
         """
-        self._page_content = self._page.content()
+        snapshot = await self._take_snapshot(page, url, 'initial')
 
         try:
-            internet_type_btn = self._page.query_selector_all(self._config['selector']['internet_subscription']['internet_type_btn'])
+            internet_type_btn = await page.query_selector_all(self._config['selector']['internet_subscription']['internet_type_btn'])
             check_empty_el(internet_type_btn, self._config['selector']['internet_subscription']['internet_type_btn'])
 
-            first_table_data = self._extract_internet_table_data()
-            first_btn_text = internet_type_btn[0].inner_text().lower().replace(' ', '_')
+            first_table_data = self._snapshots.extract(snapshot, 'internet_subscription', self._extract_internet_table_data)
+            first_btn_text = (await internet_type_btn[0].inner_text()).lower().replace(' ', '_')
             first_table_data = {'product_name': first_btn_text, **first_table_data}
 
-            internet_type_btn[1].click()
+            await internet_type_btn[1].click()
 
-            self._page_content = self._page.content()
+            snapshot = await self._take_snapshot(page, url, 'second_internet_type', [f"{self._config['selector']['internet_subscription']['internet_type_btn']} >> nth=1"])
 
-            second_table_data = self._extract_internet_table_data()
-            second_btn_text = internet_type_btn[1].inner_text().lower().replace(' ', '_')
+            second_table_data = self._snapshots.extract(snapshot, 'internet_subscription', self._extract_internet_table_data)
+            second_btn_text = (await internet_type_btn[1].inner_text()).lower().replace(' ', '_')
             second_table_data = {'product_name': second_btn_text, **second_table_data}
 
             internet_data = []
@@ -314,8 +430,10 @@ class Scraper:
             traceback.print_exc()
             raise AirflowException(error_message)
 
-    def _extract_page_data(self, product_type: str) -> List[Dict[str, Any]]:
-        """Extracts data from the page based on product type.
+    async def _extract_browser_page_data(self, product_type: str) -> List[Dict[str, Any]]:
+        """Extracts data from the page of a product type rendered by the browser.
+
+        Waits for a page slot of the browser context, so at most `max_concurrency` pages are open at once.
 
         Args:
             product_type (str): The type of product to extract data for.
@@ -323,35 +441,81 @@ class Scraper:
         Returns:
             list: A list of dictionaries containing the product data.
         """
-        self._navigate(product_type)
-        self.logger.info(f"Extracting mobile prepaid data from: {self._url}")
+        # Extractors interacting with the page, e.g. clicking toggles
+        page_extractors = {
+            'mobile_prepaid': self._extract_prepaid_data,
+            'internet_subscription': self._extract_internet_data,
+        }
+
+        async with self._page_slots:
+            page, url = await self._navigate(self._context, product_type)
+            try:
+                self.logger.info(f"Extracting {product_type} data from: {url}")
+                if product_type in page_extractors:
+                    return await page_extractors[product_type](page, url)
+                snapshot = await self._take_snapshot(page, url, 'initial')
+                return self._snapshots.extract(snapshot, product_type, functools.partial(self._extract_content_data, product_type))
+            finally:
+                await page.close()
+
+    def _extract_content_data(self, product_type: str, soup: BeautifulSoup, url: str) -> List[Dict[str, Any]]:
+        """Extracts data from the content of the page of a product type in STATIC_PRODUCT_TYPES.
 
-        if product_type == 'mobile_prepaid':
-            data = self._extract_prepaid_data()
-        elif product_type == 'mobile_subscription':
-            data = self._extract_subscription_data()
-        elif product_type == 'internet_subscription':
-            data = self._extract_internet_data()
+        Args:
+            product_type (str): The type of product to extract data for.
+            soup (BeautifulSoup): The parse tree of the page.
+            url (str): The URL of the page.
 
-        self._page.close()
+        Returns:
+            list: A list of dictionaries containing the product data.
+        """
+        content_extractors = {
+            'mobile_subscription': self._extract_subscription_data,
+        }
+        return content_extractors[product_type](soup, url)
+
+    async def _extract_page_data(self, product_type: str) -> List[Dict[str, Any]]:
+        """Extracts data from the page based on product type, with the fetch strategy of the product type.
+
+        Args:
+            product_type (str): The type of product to extract data for.
+
+        Returns:
+            list: A list of dictionaries containing the product data.
+        """
+        start_time_seconds = time.time()
+        strategy = get_fetch_strategy(self._config, product_type)
+
+        if strategy == 'static':
+            url = self._config['baseurl'] + self._config['endpoint'][product_type]
+            metadata = {'extractor': product_type, 'fetch': 'static'}
+            snapshot = self._snapshots.put(PageSnapshot(url, await asyncio.to_thread(fetch_static_page, url), parser=self._parser, metadata=metadata))
+            self.logger.info(f"Extracting {product_type} data from: {url}")
+            data = self._snapshots.extract(snapshot, product_type, functools.partial(self._extract_content_data, product_type))
+        else:
+            data = await self._extract_browser_page_data(product_type)
+
+        self.logger.info("{} page scraped in {:.3f}s ({})".format(product_type, time.time() - start_time_seconds, strategy))
 
         return data
 
-    def get_products(self) -> List[Dict[str, Any]]:
-        """Extracts product data from different product pages.
+    async def get_products(self) -> List[Dict[str, Any]]:
+        """Extracts product data from the different product pages concurrently.
 
         Returns:
             list: A list of dictionaries containing product details.
         """
         try:
-            prepaid_data = self._extract_page_data('mobile_prepaid')
-            mobile_subscription_data = self._extract_page_data('mobile_subscription')
-            internet_subscription_data = self._extract_page_data('internet_subscription')
+            # The browser is only launched when a product type needs it
+            if self._context is None and self._browser is not None:
+                await self.open_context()
+
+            # gather returns the results in the order of the product types
+            pages_data = await asyncio.gather(*(self._extract_page_data(product_type) for product_type in PRODUCT_TYPES))
 
             product_list = []
-            product_list.extend(prepaid_data)
-            product_list.extend(mobile_subscription_data)
-            product_list.extend(internet_subscription_data)
+            for page_data in pages_data:
+                product_list.extend(page_data)
 
             # Validate product_list
             product_dict = validate_products(product_list)
@@ -367,16 +531,20 @@ class Scraper:
     def _extract_discount(self) -> int:
         """Extracts the discount value from the combo pack page.
 
+        The discount extracted by a previous run is reused while the page is not modified.
+
         Returns:
             int: The extracted discount value.
         """
-        try:
-            self._url = self._config['baseurl'] + self._config['endpoint']['discount']
-            self._page_content = requests.get(self._url).text
-            soup = BeautifulSoup(self._page_content, "html.parser")
+        def extract(page_content: str) -> int:
+            soup = parse_html(page_content, self._parser)
             combo_text = soup.select_one(self._config['selector']['discount']).get_text()
             match = re.search(r'\d+', combo_text)
-            discount = int(match.group())
+            return int(match.group())
+
+        try:
+            self._url = self._config['baseurl'] + self._config['endpoint']['discount']
+            discount = get_http_cache().extract(self._url, 'discount', extract)
 
             return discount
 
@@ -431,30 +599,51 @@ class Scraper:
             raise AirflowException(error_message)
 
 
-def mobileviking_scraper(config: Dict[str, Any]) -> None:
-    """Initializes the scraping process for mobileviking website.
-
-    This function sets up the browser, creates an instance of the Scraper object
-    and orchestrates the scraping of product and pack data, saving them to JSON files.
-    It ensures the browser is closed after the operation and logs are saved.
+async def scrape_mobileviking(config: Dict[str, Any]) -> None:
+    """Scrapes the mobileviking website with the async Playwright API.
 
     Args:
         config: Configuration settings for the scraper.
     """
-    with sync_playwright() as pw:
+    async with async_playwright() as pw:
         error_details = 'no error'
+        browser = None
+        scraper_object = None
         try:
-            browser = pw.chromium.launch(headless=True, slow_mo=50)
+            # Only launch Chromium if a page is not fetched statically
+            if any(get_fetch_strategy(config, product_type) == 'browser' for product_type in PRODUCT_TYPES):
+                browser = await get_browser_async(pw, config['competitor'], slow_mo=config.get('slow_mo', 0))
             scraper_object = Scraper(browser, config)
-            product_dict = scraper_object.get_products()
-            save_to_json(product_dict, "mobileviking", 'products')
+            product_dict = await scraper_object.get_products()
+            save_to_ndjson(product_dict['products'], "mobileviking", 'products')
             packs_dict = scraper_object.generate_packs(product_dict['products'])
-            save_to_json(packs_dict, "mobileviking", 'packs')
+            save_to_ndjson(packs_dict['packs'], "mobileviking", 'packs')
+            scraper_object.content_state.save_pages()
         except Exception as e:
             error_message = f"Error scraping mobileviking: {str(e)}"
             error_details = error_message
             traceback.print_exc()
             raise AirflowException(error_message)
         finally:
-            browser.close()
+            if scraper_object is not None:
+                await scraper_object.close_context()
+                if browser is not None:
+                    scraper_object.request_filter.log_stats(scraper_object.logger)
+            if browser is not None:
+                await browser.close()
+            get_http_cache().log_stats()
             save_scraping_log(error_details, 'mobileviking')
+
+
+def mobileviking_scraper(config: Dict[str, Any]) -> None:
+    """Initializes the scraping process for mobileviking website.
+
+    This function sets up the browser, creates an instance of the Scraper object
+    and orchestrates the scraping of product and pack data, saving them to JSON files.
+    The product pages are scraped concurrently, up to the `max_concurrency` setting of the config.
+    It ensures the browser is closed after the operation and logs are saved.
+
+    Args:
+        config: Configuration settings for the scraper.
+    """
+    asyncio.run(scrape_mobileviking(config))
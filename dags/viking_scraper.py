@@ -1,15 +1,19 @@
-from utils import save_to_json, check_request, save_scraping_log
+from utils import save_to_ndjson, check_request, check_response, save_scraping_log
 from data_model import Products
 from playwright.sync_api import sync_playwright
 from bs4 import BeautifulSoup
-import requests
 import re
 import time
 import logging
 import traceback
 from airflow import AirflowException
 from pydantic import ValidationError
+from readiness import wait_until_ready
 from utils import *
+from request_filter import DEFAULT_REQUEST_FILTER, RequestFilter
+from browser_server import get_browser
+from http_cache import get_http_cache
+from storage_state import StorageState, has_stored_consent, mark_consent_accepted
 
 
 URL = {
@@ -19,26 +23,47 @@ URL = {
     'combo': 'https://mobilevikings.be/en/offer/combo/'
 }
 
+# Conditions each extractor needs before reading the page content
+READINESS = {
+    'mobile_prepaid': {'selectors': ['.PrepaidSelectorProduct', '.slider']},
+    'mobile_subscription': {'selectors': ['.PostpaidOption .monthlyPrice__price']},
+    'internet_subscription': {'selectors': ['.wideScreenFilters__budgetItem__label', 'tr.matrix__price td']},
+}
+
+# Allow and deny lists by resource type and domain of the requests of the pages, see request_filter.py
+REQUEST_FILTER = DEFAULT_REQUEST_FILTER
+
+# Probe each url with a HEAD request before navigating, the navigation response is always checked
+PROBE_URLS = False
 
-def goto_page(browser, url):
 
-    check_request(url)
+def goto_page(browser, url, readiness=None):
+
+    if PROBE_URLS:
+        check_request(url)
 
     page = browser.new_page()
     logging.info(f"Navigating to URL: {url}")
-    page.goto(url, wait_until='domcontentloaded')
+    start_time_seconds = time.time()
+    response = page.goto(url, wait_until='domcontentloaded')
+    check_response(response, url, time.time() - start_time_seconds)
 
     try:
-        page.wait_for_selector('#btn-accept-cookies')
-        page.query_selector('#btn-accept-cookies').click(force=True)
-
-        return page
+        # The cookie consent saved by a previous run is loaded in the context, so the banner is not shown
+        if not has_stored_consent(page.context):
+            page.wait_for_selector('#btn-accept-cookies')
+            page.query_selector('#btn-accept-cookies').click(force=True)
+            mark_consent_accepted(page.context)
 
     except Exception as e:
         error_message = f"Accept cookie button error: {str(e)}"
         logging.error(error_message)
         raise AirflowException(error_message)
 
+    wait_until_ready(page, readiness)
+
+    return page
+
 
 def extract_prepaid_selector_data(page_content, url):
     prepaid_data = []
@@ -220,8 +245,7 @@ def extract_internet_data(page, url):
 
 def get_mobile_prepaid_data(browser, url):
 
-    page = goto_page(browser, url)
-    time.sleep(5)
+    page = goto_page(browser, url, READINESS['mobile_prepaid'])
     logging.info(f"Extracting mobile prepaid data from: {url}")
     mobile_prepaid_data = extract_prepaid_data(page, url)
     page.close()
@@ -231,8 +255,7 @@ def get_mobile_prepaid_data(browser, url):
 
 def get_mobile_subscription_data(browser, url):
 
-    page = goto_page(browser, url)
-    time.sleep(5)
+    page = goto_page(browser, url, READINESS['mobile_subscription'])
     logging.info(f"Extracting mobile subscription from: {url}")
     page_content = page.content()
     mobile_subscription_data = extract_subscription_data(page_content, url)
@@ -243,8 +266,7 @@ def get_mobile_subscription_data(browser, url):
 
 def get_internet_subscription_data(browser, url):
 
-    page = goto_page(browser, url)
-    time.sleep(5)
+    page = goto_page(browser, url, READINESS['internet_subscription'])
     logging.info(f"Extracting internet subscription data from: {url}")
     internet_subscription_data = extract_internet_data(page, url)
     page.close()
@@ -279,13 +301,18 @@ def get_products(browser, url):
         raise AirflowException(error_message)
 
 
+def parse_combo_advantage(page_content):
+    soup = BeautifulSoup(page_content, "html.parser")
+    combo_text = soup.select_one('.monthlyPrice__discountMessage').get_text()
+    match = re.search(r'\d+', combo_text)
+
+    return int(match.group())
+
+
 def extract_combo_advantage(url):
     try:
-        page_content = requests.get(url).text
-        soup = BeautifulSoup(page_content, "html.parser")
-        combo_text = soup.select_one('.monthlyPrice__discountMessage').get_text()
-        match = re.search(r'\d+', combo_text)
-        combo_advantage = int(match.group())
+        # The combo advantage of the previous run is reused while the page is not modified
+        combo_advantage = get_http_cache().extract(url, 'combo_advantage', parse_combo_advantage)
 
         return combo_advantage
 
@@ -355,16 +382,20 @@ def mobileviking_scraper():
         logging.basicConfig(filename=log_file_path, level=logging.INFO, format=log_format)
         logging.info(f"=========== mobileviking_scraper start: {start_time} ===========")
 
-        browser = pw.chromium.launch(headless=True, slow_mo=50)
+        browser = get_browser(pw, 'mobileviking', slow_mo=50)
+        request_filter = RequestFilter(REQUEST_FILTER)
+        storage_state = StorageState('mobileviking')
+        # Pages are opened in a context filtering the requests not needed by the extractors
+        context = request_filter.apply(storage_state.new_context(browser))
 
         try:
             # TODO: add typing
-            product_dict = get_products(browser, URL)
-            save_to_json(product_dict, "mobileviking", 'products')
+            product_dict = get_products(context, URL)
+            save_to_ndjson(product_dict['products'], "mobileviking", 'products')
 
             combo_advantage = extract_combo_advantage(URL['combo'])
             packs_dict = generate_packs(product_dict['products'], combo_advantage, URL['combo'])
-            save_to_json(packs_dict, "mobileviking", 'packs')
+            save_to_ndjson(packs_dict['packs'], "mobileviking", 'packs')
 
         except Exception as e:
             error_message = f"Error in mobileviking_scraper function: {str(e)}"
@@ -374,7 +405,10 @@ def mobileviking_scraper():
             # stack_trace = traceback.format_exc()
             raise AirflowException(error_message)
         finally:
+            request_filter.log_stats()
+            storage_state.save(context)
             browser.close()
+            get_http_cache().log_stats()
 
             end_time_seconds = time.time()
             execution_time_message = "mobileviking_scraper execution time: {:.3f}s".format(end_time_seconds - start_time_seconds)
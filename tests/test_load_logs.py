@@ -0,0 +1,51 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dags'))
+
+import bigquery
+from local_warehouse import LocalClient
+from table_schemas import BQ_TABLE_SCHEMAS
+
+
+PROJECT_ID = 'local'
+DATASET_ID = 'competitors_dataset'
+COMPETITOR = 'comp'
+
+
+class LoadLogsTest(unittest.TestCase):
+    """Loads of `bigquery.load_logs_to_bq` into a local SQLite warehouse, run from a temporary directory."""
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(temp_dir.name)
+        os.makedirs('data/cleaned_data')
+        self.client = LocalClient('warehouse.db')
+        bigquery.create_dataset_if_not_exist(self.client, PROJECT_ID, DATASET_ID)
+        bigquery.create_table_if_not_exist(self.client, PROJECT_ID, DATASET_ID, ['logs'], BQ_TABLE_SCHEMAS)
+
+    def load(self, *logs):
+        with open(f'data/cleaned_data/{COMPETITOR}_logs.ndjson', 'w') as file:
+            file.writelines(json.dumps(log) + '\n' for log in logs)
+        bigquery.load_logs_to_bq(self.client, PROJECT_ID, DATASET_ID, COMPETITOR)
+
+    def test_rerun_of_the_same_day_is_loaded_once(self):
+        failed = {'competitor_name': COMPETITOR, 'scraped_at': '2023-10-01', 'error_details': 'timeout', 'status': 'failed'}
+        success = {**failed, 'error_details': 'no error', 'status': 'success'}
+
+        self.load(failed)
+        self.load(failed)
+        self.load(success)
+        self.load(success)
+
+        rows = self.client.query(f'SELECT * FROM `{DATASET_ID}.logs`').result()
+        self.assertEqual(sorted(row['status'] for row in rows), ['failed', 'success'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dags'))
+
+import bigquery
+from load_state import LoadState
+from local_warehouse import LocalClient
+from table_schemas import BQ_TABLE_SCHEMAS
+
+
+PROJECT_ID = 'local'
+DATASET_ID = 'competitors_dataset'
+COMPETITOR = 'comp'
+
+
+def make_product(day, price=10.0, data=5.0, name='mobile_5_gb'):
+    return {
+        'product_name': name,
+        'competitor_name': COMPETITOR,
+        'product_category': 'mobile_subscription',
+        'product_url': f'https://example.com/{name}',
+        'price': price,
+        'scraped_at': f'2023-10-{day:02d} 08:00:00',
+        'data': data,
+        'minutes': -1.0,
+        'sms': -1.0,
+        'upload_speed': None,
+        'download_speed': None,
+    }
+
+
+class LoadProductsTest(unittest.TestCase):
+    """Loads of `bigquery.load_products_to_bq` into a local SQLite warehouse, run from a temporary directory."""
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(temp_dir.name)
+        os.makedirs('data/cleaned_data')
+        self.client = LocalClient('warehouse.db')
+        bigquery.create_dataset_if_not_exist(self.client, PROJECT_ID, DATASET_ID)
+        bigquery.create_table_if_not_exist(self.client, PROJECT_ID, DATASET_ID, list(BQ_TABLE_SCHEMAS), BQ_TABLE_SCHEMAS)
+
+    def load(self, *products):
+        with open(f'data/cleaned_data/{COMPETITOR}_products.ndjson', 'w') as file:
+            file.writelines(json.dumps(product) + '\n' for product in products)
+        bigquery.load_products_to_bq(self.client, PROJECT_ID, DATASET_ID, COMPETITOR)
+
+    def rows(self, table_id):
+        return self.client.query(f'SELECT * FROM `{DATASET_ID}.{table_id}`').result()
+
+    def count_rows(self):
+        return {table_id: len(self.rows(table_id)) for table_id in ('products', 'features', 'product_prices')}
+
+    def test_reverted_values_are_new_rows(self):
+        self.load(make_product(1, price=10.0, data=5.0))
+        self.load(make_product(2, price=12.0, data=6.0))
+        self.load(make_product(3, price=10.0, data=5.0))
+
+        self.assertEqual(self.count_rows(), {'products': 1, 'features': 3, 'product_prices': 3})
+        self.assertEqual(len({row['feature_uuid'] for row in self.rows('features')}), 3)
+        self.assertEqual(len({row['price_uuid'] for row in self.rows('product_prices')}), 3)
+
+    def test_same_day_changes_are_new_rows(self):
+        self.load(make_product(1, price=10.0, data=5.0))
+        self.load(make_product(1, price=10.0, data=5.0, name='mobile_10_gb'), make_product(1, price=10.0, data=5.0))
+        self.load(make_product(1, price=12.0, data=6.0))
+        self.load(make_product(1, price=12.0, data=6.0), make_product(1, price=11.0, data=5.0, name='mobile_10_gb'))
+
+        self.assertEqual(self.count_rows(), {'products': 2, 'features': 3, 'product_prices': 4})
+        self.assertEqual(len({row['feature_uuid'] for row in self.rows('features')}), 3)
+        self.assertEqual(len({row['price_uuid'] for row in self.rows('product_prices')}), 4)
+
+    def test_failed_load_job_is_retried_without_duplicates(self):
+        load_rows = bigquery.load_rows
+
+        def fail_prices(client, project_id, dataset_id, table_id, rows):
+            if table_id == 'product_prices':
+                raise RuntimeError('load job failed')
+            return load_rows(client, project_id, dataset_id, table_id, rows)
+
+        # The first load checks the warehouse, the retried ones diff against the load state only
+        self.load(make_product(1))
+        with mock.patch('bigquery.load_rows', side_effect=fail_prices):
+            with self.assertRaises(RuntimeError):
+                self.load(make_product(2, price=12.0), make_product(2, name='mobile_10_gb'))
+        self.assertEqual(self.count_rows(), {'products': 2, 'features': 2, 'product_prices': 1})
+
+        self.load(make_product(2, price=12.0), make_product(2, name='mobile_10_gb'))
+        self.assertEqual(self.count_rows(), {'products': 2, 'features': 2, 'product_prices': 3})
+        products = {row['feature_uuid'] for row in self.rows('products')}
+        self.assertEqual({row['feature_uuid'] for row in self.rows('product_prices')}, products)
+
+        self.load(make_product(3, price=12.0), make_product(3, name='mobile_10_gb'))
+        self.assertEqual(self.count_rows(), {'products': 2, 'features': 2, 'product_prices': 3})
+
+    def test_full_check_rebuilds_drifted_state(self):
+        self.load(make_product(1), make_product(1, name='mobile_10_gb'))
+        load_state = LoadState()
+        self.assertFalse(load_state.needs_full_check(COMPETITOR, 'products'))
+        expected_index = load_state.get_product_index(COMPETITOR)
+        self.assertEqual(expected_index, bigquery.get_product_index(self.client, DATASET_ID, load_state.get_competitor_uuid(COMPETITOR)))
+
+        # The state forgot a product and has a stale price, and its last full check is too old
+        load_state.update_products(COMPETITOR, load_state.get_competitor_uuid(COMPETITOR), {'mobile_5_gb': {**expected_index['mobile_5_gb'], 'price': 99.0}}, full_check=True)
+        with load_state._transaction() as connection:
+            connection.execute("DELETE FROM checks")
+
+        with self.assertLogs(level='WARNING') as logs:
+            self.load(make_product(2), make_product(2, name='mobile_10_gb'))
+
+        self.assertIn('drifted from the warehouse on 2 rows', logs.output[0])
+        self.assertEqual(self.count_rows(), {'products': 2, 'features': 2, 'product_prices': 2})
+        self.assertEqual(load_state.get_product_index(COMPETITOR), expected_index)
+        self.assertFalse(load_state.needs_full_check(COMPETITOR, 'products'))
+
+    def test_merge_invalidates_load_state(self):
+        self.load(make_product(1))
+        load_state = LoadState()
+        self.assertFalse(load_state.needs_full_check(COMPETITOR, 'products'))
+
+        with open(f'data/cleaned_data/{COMPETITOR}_packs.ndjson', 'w') as file:
+            file.write('')
+        # The local warehouse does not run the MERGE script, the statement only has to succeed
+        with mock.patch.object(self.client, 'query') as query:
+            bigquery.merge_products_to_bq(self.client, PROJECT_ID, DATASET_ID, COMPETITOR)
+        self.assertIn('MERGE', query.call_args.args[0])
+
+        self.assertTrue(load_state.needs_full_check(COMPETITOR, 'products'))
+        self.assertTrue(load_state.needs_full_check(COMPETITOR, 'packs'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dags'))
+
+from bigquery import LoadScheduler
+
+
+class LoadSchedulerTest(unittest.TestCase):
+
+    def test_runs_dependencies_first(self):
+        order = []
+        lock = threading.Lock()
+
+        def task(name):
+            with lock:
+                order.append(name)
+            return name
+
+        scheduler = LoadScheduler(max_workers=4)
+        scheduler.add('prices', task, 'prices', depends_on=['products'])
+        scheduler.add('products', task, 'products', depends_on=['competitors'])
+        scheduler.add('competitors', task, 'competitors')
+        scheduler.add('packs', task, 'packs')
+        results = scheduler.run()
+
+        self.assertLess(order.index('competitors'), order.index('products'))
+        self.assertLess(order.index('products'), order.index('prices'))
+        self.assertEqual({name: result['status'] for name, result in results.items()}, dict.fromkeys(order, 'success'))
+
+    def test_skips_tasks_depending_on_failed_task(self):
+        ran = []
+
+        def fail():
+            raise RuntimeError('load job failed')
+
+        scheduler = LoadScheduler(max_workers=2)
+        scheduler.add('products', fail)
+        scheduler.add('prices', ran.append, 'prices', depends_on=['products'])
+        scheduler.add('features', ran.append, 'features', depends_on=['prices'])
+        scheduler.add('packs', ran.append, 'packs')
+
+        with self.assertRaises(Exception) as context:
+            scheduler.run()
+
+        self.assertIsInstance(context.exception.__cause__, RuntimeError)
+        self.assertEqual(ran, ['packs'])
+        self.assertEqual(
+            {name: result['status'] for name, result in scheduler.results.items()},
+            {'products': 'failed', 'prices': 'skipped', 'features': 'skipped', 'packs': 'success'},
+        )
+
+    def test_rejects_cycles_and_unknown_dependencies(self):
+        scheduler = LoadScheduler()
+        scheduler.add('a', lambda: None, depends_on=['b'])
+        scheduler.add('b', lambda: None, depends_on=['a'])
+        with self.assertRaisesRegex(ValueError, 'cyclic'):
+            scheduler.run()
+
+        scheduler = LoadScheduler()
+        scheduler.add('a', lambda: None, depends_on=['missing'])
+        with self.assertRaisesRegex(ValueError, 'unknown'):
+            scheduler.run()
+
+        with self.assertRaisesRegex(ValueError, 'already added'):
+            scheduler.add('a', lambda: None)
+
+
+if __name__ == '__main__':
+    unittest.main()
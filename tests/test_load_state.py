@@ -0,0 +1,101 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dags'))
+
+from load_state import LoadState, fingerprint_log
+
+
+PRODUCT = {'product_uuid': 'p1', 'feature_uuid': 'f1', 'feature_hash': 'h1', 'price': 10.0}
+
+
+class LoadStateTest(unittest.TestCase):
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.path = os.path.join(temp_dir.name, 'load_state.db')
+        self.load_state = LoadState(self.path)
+
+    def test_needs_full_check_until_checked(self):
+        self.assertTrue(self.load_state.needs_full_check('comp', 'products'))
+        self.load_state.update_products('comp', 'c1', {'x': PRODUCT})
+        self.assertTrue(self.load_state.needs_full_check('comp', 'products'))
+
+        self.load_state.update_products('comp', 'c1', {'x': PRODUCT}, full_check=True)
+        self.assertFalse(self.load_state.needs_full_check('comp', 'products'))
+        self.assertTrue(self.load_state.needs_full_check('comp', 'packs'))
+        self.assertTrue(self.load_state.needs_full_check('other', 'products'))
+
+    def test_needs_full_check_after_interval(self):
+        self.load_state.update_products('comp', 'c1', {'x': PRODUCT}, full_check=True)
+        self.assertTrue(LoadState(self.path, full_check_interval=-1).needs_full_check('comp', 'products'))
+
+    def test_invalidate(self):
+        self.load_state.update_products('comp', 'c1', {'x': PRODUCT}, full_check=True)
+        self.load_state.update_packs('comp', ['a'], full_check=True)
+        self.load_state.update_packs('other', ['a'], full_check=True)
+        self.load_state.invalidate('comp', ['products', 'packs'])
+
+        self.assertTrue(self.load_state.needs_full_check('comp', 'products'))
+        self.assertTrue(self.load_state.needs_full_check('comp', 'packs'))
+        self.assertFalse(self.load_state.needs_full_check('other', 'packs'))
+        self.assertEqual(self.load_state.get_product_index('comp'), {'x': PRODUCT})
+
+    def test_update_products(self):
+        self.assertEqual(self.load_state.get_product_index('comp'), {})
+        self.assertIsNone(self.load_state.get_competitor_uuid('comp'))
+
+        self.load_state.update_products('comp', 'c1', {'x': PRODUCT, 'y': {**PRODUCT, 'product_uuid': 'p2'}})
+        self.load_state.update_products('comp', 'c1', {'x': {**PRODUCT, 'price': 12.0, 'feature_hash': None}})
+
+        self.assertEqual(self.load_state.get_competitor_uuid('comp'), 'c1')
+        self.assertEqual(self.load_state.get_product_index('comp'), {
+            'x': {**PRODUCT, 'price': 12.0, 'feature_hash': None},
+            'y': {**PRODUCT, 'product_uuid': 'p2'},
+        })
+
+    def test_full_check_replaces_products(self):
+        self.load_state.update_products('comp', 'c1', {'x': PRODUCT, 'y': PRODUCT})
+        self.load_state.update_products('other', 'c2', {'x': PRODUCT})
+        self.load_state.update_products('comp', 'c1', {'z': PRODUCT}, full_check=True)
+
+        self.assertEqual(self.load_state.get_product_index('comp'), {'z': PRODUCT})
+        self.assertEqual(self.load_state.get_product_index('other'), {'x': PRODUCT})
+
+    def test_update_packs(self):
+        self.load_state.update_packs('comp', ['a', 'b'])
+        self.load_state.update_packs('comp', ['b', 'c'])
+        self.assertEqual(self.load_state.get_pack_names('comp'), {'a', 'b', 'c'})
+        self.assertTrue(self.load_state.needs_full_check('comp', 'packs'))
+
+        self.load_state.update_packs('comp', ['d'], full_check=True)
+        self.assertEqual(self.load_state.get_pack_names('comp'), {'d'})
+        self.assertFalse(self.load_state.needs_full_check('comp', 'packs'))
+
+    def test_update_logs(self):
+        failed = {'competitor_name': 'comp', 'scraped_at': '2023-10-01', 'error_details': 'timeout', 'status': 'failed'}
+        success = {**failed, 'error_details': 'no error', 'status': 'success'}
+        self.assertNotEqual(fingerprint_log(failed), fingerprint_log(success))
+        self.assertEqual(fingerprint_log(failed), fingerprint_log(dict(reversed(list(failed.items())))))
+
+        self.load_state.update_logs('comp', [fingerprint_log(failed)])
+        self.load_state.update_logs('comp', [fingerprint_log(failed), fingerprint_log(success)])
+        self.assertEqual(self.load_state.get_log_fingerprints('comp'), {fingerprint_log(failed), fingerprint_log(success)})
+        self.assertEqual(self.load_state.get_log_fingerprints('other'), set())
+
+    def test_log_drift(self):
+        stored = {'x': PRODUCT, 'y': PRODUCT}
+        with self.assertLogs(level='INFO'):
+            self.assertEqual(self.load_state.log_drift('comp', 'products', {}, stored), 2)
+        with self.assertLogs(level='INFO'):
+            self.assertEqual(self.load_state.log_drift('comp', 'products', stored, dict(stored)), 0)
+        with self.assertLogs(level='WARNING'):
+            warehouse = {'x': {**PRODUCT, 'price': 12.0}, 'z': PRODUCT}
+            self.assertEqual(self.load_state.log_drift('comp', 'products', stored, warehouse), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()